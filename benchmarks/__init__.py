@@ -0,0 +1,10 @@
+"""
+Benchmarks of STouchTool.
+
+Synthetic Touchstone files are generated over a grid of frequency points, port
+counts and data formats, and the stages of ``s_cat`` and ``s_plot`` are timed
+on them. Results are saved as JSON so they can be compared between releases::
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare results.json
+"""
@@ -0,0 +1,327 @@
+"""
+Run the benchmarks of STouchTool.
+
+For every combination of frequency points, ports and data format of the grid,
+synthetic two port files are generated and the stages of ``s_cat`` and
+``s_plot`` are timed on them:
+
+    - ``parse``: native parse of all the two port files
+    - ``combine``: assembly of the n port S matrix
+    - ``write``: writing of the n port Touchstone file
+    - ``s_cat``: the whole ``s_cat`` call
+    - ``render``: plot and PDF output of the parsed n port, without parsing
+    - ``save_<output>``: writing of the plot of the n port in every output
+      format of :data:`OUTPUTS`, with the file size in bytes as
+      ``size_<output>``
+    - ``s_plot``: the whole ``s_plot`` call on the n port file
+
+The best time of the repetitions is kept, in seconds.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from benchmarks.synthetic import DATA_FORMATS, generate_nport, generate_twoports
+from stouchtool import __version__
+from stouchtool.s_cat import assemble_nport, port_pairs, s_cat
+from stouchtool.s_plot import _Plotter, s_plot
+from stouchtool.touchstone import read_touchstone, write_header, write_records
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+QUICK_POINTS = (1000, 10000, 100000)
+QUICK_PORTS = (2, 4, 8)
+FULL_POINTS = (1000, 10000, 100000, 1000000)
+FULL_PORTS = (2, 4, 8, 16, 32)
+
+# Output formats of the plots: extension and rasterized traces
+OUTPUTS = {
+    "pdf": ("pdf", False),
+    "pdf_raster": ("pdf", True),
+    "png": ("png", False),
+    "svg": ("svg", False),
+}
+
+STAGES = (
+    ("parse", "combine", "write", "s_cat", "render")
+    + tuple("save_" + output for output in OUTPUTS)
+    + ("s_plot",)
+)
+SIZES = tuple("size_" + output for output in OUTPUTS)
+
+
+def best_time(function: Callable[[], object], repeat: int) -> float:
+    """Best wall time of a function
+
+    Args:
+        function (Callable[[], object]): function to time
+        repeat (int): number of repetitions
+
+    Returns:
+        float: best time in seconds
+    """
+
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def benchmark_case(
+    NumPoints: int, NumPorts: int, data_format: str, repeat: int, render: bool
+) -> Dict[str, float]:
+    """Time every stage for one point of the grid
+
+    Args:
+        NumPoints (int): number of frequency points
+        NumPorts (int): number of ports
+        data_format (str): RI, MA or DB
+        repeat (int): number of repetitions
+        render (bool): time the plots too
+
+    Returns:
+        Dict[str, float]: best time of every stage
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        inputfiles = generate_twoports(directory, NumPorts, NumPoints, data_format)
+        nportfile = generate_nport(directory, NumPorts, NumPoints, data_format)
+        outputfile = os.path.join(directory, "out.s{}p".format(NumPorts))
+        pairs = port_pairs(NumPorts)
+        twoports = [read_touchstone(inputfile) for inputfile in inputfiles]
+        combined = assemble_nport([data.s for data in twoports], pairs, NumPorts)
+
+        def write():
+            with open(outputfile, "w") as output:
+                write_header(output, NumPorts, "Hz", 50.0)
+                write_records(output, twoports[0].frequency, combined, "Hz")
+
+        result = {
+            "parse": best_time(
+                lambda: [read_touchstone(inputfile) for inputfile in inputfiles],
+                repeat,
+            ),
+            "combine": best_time(
+                lambda: assemble_nport([data.s for data in twoports], pairs, NumPorts),
+                repeat,
+            ),
+            "write": best_time(write, repeat),
+            "s_cat": best_time(lambda: s_cat(inputfiles, outputfile, NumPorts), repeat),
+        }
+        if render:
+            nport = read_touchstone(nportfile)
+
+            def draw():
+                with _Plotter() as plotter:
+                    plotter.draw(nport.frequency, nport.s, "benchmark")
+                    plotter.fig.savefig(
+                        os.path.join(directory, "render.pdf"),
+                        format="pdf",
+                        bbox_inches="tight",
+                    )
+
+            result["render"] = best_time(draw, repeat)
+            for output, (extension, rasterize) in OUTPUTS.items():
+                filename = os.path.join(directory, "{}.{}".format(output, extension))
+                with _Plotter(rasterize=rasterize) as plotter:
+                    plotter.draw(nport.frequency, nport.s, "benchmark")
+                    result["save_" + output] = best_time(
+                        lambda: plotter.fig.savefig(
+                            filename, format=extension, bbox_inches="tight"
+                        ),
+                        repeat,
+                    )
+                result["size_" + output] = os.path.getsize(filename)
+            result["s_plot"] = best_time(
+                lambda: s_plot(nportfile, os.path.join(directory, "out.pdf"), None),
+                repeat,
+            )
+    return result
+
+
+def run_benchmarks(
+    points: Sequence[int],
+    ports: Sequence[int],
+    formats: Sequence[str],
+    repeat: int = 3,
+    render: bool = True,
+) -> dict:
+    """Run the whole grid
+
+    Args:
+        points (Sequence[int]): numbers of frequency points
+        ports (Sequence[int]): numbers of ports
+        formats (Sequence[str]): data formats
+        repeat (int): number of repetitions - optional
+        render (bool): time the plots too - optional
+
+    Returns:
+        dict: environment and results, ready to be saved as JSON
+    """
+
+    results = []
+    for NumPoints in points:
+        for NumPorts in ports:
+            for data_format in formats:
+                print(
+                    "Benchmarking {} points, {} ports, {}...".format(
+                        NumPoints, NumPorts, data_format
+                    ),
+                    file=sys.stderr,
+                )
+                times = benchmark_case(NumPoints, NumPorts, data_format, repeat, render)
+                results.append(
+                    dict(points=NumPoints, ports=NumPorts, format=data_format, **times)
+                )
+    return {
+        "stouchtool": __version__,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """Report of the ratio between the current and the baseline times
+
+    Args:
+        current (dict): current results
+        baseline (dict): baseline results
+
+    Returns:
+        List[str]: one line per common grid point, ratios over 1 are slower
+    """
+
+    def key(result: dict) -> tuple:
+        return (result["points"], result["ports"], result["format"])
+
+    previous = {key(result): result for result in baseline["results"]}
+    lines = [
+        "Compared with STouchTool {} (ratio over 1 is slower):".format(
+            baseline.get("stouchtool")
+        )
+    ]
+    for result in current["results"]:
+        if key(result) not in previous:
+            continue
+        ratios = [
+            "{} {:.2f}".format(stage, result[stage] / previous[key(result)][stage])
+            for stage in STAGES + SIZES
+            if stage in result and previous[key(result)].get(stage)
+        ]
+        lines.append(
+            "{} points, {} ports, {}: {}".format(*key(result), ", ".join(ratios))
+        )
+    return lines
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    """Parse command line parameters
+
+    Args:
+        args (List[str]): command line parameters as list of strings
+
+    Returns:
+        :obj:`argparse.Namespace`: command line parameters namespace
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark STouchTool")
+    parser.add_argument(
+        "--full",
+        dest="full",
+        help="Use the full grid, up to 1M points and 32 ports in all formats",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--points",
+        dest="points",
+        help="Numbers of frequency points",
+        type=int,
+        nargs="+",
+        metavar="POINTS",
+    )
+    parser.add_argument(
+        "--ports",
+        dest="ports",
+        help="Numbers of ports",
+        type=int,
+        nargs="+",
+        metavar="PORTS",
+    )
+    parser.add_argument(
+        "--formats",
+        dest="formats",
+        help="Data formats",
+        choices=DATA_FORMATS,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--repeat",
+        dest="repeat",
+        help="Number of repetitions, the best time is kept",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "--no-render",
+        dest="render",
+        help="Do not time the plots",
+        action="store_false",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        help="JSON file to save the results",
+        type=str,
+        metavar="OUTPUT_FILE",
+    )
+    parser.add_argument(
+        "--compare",
+        dest="compare",
+        help="JSON results of a previous run to compare with",
+        type=str,
+        metavar="BASELINE_FILE",
+    )
+    return parser.parse_args(args)
+
+
+def main(arguments: List[str]):
+    """Run the benchmarks from the command line
+
+    Args:
+        arguments (List[str]): command line parameters as list of strings
+    """
+
+    args = parse_args(arguments)
+    points = args.points or (FULL_POINTS if args.full else QUICK_POINTS)
+    ports = args.ports or (FULL_PORTS if args.full else QUICK_PORTS)
+    formats = args.formats or (DATA_FORMATS if args.full else ("RI",))
+    current = run_benchmarks(points, ports, formats, args.repeat, args.render)
+
+    text = json.dumps(current, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    if args.compare is not None:
+        with open(args.compare, "r") as baseline:
+            print("\n".join(compare(current, json.load(baseline))))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,175 @@
+"""
+Synthetic Touchstone files for the benchmarks.
+
+The S parameters are smooth and passive looking: small reflections and
+transmissions with a linear phase, so plots and conversions behave like on
+real measurements.
+"""
+
+import os
+from typing import List
+
+import numpy as np
+
+from stouchtool.s_cat import port_pairs
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+DATA_FORMATS = ("RI", "MA", "DB")
+
+
+def synthetic_s(NumPorts: int, NumPoints: int, seed: int = 0) -> np.ndarray:
+    """Smooth S parameters
+
+    Args:
+        NumPorts (int): number of ports
+        NumPoints (int): number of frequency points
+        seed (int): seed of the random generator - optional
+
+    Returns:
+        np.ndarray: (NumPoints, NumPorts, NumPorts) complex S parameters
+    """
+
+    rng = np.random.default_rng(seed)
+    magnitude = rng.uniform(0.01, 0.3, (NumPorts, NumPorts))
+    magnitude = (magnitude + magnitude.T) / 2
+    delay = rng.uniform(0.1e-9, 2e-9, (NumPorts, NumPorts))
+    delay = (delay + delay.T) / 2
+    frequency = synthetic_frequency(NumPoints)
+    ripple = 1 + 0.1 * np.sin(frequency / 37e6)[:, None, None]
+    return magnitude * ripple * np.exp(-2j * np.pi * frequency[:, None, None] * delay)
+
+
+def synthetic_frequency(NumPoints: int) -> np.ndarray:
+    """Frequency points of the synthetic files, from 10 MHz to 10 GHz
+
+    Args:
+        NumPoints (int): number of frequency points
+
+    Returns:
+        np.ndarray: frequency in Hz
+    """
+
+    return np.linspace(10e6, 10e9, NumPoints)
+
+
+def _record_format(NumPorts: int) -> str:
+    """printf style format of one record, four pairs per line at most
+
+    Args:
+        NumPorts (int): number of ports
+
+    Returns:
+        str: format of the frequency and the 2 * N * N values
+    """
+
+    value = "%.10g %.10g"
+    if NumPorts <= 2:
+        return " ".join(["%.10g"] + [value] * (NumPorts * NumPorts)) + "\n"
+    lines = []
+    for _ in range(NumPorts):
+        for first in range(0, NumPorts, 4):
+            lines.append(" ".join([value] * min(4, NumPorts - first)))
+    return "%.10g " + "\n ".join(lines) + "\n"
+
+
+def write_synthetic(
+    filename: str, frequency: np.ndarray, s: np.ndarray, data_format: str = "RI"
+):
+    """Write S parameters as a Touchstone v1 file
+
+    Args:
+        filename (str): output file name, with the .sNp extension
+        frequency (np.ndarray): frequency points in Hz
+        s (np.ndarray): (F, N, N) complex S parameters
+        data_format (str): RI, MA or DB - optional
+    """
+
+    NumPorts = s.shape[1]
+    if NumPorts == 2:
+        s = s.transpose(0, 2, 1)
+    s = s.reshape(len(frequency), -1)
+    values = np.empty((len(frequency), 1 + 2 * s.shape[1]))
+    values[:, 0] = frequency
+    if data_format == "RI":
+        values[:, 1::2], values[:, 2::2] = s.real, s.imag
+    else:
+        magnitude = np.abs(s)
+        if data_format == "DB":
+            magnitude = 20 * np.log10(magnitude)
+        values[:, 1::2], values[:, 2::2] = magnitude, np.angle(s, deg=True)
+
+    record = _record_format(NumPorts)
+    with open(filename, "w") as output:
+        output.write("! Synthetic STouchTool benchmark data\n")
+        output.write("# Hz S {} R 50\n".format(data_format))
+        output.writelines(record % tuple(row) for row in values)
+
+
+def generate_twoports(
+    directory: str,
+    NumPorts: int,
+    NumPoints: int,
+    data_format: str = "RI",
+    seed: int = 0,
+) -> List[str]:
+    """Two port files of a synthetic n port, in the order s_cat expects
+
+    Args:
+        directory (str): output directory
+        NumPorts (int): number of ports of the n port
+        NumPoints (int): number of frequency points
+        data_format (str): RI, MA or DB - optional
+        seed (int): seed of the random generator - optional
+
+    Returns:
+        List[str]: two port file names
+    """
+
+    frequency = synthetic_frequency(NumPoints)
+    s = synthetic_s(NumPorts, NumPoints, seed)
+    filenames = []
+    for first, second in port_pairs(NumPorts):
+        filename = os.path.join(
+            directory, "dut_p{}_{}.s2p".format(first + 1, second + 1)
+        )
+        write_synthetic(
+            filename,
+            frequency,
+            s[:, [first, second]][:, :, [first, second]],
+            data_format,
+        )
+        filenames.append(filename)
+    return filenames
+
+
+def generate_nport(
+    directory: str,
+    NumPorts: int,
+    NumPoints: int,
+    data_format: str = "RI",
+    seed: int = 0,
+) -> str:
+    """Synthetic n port file
+
+    Args:
+        directory (str): output directory
+        NumPorts (int): number of ports
+        NumPoints (int): number of frequency points
+        data_format (str): RI, MA or DB - optional
+        seed (int): seed of the random generator - optional
+
+    Returns:
+        str: file name
+    """
+
+    filename = os.path.join(directory, "dut.s{}p".format(NumPorts))
+    write_synthetic(
+        filename,
+        synthetic_frequency(NumPoints),
+        synthetic_s(NumPorts, NumPoints, seed),
+        data_format,
+    )
+    return filename
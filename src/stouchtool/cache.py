@@ -0,0 +1,216 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+On-disk cache of parsed Touchstone files.
+
+Every entry is a directory holding the frequency and S parameters as ``.npy``
+files, so they can be memory mapped, plus a ``meta.json`` file with the options
+of the Touchstone file. Entries are found by path, size and modification time,
+and are only used if the content hash of the file still matches. The least
+recently used entries are removed when the cache grows over its size limit.
+
+The cache is opt-in: it is only used when a cache directory is given, or when
+the ``STOUCHTOOL_CACHE_DIR`` environment variable is set.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+from stouchtool.touchstone import TouchstoneData, read_touchstone
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENV = "STOUCHTOOL_CACHE_DIR"
+DEFAULT_CACHE_SIZE = 1 << 30
+
+_META = "meta.json"
+_HASH_BLOCK = 1 << 20
+
+
+def resolve_cache_dir(cache_dir: str, no_cache: bool) -> Optional[str]:
+    """Cache directory to use from the command line options
+
+    Args:
+        cache_dir (str): cache directory given by the user, if any
+        no_cache (bool): the user disabled the cache
+
+    Returns:
+        Optional[str]: cache directory, None if the cache is not used
+    """
+
+    if no_cache:
+        return None
+    return cache_dir or os.environ.get(CACHE_DIR_ENV) or None
+
+
+def content_hash(filename: str) -> str:
+    """Hash of the content of a file
+
+    Args:
+        filename (str): file name
+
+    Returns:
+        str: hexadecimal digest
+    """
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, "rb") as inputfile:
+        for block in iter(lambda: inputfile.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _entry_dir(filename: str, cache_dir: str) -> str:
+    """Entry directory of a file, from its path, size and modification time
+
+    Args:
+        filename (str): Touchstone file name
+        cache_dir (str): cache directory
+
+    Returns:
+        str: entry directory, it may not exist
+    """
+
+    stat = os.stat(filename)
+    key = "{}\0{}\0{}".format(os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+
+def load_cached(filename: str, cache_dir: str) -> Optional[TouchstoneData]:
+    """Parsed content of a file, if it is in the cache
+
+    Args:
+        filename (str): Touchstone file name
+        cache_dir (str): cache directory
+
+    Returns:
+        Optional[TouchstoneData]: content of the file with memory mapped
+            arrays, None if it is not in the cache
+    """
+
+    entry = _entry_dir(filename, cache_dir)
+    try:
+        with open(os.path.join(entry, _META), "r") as metafile:
+            meta = json.load(metafile)
+        if meta["hash"] != content_hash(filename):
+            _logger.debug("load_cached: {} has changed".format(filename))
+            return None
+        data = TouchstoneData(
+            np.load(os.path.join(entry, "frequency.npy"), mmap_mode="r"),
+            np.load(os.path.join(entry, "s.npy"), mmap_mode="r"),
+            meta["z0"],
+            meta["frequency_unit"],
+            meta["data_format"],
+            meta["name"],
+        )
+        # The modification time of the entry is its last use
+        os.utime(entry)
+    except (OSError, ValueError, KeyError):
+        return None
+    _logger.debug("load_cached: {} found in {}".format(filename, entry))
+    return data
+
+
+def _evict(cache_dir: str, max_size: int):
+    """Remove the least recently used entries until the cache fits its size
+
+    Args:
+        cache_dir (str): cache directory
+        max_size (int): maximum size in bytes
+    """
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        size = sum(item.stat().st_size for item in os.scandir(entry.path))
+        entries.append((entry.stat().st_mtime, size, entry.path))
+    total = sum(size for (_, size, _) in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        _logger.debug("_evict: removing {}".format(path))
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def store_cached(
+    filename: str,
+    cache_dir: str,
+    data: TouchstoneData,
+    max_size: int = DEFAULT_CACHE_SIZE,
+):
+    """Store the parsed content of a file in the cache
+
+    Errors are logged and ignored, the cache is only an optimization.
+
+    Args:
+        filename (str): Touchstone file name
+        cache_dir (str): cache directory
+        data (TouchstoneData): content of the file
+        max_size (int): maximum size of the cache in bytes - optional
+    """
+
+    tmpdir = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        entry = _entry_dir(filename, cache_dir)
+        # Write in a temporary directory first so partial entries are never seen
+        tmpdir = tempfile.mkdtemp(prefix=".", dir=cache_dir)
+        np.save(os.path.join(tmpdir, "frequency.npy"), data.frequency)
+        np.save(os.path.join(tmpdir, "s.npy"), data.s)
+        meta = {
+            "path": os.path.abspath(filename),
+            "hash": content_hash(filename),
+            "z0": data.z0,
+            "frequency_unit": data.frequency_unit,
+            "data_format": data.data_format,
+            "name": data.name,
+        }
+        with open(os.path.join(tmpdir, _META), "w") as metafile:
+            json.dump(meta, metafile)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmpdir, entry)
+        _evict(cache_dir, max_size)
+    except OSError as e:
+        _logger.debug("store_cached: can not cache {}: {}".format(filename, e))
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def read_cached(
+    filename: str, cache_dir: str, max_size: int = DEFAULT_CACHE_SIZE
+) -> TouchstoneData:
+    """Read a Touchstone file through the cache
+
+    Args:
+        filename (str): Touchstone file name
+        cache_dir (str): cache directory
+        max_size (int): maximum size of the cache in bytes - optional
+
+    Raises:
+        TouchstoneFormatError: If the file can not be read by the native reader
+
+    Returns:
+        TouchstoneData: content of the file
+    """
+
+    data = load_cached(filename, cache_dir)
+    if data is None:
+        data = read_touchstone(filename)
+        store_cached(filename, cache_dir, data, max_size)
+    return data
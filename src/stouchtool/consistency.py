@@ -0,0 +1,214 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+Repeatability of the reflections measured in several two port files.
+
+In a concatenation of n ports every reflection Sii is measured by the n - 1
+files of the pairs of port i, and only one of them, or their mean, is kept.
+A :class:`ReflectionCheck` compares all of them with their mean, for all the
+ports and frequency points at once, on the data already loaded. A large
+deviation points to a bad cable, connector or calibration in some of the
+files, and with a threshold the n port is not written.
+
+The files can be checked a block of frequency points at a time, so streamed
+concatenations are checked too.
+
+Example::
+
+    check = ReflectionCheck(threshold=0.05)
+    s_cat(inputfiles, "out.s4p", None, check=check)
+    print("\\n".join(check.report()))
+"""
+
+import logging
+from typing import List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+class PortSpread(NamedTuple):
+    """Deviation of the reflections of a port measured in several files
+
+    Deviations are magnitudes of the complex difference with the mean of all
+    the measured reflections of the port at the same frequency.
+
+    Attributes:
+        port (int): one based port
+        measurements (int): number of files measuring the reflection
+        rms (float): root mean square deviation over all the files and
+            frequency points
+        worst (float): largest deviation
+        frequency (float): frequency of the largest deviation in Hz
+        name (str): file with the largest deviation
+    """
+
+    port: int
+    measurements: int
+    rms: float
+    worst: float
+    frequency: float
+    name: str
+
+
+class ReflectionCheck:
+    """Spread of the reflections of every port among the files measuring it
+
+    Args:
+        threshold (float): largest deviation allowed, None to only measure
+            it - optional
+
+    Raises:
+        ValueError: If the threshold is not positive
+    """
+
+    def __init__(self, threshold: float = None):
+        if threshold is not None and not threshold > 0:
+            raise ValueError("Wrong reflection threshold: {}".format(threshold))
+        self.threshold = threshold
+        self.ports: List[PortSpread] = []
+        self.start([], [], 0)
+
+    def start(
+        self, names: Sequence[str], pairs: Sequence[Tuple[int, int]], NumPort: int
+    ):
+        """Start checking a concatenation, forgetting the previous one
+
+        Args:
+            names (Sequence[str]): names of the inputs in the report
+            pairs (Sequence[Tuple[int, int]]): zero based ports of every input
+            NumPort (int): Number of ports
+        """
+
+        self._names = list(names)
+        # Port of every reflection, all the first ports followed by the
+        # second ones as in assemble_nport
+        self._ports = np.array(
+            [pair[0] for pair in pairs] + [pair[1] for pair in pairs], dtype=int
+        )
+        counts = np.bincount(self._ports, minlength=NumPort)
+        self._mean = np.zeros((NumPort, len(self._ports)))
+        self._mean[self._ports, np.arange(len(self._ports))] = 1.0 / counts[self._ports]
+        self._NumPort = NumPort
+        self._worst = np.zeros(len(self._ports))
+        self._frequency = np.zeros(len(self._ports))
+        self._squares = np.zeros(len(self._ports))
+        self._points = 0
+        self.ports = []
+
+    def update(self, frequency: np.ndarray, twoports: Sequence[np.ndarray]):
+        """Add a block of frequency points of all the inputs
+
+        Args:
+            frequency (np.ndarray): frequency points in Hz, shape (F,)
+            twoports (Sequence[np.ndarray]): (F, 2, 2) S parameters of every
+                input, in the order of the pairs
+        """
+
+        if len(frequency) == 0:
+            return
+        stack = np.stack(twoports)
+        reflections = np.concatenate((stack[:, :, 0, 0], stack[:, :, 1, 1]))
+        deviation = np.abs(reflections - (self._mean @ reflections)[self._ports])
+        index = deviation.argmax(axis=1)
+        worst = deviation[np.arange(len(index)), index]
+        larger = worst > self._worst
+        self._worst[larger] = worst[larger]
+        self._frequency[larger] = frequency[index[larger]]
+        self._squares += np.einsum("ij,ij->i", deviation, deviation)
+        self._points += len(frequency)
+
+    def finish(self) -> List[PortSpread]:
+        """Statistics of the ports measured in more than one input
+
+        Returns:
+            List[PortSpread]: every port measured several times, also kept in
+                :attr:`ports`
+        """
+
+        self.ports = []
+        NumPairs = len(self._names)
+        for port in range(self._NumPort):
+            measured = np.flatnonzero(self._ports == port)
+            if len(measured) < 2 or self._points == 0:
+                continue
+            worst = measured[self._worst[measured].argmax()]
+            self.ports.append(
+                PortSpread(
+                    port + 1,
+                    len(measured),
+                    float(
+                        np.sqrt(
+                            self._squares[measured].sum()
+                            / (len(measured) * self._points)
+                        )
+                    ),
+                    float(self._worst[worst]),
+                    float(self._frequency[worst]),
+                    self._names[worst % NumPairs],
+                )
+            )
+        return self.ports
+
+    def failed(self) -> List[PortSpread]:
+        """Ports whose largest deviation is above the threshold
+
+        Returns:
+            List[PortSpread]: failed ports, none without threshold
+        """
+
+        if self.threshold is None:
+            return []
+        return [entry for entry in self.ports if entry.worst > self.threshold]
+
+    def verify(self):
+        """Finish the check and compare it with the threshold
+
+        Raises:
+            ValueError: If the reflections of a port deviate more than the
+                threshold
+        """
+
+        for entry in self.finish():
+            _logger.info(
+                "Reflection of port {}: worst deviation {:.3g} in {}".format(
+                    entry.port, entry.worst, entry.name
+                )
+            )
+        failed = self.failed()
+        if failed:
+            raise ValueError(
+                "Reflections of port {} deviate more than {:g} between files".format(
+                    ", ".join(str(entry.port) for entry in failed), self.threshold
+                )
+            )
+
+    def report(self) -> List[str]:
+        """Lines describing the spread of every port
+
+        Returns:
+            List[str]: one line for every port measured several times
+        """
+
+        failed = self.failed()
+        return [
+            "Reflection of port {}: {} files, rms deviation {:.3g}, worst {:.3g} "
+            "at {:g} Hz in {}{}".format(
+                entry.port,
+                entry.measurements,
+                entry.rms,
+                entry.worst,
+                entry.frequency,
+                entry.name,
+                ", above {:g}".format(self.threshold) if entry in failed else "",
+            )
+            for entry in self.ports
+        ]
@@ -0,0 +1,457 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+Resident daemon running the commands without their startup cost.
+
+Most of the time of a short ``s_cat`` or ``s_plot`` call is spent importing
+scikit-rf and matplotlib. The daemon listens on a Unix socket and runs the
+commands in a small pool of worker processes that have already imported them.
+
+The clients, ``s_cat_client`` and ``plot_s_param_client``, take the same
+arguments as ``s_cat`` and ``plot_s_param`` and give the same output and exit
+status. They only import the standard library, and run the command in their
+own process when no daemon is listening. Every request is one JSON line with
+the command, its arguments and program name, the working directory and the
+``STOUCHTOOL_*`` environment variables, the answer is one JSON line with the
+status and the output of the command.
+
+This module must not import NumPy, scikit-rf or matplotlib at module level.
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from stouchtool import __version__
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+SOCKET_ENV = "STOUCHTOOL_DAEMON_SOCKET"
+
+# Modules with the main function of every command
+COMMANDS = {"s_cat": "stouchtool.s_cat", "s_plot": "stouchtool.s_plot"}
+
+_ENV_PREFIX = "STOUCHTOOL_"
+
+
+class NoDaemonError(ConnectionError):
+    """No daemon is listening on the socket, the command can run in process"""
+
+
+def default_socket() -> str:
+    """Socket of the daemon of the current user
+
+    Returns:
+        str: the ``STOUCHTOOL_DAEMON_SOCKET`` environment variable if set,
+            otherwise a per user file in the runtime or temporary directory
+    """
+
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    user = os.getuid() if hasattr(os, "getuid") else os.getpid()
+    return os.path.join(directory, "stouchtool-{}.sock".format(user))
+
+
+def run_command(command: str, args: List[str]) -> int:
+    """Run a command in the current process
+
+    Args:
+        command (str): s_cat or s_plot
+        args (List[str]): command line parameters of the command
+
+    Raises:
+        ValueError: If the command is unknown
+
+    Returns:
+        int: exit status of the command
+    """
+
+    if command not in COMMANDS:
+        raise ValueError("Unknown command: {}".format(command))
+    main = importlib.import_module(COMMANDS[command]).main
+    try:
+        main(args)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    return 0
+
+
+def _preload():
+    """Import everything the commands use, once per worker process"""
+
+    import matplotlib
+
+    # Workers only write files
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    import skrf  # noqa: F401
+
+    for module in COMMANDS.values():
+        importlib.import_module(module)
+
+
+def _run_request(request: dict) -> dict:
+    """Run a command of a client in a worker process, capturing its output
+
+    Args:
+        request (dict): ``command``, ``args``, ``prog``, ``cwd`` and ``env``
+
+    Returns:
+        dict: ``status``, ``stdout`` and ``stderr`` of the command
+    """
+
+    for name in [name for name in os.environ if name.startswith(_ENV_PREFIX)]:
+        del os.environ[name]
+    os.environ.update(request["env"])
+    # Logging is set up again by every command, on the captured output
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            os.chdir(request["cwd"])
+            # Usage and errors show the name of the client program
+            sys.argv = [request.get("prog", request["command"])] + request["args"]
+            status = run_command(request["command"], request["args"])
+        except Exception as e:
+            print("Error running {}: {}".format(request["command"], e), file=sys.stderr)
+            status = 1
+    return {"status": status, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answer one JSON request of a client"""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # Connection only checking that the daemon is listening
+            return
+        try:
+            request = json.loads(line)
+            command = request["command"]
+        except (KeyError, TypeError, ValueError) as e:
+            answer = {
+                "status": 1,
+                "stdout": "",
+                "stderr": "Wrong request: {}\n".format(e),
+            }
+        else:
+            if command == "ping":
+                answer = {"status": 0, "stdout": "", "stderr": ""}
+            elif command == "stop":
+                answer = {"status": 0, "stdout": "", "stderr": ""}
+                # shutdown waits for serve_forever, which is not in this thread
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                _logger.debug("Running {} {}".format(command, request.get("args")))
+                answer = self.server.executor.submit(_run_request, request).result()
+        self.wfile.write(json.dumps(answer).encode() + b"\n")
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server running the commands in a pool of workers
+
+    The socket is only accessible to the current user, and it is removed when
+    the server is closed.
+
+    Args:
+        socket_path (str): file name of the socket
+        jobs (int): number of worker processes, None or 0 for one per CPU -
+            optional
+
+    Raises:
+        OSError: If a daemon is already listening on the socket
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, jobs: int = 2):
+        if os.path.exists(socket_path):
+            client = _connect(socket_path)
+            if client is not None:
+                client.close()
+                raise OSError("A daemon is already listening on {}".format(socket_path))
+            # Left by a daemon that was killed
+            os.remove(socket_path)
+        if jobs is None or jobs < 1:
+            jobs = os.cpu_count() or 1
+        self.socket_path = socket_path
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        self.executor = ProcessPoolExecutor(max_workers=jobs, initializer=_preload)
+        # Start the workers now, not on the first request
+        for _ in range(jobs):
+            self.executor.submit(int)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def _connect(socket_path: str) -> socket.socket:
+    """Connect to a daemon
+
+    Args:
+        socket_path (str): file name of the socket
+
+    Returns:
+        socket.socket: connected socket, None if no daemon is listening
+    """
+
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError as e:
+        _logger.debug("No daemon on {}: {}".format(socket_path, e))
+        client.close()
+        return None
+    return client
+
+
+def send_request(socket_path: str, command: str, args: List[str] = ()) -> dict:
+    """Send a request to a daemon and wait for its answer
+
+    Args:
+        socket_path (str): file name of the socket
+        command (str): s_cat, s_plot, ping or stop
+        args (List[str]): command line parameters of the command - optional
+
+    Raises:
+        NoDaemonError: If no daemon is listening
+        ConnectionError: If the daemon did not answer, the command may have
+            run
+
+    Returns:
+        dict: ``status``, ``stdout`` and ``stderr`` of the command
+    """
+
+    client = _connect(socket_path)
+    if client is None:
+        raise NoDaemonError("No daemon is listening on {}".format(socket_path))
+    request = {
+        "command": command,
+        "args": list(args),
+        "prog": os.path.basename(sys.argv[0]),
+        "cwd": os.getcwd(),
+        "env": {
+            name: value
+            for (name, value) in os.environ.items()
+            if name.startswith(_ENV_PREFIX) and name != SOCKET_ENV
+        },
+    }
+    try:
+        with client, client.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            answer = json.loads(stream.readline())
+    except (OSError, ValueError) as e:
+        _logger.debug("No answer from {}: {}".format(socket_path, e))
+        raise ConnectionError(
+            "The daemon on {} did not answer".format(socket_path)
+        ) from e
+    return answer
+
+
+def forward(command: str, args: List[str], socket_path: str = None) -> int:
+    """Run a command in the daemon, or in this process if there is none
+
+    A daemon that does not answer is an error, the command is not run again as
+    it may have written its outputs.
+
+    Args:
+        command (str): s_cat or s_plot
+        args (List[str]): command line parameters of the command
+        socket_path (str): file name of the socket, if none, the default one -
+            optional
+
+    Returns:
+        int: exit status of the command, 1 if the daemon did not answer
+    """
+
+    try:
+        answer = send_request(socket_path or default_socket(), command, args)
+    except NoDaemonError as e:
+        _logger.debug("Running {} in process: {}".format(command, e))
+        return run_command(command, args)
+    except ConnectionError as e:
+        print(e, file=sys.stderr)
+        return 1
+    sys.stdout.write(answer["stdout"])
+    sys.stderr.write(answer["stderr"])
+    return answer["status"]
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    """Parse command line parameters
+
+    Args:
+        args (List[str]): command line parameters as list of strings
+
+    Returns:
+        :obj:`argparse.Namespace`: command line parameters namespace
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Run s_cat and s_plot in a resident daemon"
+    )
+    parser.add_argument(
+        "--version",
+        action="version",
+        version="RFTools {ver}".format(ver=__version__),
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        dest="socket",
+        help="Unix socket of the daemon, default is the {} environment variable "
+        "or a per user socket".format(SOCKET_ENV),
+        type=str,
+        metavar="SOCKET",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        help="Number of worker processes, 0 for one per CPU",
+        type=int,
+        default=2,
+        metavar="JOBS",
+    )
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument(
+        "--stop",
+        dest="stop",
+        help="Stop the running daemon",
+        action="store_true",
+    )
+    action.add_argument(
+        "--status",
+        dest="status",
+        help="Check if a daemon is running, exit status is 1 if not",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action="store_const",
+        const=logging.INFO,
+    )
+    parser.add_argument(
+        "-vv",
+        "--very-verbose",
+        dest="loglevel",
+        help="set loglevel to DEBUG",
+        action="store_const",
+        const=logging.DEBUG,
+    )
+    return parser.parse_args(args)
+
+
+def main(arguments: List[str]):
+    """Start, stop or check the daemon from the command line
+
+    Args:
+        arguments (List[str]): command line parameters as list of strings
+    """
+
+    args = parse_args(arguments)
+    logformat = "[%(asctime)s] %(levelname)s:%(name)s:%(message)s"
+    logging.basicConfig(
+        level=args.loglevel,
+        stream=sys.stdout,
+        format=logformat,
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    socket_path = args.socket or default_socket()
+
+    if args.stop or args.status:
+        try:
+            send_request(socket_path, "stop" if args.stop else "ping")
+        except ConnectionError as e:
+            print(e)
+            sys.exit(1)
+        print(
+            "The daemon on {} {}".format(
+                socket_path, "has been stopped" if args.stop else "is running"
+            )
+        )
+        return
+
+    if not hasattr(socket, "AF_UNIX"):  # pragma: no cover
+        print("The daemon needs Unix sockets")
+        sys.exit(1)
+    try:
+        server = DaemonServer(socket_path, args.jobs)
+    except OSError as e:
+        print(e)
+        sys.exit(1)
+    print("The daemon is listening on {}".format(socket_path))
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def _run_client(command: str):
+    """Exit with the status of a command run by :func:`forward`
+
+    Args:
+        command (str): s_cat or s_plot
+    """
+
+    sys.exit(forward(command, sys.argv[1:]))
+
+
+def run():
+    """Calls :func:`main` passing the CLI arguments extracted from :obj:`sys.argv`
+
+    This function can be used as entry point to create console scripts with setuptools.
+    """
+    main(sys.argv[1:])
+
+
+def run_s_cat():
+    """Entry point of the ``s_cat`` client"""
+    _run_client("s_cat")
+
+
+def run_s_plot():
+    """Entry point of the ``plot_s_param`` client"""
+    _run_client("s_plot")
+
+
+if __name__ == "__main__":
+    run()
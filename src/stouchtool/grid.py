@@ -0,0 +1,337 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+Reconciliation of the frequency points of two port captures.
+
+Captures of different VNA sessions may differ by a few frequency points or by
+their span. A :class:`FrequencyGrid` finds a common grid for all of them and
+resamples the inputs that do not have exactly those points, keeping the
+measured values of the points they have. The grid is either the points present
+in every input (intersection), all the points of the inputs in the band they
+all cover (union), or an explicit linear sweep. Nothing is extrapolated.
+
+Every input is resampled in a single NumPy operation over all its S
+parameters, and the resampled inputs are recorded for the report.
+
+Example::
+
+    grid = FrequencyGrid("union", interpolation="cubic")
+    s_cat(inputfiles, "out.s4p", None, grid=grid)
+    print("\\n".join(grid.report()))
+"""
+
+import logging
+from functools import reduce
+from typing import TYPE_CHECKING, List, NamedTuple, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:  # pragma: no cover
+    # scikit-rf is slow to import, it is only loaded when it is needed
+    import skrf as rf
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+GRID_MODES = ("intersection", "union")
+INTERPOLATIONS = ("linear", "cubic")
+# Interpolated parts of the complex values: real and imaginary, or magnitude
+# and unwrapped phase
+INTERPOLATION_FORMATS = ("ri", "ma")
+
+
+class ResampledInput(NamedTuple):
+    """An input moved to the common grid
+
+    Attributes:
+        name (str): file name or network name
+        points (int): number of frequency points of the input
+        start (float): first frequency of the input in Hz
+        stop (float): last frequency of the input in Hz
+        interpolated (int): points of the grid the input did not have
+    """
+
+    name: str
+    points: int
+    start: float
+    stop: float
+    interpolated: int
+
+
+def interpolate(
+    frequency: np.ndarray,
+    values: np.ndarray,
+    grid: np.ndarray,
+    interpolation: str = "linear",
+    data_format: str = "ri",
+) -> np.ndarray:
+    """Resample complex values along their first axis
+
+    All the values of a frequency point are interpolated at once. Cubic
+    interpolation is a cubic Hermite spline with the slopes of the finite
+    differences of the data. The points of the grid that are in the data keep
+    their values unchanged.
+
+    Args:
+        frequency (np.ndarray): increasing frequency points, shape (F,)
+        values (np.ndarray): complex values, shape (F, ...)
+        grid (np.ndarray): increasing frequency points inside the ones of the
+            data, shape (G,)
+        interpolation (str): linear or cubic - optional
+        data_format (str): ri to interpolate the real and imaginary parts, ma
+            the magnitude and the unwrapped phase - optional
+
+    Raises:
+        ValueError: If the options are unknown, or the grid is outside the
+            frequency points of the data
+
+    Returns:
+        np.ndarray: complex values, shape (G, ...)
+    """
+
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError("Unknown interpolation: {}".format(interpolation))
+    if data_format not in INTERPOLATION_FORMATS:
+        raise ValueError("Unknown interpolation format: {}".format(data_format))
+    if len(grid) and (grid[0] < frequency[0] or grid[-1] > frequency[-1]):
+        raise ValueError(
+            "The grid from {} to {} Hz is outside the data from {} to {} Hz".format(
+                grid[0], grid[-1], frequency[0], frequency[-1]
+            )
+        )
+    position = np.minimum(np.searchsorted(frequency, grid), len(frequency) - 1)
+    measured = frequency[position] == grid
+    if measured.all():
+        return values[position]
+    if len(frequency) < 2:
+        raise ValueError("At least two frequency points are needed to interpolate")
+
+    if data_format == "ma":
+        parts = np.stack((np.abs(values), np.unwrap(np.angle(values), axis=0)), 1)
+    else:
+        parts = np.stack((values.real, values.imag), 1)
+    index = np.clip(
+        np.searchsorted(frequency, grid, side="right") - 1, 0, len(frequency) - 2
+    )
+    step = frequency[index + 1] - frequency[index]
+    # Position inside the interval, broadcast over all the values of a point
+    shape = (len(grid),) + (1,) * (parts.ndim - 1)
+    t = ((grid - frequency[index]) / step).reshape(shape)
+    first, last = parts[index], parts[index + 1]
+    if interpolation == "linear":
+        result = first + t * (last - first)
+    else:
+        edge_order = 2 if len(frequency) > 2 else 1
+        slopes = np.gradient(parts, frequency, axis=0, edge_order=edge_order)
+        step = step.reshape(shape)
+        t2 = t * t
+        t3 = t2 * t
+        result = (
+            (2 * t3 - 3 * t2 + 1) * first
+            + (t3 - 2 * t2 + t) * step * slopes[index]
+            + (3 * t2 - 2 * t3) * last
+            + (t3 - t2) * step * slopes[index + 1]
+        )
+
+    if data_format == "ma":
+        resampled = result[:, 0] * np.exp(1j * result[:, 1])
+    else:
+        resampled = result[:, 0] + 1j * result[:, 1]
+    resampled[measured] = values[position[measured]]
+    return resampled
+
+
+class FrequencyGrid:
+    """Common frequency grid of the inputs of a concatenation
+
+    Args:
+        mode (str): intersection, the points of every input, or union, all
+            the points inside the band of every input - optional
+        start (float): first frequency of an explicit grid in Hz - optional
+        stop (float): last frequency of an explicit grid in Hz - optional
+        points (int): number of points of an explicit grid, which replaces
+            the mode - optional
+        interpolation (str): linear or cubic - optional
+        data_format (str): interpolated parts, ri or ma - optional
+
+    Raises:
+        ValueError: If the options are not valid
+    """
+
+    def __init__(
+        self,
+        mode: str = "intersection",
+        start: float = None,
+        stop: float = None,
+        points: int = None,
+        interpolation: str = "linear",
+        data_format: str = "ri",
+    ):
+        if mode not in GRID_MODES:
+            raise ValueError("Unknown grid: {}".format(mode))
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError("Unknown interpolation: {}".format(interpolation))
+        if data_format not in INTERPOLATION_FORMATS:
+            raise ValueError("Unknown interpolation format: {}".format(data_format))
+        explicit = [start is not None, stop is not None, points is not None]
+        if any(explicit):
+            if not all(explicit):
+                raise ValueError("An explicit grid needs its start, stop and points")
+            if points < 2 or not 0 <= start < stop:
+                raise ValueError(
+                    "Wrong grid: {} points from {} to {} Hz".format(points, start, stop)
+                )
+        self.mode = mode
+        self.start = start
+        self.stop = stop
+        self.points = points
+        self.interpolation = interpolation
+        self.data_format = data_format
+        self.frequency = None
+        self.resampled: List[ResampledInput] = []
+
+    def common(self, frequencies: Sequence[np.ndarray]) -> np.ndarray:
+        """Common grid of some inputs
+
+        Args:
+            frequencies (Sequence[np.ndarray]): frequency points of every input
+                in Hz
+
+        Raises:
+            ValueError: If the inputs have no common band, or no common points,
+                or the explicit grid is outside their common band
+
+        Returns:
+            np.ndarray: frequency points in Hz
+        """
+
+        start = max(frequency[0] for frequency in frequencies)
+        stop = min(frequency[-1] for frequency in frequencies)
+        if start > stop:
+            raise ValueError("The inputs have no common frequency band")
+        if self.points is not None:
+            if self.start < start or self.stop > stop:
+                raise ValueError(
+                    "The grid from {} to {} Hz is outside the common band from {} "
+                    "to {} Hz".format(self.start, self.stop, start, stop)
+                )
+            return np.linspace(self.start, self.stop, self.points)
+        if self.mode == "intersection":
+            grid = reduce(np.intersect1d, frequencies)
+        else:
+            grid = np.unique(np.concatenate(frequencies))
+            grid = grid[(grid >= start) & (grid <= stop)]
+        if len(grid) == 0:
+            raise ValueError("The inputs have no common frequency points")
+        return grid
+
+    def resample(
+        self, names: Sequence[str], networks: Sequence["rf.Network"]
+    ) -> List["rf.Network"]:
+        """Move the networks to their common grid
+
+        The networks already on the grid are returned as they are, the others
+        are recorded in :attr:`resampled`. The networks measured on the same
+        frequency points, usually all the ones of a concatenation, are
+        interpolated together in one call.
+
+        Args:
+            names (Sequence[str]): names of the inputs in the report
+            networks (Sequence[rf.Network]): networks to resample
+
+        Raises:
+            ValueError: If the networks have no common grid
+
+        Returns:
+            List[rf.Network]: networks on the common grid, in the same order
+        """
+
+        import skrf as rf
+
+        grid = self.common([network.f for network in networks])
+        self.frequency = grid
+        result = list(networks)
+        # Positions of the networks of every set of frequency points
+        groups = {}
+        for index, network in enumerate(networks):
+            if not np.array_equal(network.f, grid):
+                key = (len(network.f), network.f.tobytes())
+                groups.setdefault(key, []).append(index)
+        for group in groups.values():
+            source = networks[group[0]].f
+            s = interpolate(
+                source,
+                np.stack([networks[index].s for index in group], axis=1),
+                grid,
+                self.interpolation,
+                self.data_format,
+            )
+            z0 = interpolate(
+                source, np.stack([networks[index].z0 for index in group], axis=1), grid
+            )
+            for position, index in enumerate(group):
+                network = networks[index]
+                frequency = rf.Frequency.from_f(grid, unit="hz")
+                frequency.unit = network.frequency.unit
+                result[index] = rf.Network(
+                    frequency=frequency,
+                    s=s[:, position],
+                    z0=z0[:, position],
+                    name=network.name,
+                )
+
+        for name, network, resampled in zip(names, networks, result):
+            if resampled is network:
+                continue
+            entry = ResampledInput(
+                name,
+                len(network.f),
+                network.f[0],
+                network.f[-1],
+                int(np.count_nonzero(~np.isin(grid, network.f))),
+            )
+            self.resampled.append(entry)
+            _logger.info(
+                "Resampled {}: {} points from {} to {} Hz".format(
+                    name, entry.points, entry.start, entry.stop
+                )
+            )
+        return result
+
+    def report(self) -> List[str]:
+        """Lines describing the grid and the resampled inputs
+
+        Returns:
+            List[str]: one line for the grid and one for every resampled input,
+                empty if nothing has been resampled
+        """
+
+        if not self.resampled:
+            return []
+        lines = [
+            "Common grid: {} points from {:g} to {:g} Hz, {} {} interpolation".format(
+                len(self.frequency),
+                self.frequency[0],
+                self.frequency[-1],
+                self.interpolation,
+                self.data_format.upper(),
+            )
+        ]
+        for entry in self.resampled:
+            lines.append(
+                "Resampled {}: {} points from {:g} to {:g} Hz, {} points "
+                "interpolated".format(
+                    entry.name,
+                    entry.points,
+                    entry.start,
+                    entry.stop,
+                    entry.interpolated,
+                )
+            )
+        return lines
@@ -0,0 +1,169 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+Per stage timing and memory instrumentation.
+
+The commands wrap every stage of their work (parse, combine, write, plot...)
+in :meth:`Profiler.stage`. When profiling is disabled :data:`NULL_PROFILER` is
+used instead, whose stages do nothing.
+
+Example::
+
+    profiler = Profiler(memory=True)
+    s_cat(inputfiles, "out.s3p", None, profiler=profiler)
+    profiler.close()
+    print(profiler.to_dict())
+"""
+
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # Not available on Windows
+    resource = None
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+def max_rss() -> int:
+    """Peak resident memory of the current process
+
+    Returns:
+        int: peak resident memory in bytes, 0 if it is not available
+    """
+
+    if resource is None:  # pragma: no cover
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Profiler:
+    """Wall time, CPU time and memory of named stages
+
+    Stages with the same name are accumulated, e.g. the blocks of a stream.
+    CPU time is the one of the current process, so work done in worker
+    processes only shows in the wall time. The peak resident memory of the
+    process is only a high-water mark since it started, so every stage records
+    it at its end, and how much the stage raised it, which is zero for a stage
+    using less memory than an earlier one. With ``memory``, the peak of the
+    memory allocated by every stage is traced with :mod:`tracemalloc` too,
+    which includes NumPy arrays but slows pure Python code such as matplotlib
+    down a lot.
+
+    Args:
+        memory (bool): trace the peak memory of every stage - optional
+    """
+
+    def __init__(self, memory: bool = False):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._trace = memory and not tracemalloc.is_tracing()
+        if self._trace:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure a stage
+
+        Args:
+            name (str): name of the stage
+        """
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            CurrentMemory = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        ProcessPeak = max_rss()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            record = self.stages.setdefault(
+                name,
+                {
+                    "calls": 0,
+                    "wall": 0.0,
+                    "cpu": 0.0,
+                    "process_max_rss": 0,
+                    "max_rss_increase": 0,
+                },
+            )
+            record["calls"] += 1
+            record["wall"] += wall
+            record["cpu"] += cpu
+            # Process peak so far, and its rise during this call of the stage
+            record["process_max_rss"] = max_rss()
+            record["max_rss_increase"] = max(
+                record["max_rss_increase"], record["process_max_rss"] - ProcessPeak
+            )
+            if tracing:
+                # Memory allocated by the stage over what was already in use
+                PeakMemory = tracemalloc.get_traced_memory()[1] - CurrentMemory
+                record["peak_memory"] = max(record.get("peak_memory", 0), PeakMemory)
+            _logger.debug("Stage {} took {:.6f} s".format(name, wall))
+
+    def close(self):
+        """Stop tracing memory, if this profiler started it"""
+
+        if self._trace:
+            tracemalloc.stop()
+            self._trace = False
+
+    def to_dict(self) -> dict:
+        """Measures of all the stages
+
+        Returns:
+            dict: ``stages`` with one entry per stage in order of first use,
+                with ``name``, ``calls``, ``wall`` and ``cpu`` in seconds,
+                ``process_max_rss``, ``max_rss_increase`` and, if traced,
+                ``peak_memory`` in bytes, and the ``total`` times
+        """
+
+        stages = [dict(name=name, **record) for (name, record) in self.stages.items()]
+        return {
+            "stages": stages,
+            "total": {
+                "wall": sum(stage["wall"] for stage in stages),
+                "cpu": sum(stage["cpu"] for stage in stages),
+            },
+        }
+
+    def write(self, filename: str, **extra):
+        """Save the measures as JSON
+
+        Args:
+            filename (str): output file name
+            extra: more items for the JSON object, e.g. the command
+        """
+
+        with open(filename, "w") as output:
+            json.dump(dict(extra, **self.to_dict()), output, indent=2)
+            output.write("\n")
+
+
+class _NullProfiler:
+    """Profiler that measures nothing, used when profiling is disabled"""
+
+    def stage(self, name: str) -> ContextManager[None]:
+        return nullcontext()
+
+
+NULL_PROFILER = _NullProfiler()
@@ -0,0 +1,172 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+Incremental rendering of plots.
+
+Every output directory holds a ``.stouchtool_renders.json`` manifest with, for
+every plot, a fingerprint of the plot options and STouchTool version and the
+size, modification time and content hash of its input files. A plot is up to
+date, and is not rendered again, when its output file exists and nothing of it
+has changed. Like ``make``, an input whose size and modification time did not
+change is not read again; otherwise its content hash is compared, so a touched
+but unchanged file does not trigger a render either.
+
+Manifests are loaded once, updated in memory and saved at the end of a run.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+from stouchtool import __version__
+from stouchtool.cache import content_hash
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".stouchtool_renders.json"
+
+
+def options_fingerprint(**options) -> str:
+    """Fingerprint of the options of a plot and the STouchTool version
+
+    Args:
+        options: options of the plot, as JSON serializable values
+
+    Returns:
+        str: hexadecimal digest
+    """
+
+    text = json.dumps(dict(options, version=__version__), sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class RenderCache:
+    """Manifests of the rendered plots
+
+    Args:
+        force (bool): consider every plot out of date, they are still recorded
+            - optional
+    """
+
+    def __init__(self, force: bool = False):
+        self.force = force
+        self.skipped = set()
+        self._manifests: Dict[str, dict] = {}
+        self._changed = set()
+
+    def _manifest(self, output: str) -> dict:
+        """Manifest of the directory of an output file, loaded on first use
+
+        Args:
+            output (str): output file name
+
+        Returns:
+            dict: entries of the output files of the directory
+        """
+
+        directory = os.path.dirname(os.path.abspath(output))
+        if directory not in self._manifests:
+            try:
+                with open(os.path.join(directory, MANIFEST_NAME), "r") as manifest:
+                    self._manifests[directory] = json.load(manifest)
+            except (OSError, ValueError) as e:
+                _logger.debug("RenderCache: no manifest in {}: {}".format(directory, e))
+                self._manifests[directory] = {}
+        return self._manifests[directory]
+
+    def ports(
+        self, output: str, inputs: List[str], options: str
+    ) -> Optional[List[int]]:
+        """Number of ports of the inputs of a plot, if it is up to date
+
+        Args:
+            output (str): output file name
+            inputs (List[str]): input file names
+            options (str): fingerprint of the plot options
+
+        Returns:
+            Optional[List[int]]: number of ports of every input, None if the
+                plot must be rendered
+        """
+
+        if self.force or not os.path.exists(output):
+            return None
+        entry = self._manifest(output).get(os.path.basename(output))
+        if (
+            entry is None
+            or entry["options"] != options
+            or [item["path"] for item in entry["inputs"]]
+            != [os.path.abspath(input) for input in inputs]
+        ):
+            return None
+        for item in entry["inputs"]:
+            try:
+                stat = os.stat(item["path"])
+                if (stat.st_size, stat.st_mtime_ns) != (item["size"], item["mtime_ns"]):
+                    if content_hash(item["path"]) != item["hash"]:
+                        return None
+                    # Same content, the new times avoid hashing it next time
+                    item["size"], item["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+                    self._changed.add(os.path.dirname(os.path.abspath(output)))
+            except OSError:
+                return None
+        self.skipped.add(output)
+        return entry["ports"]
+
+    def record(self, output: str, inputs: List[str], options: str, ports: List[int]):
+        """Record a rendered plot
+
+        Args:
+            output (str): output file name
+            inputs (List[str]): input file names
+            options (str): fingerprint of the plot options
+            ports (List[int]): number of ports of every input
+        """
+
+        items = []
+        for input in inputs:
+            stat = os.stat(input)
+            items.append(
+                {
+                    "path": os.path.abspath(input),
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "hash": content_hash(input),
+                }
+            )
+        self._manifest(output)[os.path.basename(output)] = {
+            "options": options,
+            "ports": ports,
+            "inputs": items,
+        }
+        self._changed.add(os.path.dirname(os.path.abspath(output)))
+
+    def save(self):
+        """Save the changed manifests
+
+        Errors are logged and ignored, the plots are only rendered again.
+        """
+
+        for directory in sorted(self._changed):
+            tmpname = None
+            try:
+                # Write a temporary file first so partial manifests are never seen
+                handle, tmpname = tempfile.mkstemp(prefix=".", dir=directory)
+                with os.fdopen(handle, "w") as manifest:
+                    json.dump(self._manifests[directory], manifest)
+                os.replace(tmpname, os.path.join(directory, MANIFEST_NAME))
+            except OSError as e:
+                _logger.debug("RenderCache: can not save {}: {}".format(directory, e))
+                if tmpname is not None and os.path.exists(tmpname):
+                    os.remove(tmpname)
+        self._changed.clear()
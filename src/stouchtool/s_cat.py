@@ -4,15 +4,55 @@
 # https://opensource.org/licenses/MIT
 
 import argparse
+import copy
+import csv
+import json
 import logging
+import math
+import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
-from typing import List
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    Iterator,
+    List,
+    NamedTuple,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-import skrf as rf
-from scipy.special import comb
+import numpy as np
 
 from stouchtool import __version__
+from stouchtool.cache import CACHE_DIR_ENV, resolve_cache_dir
+from stouchtool.consistency import ReflectionCheck
+from stouchtool.grid import (
+    GRID_MODES,
+    INTERPOLATION_FORMATS,
+    INTERPOLATIONS,
+    FrequencyGrid,
+)
+from stouchtool.profiling import NULL_PROFILER, Profiler
+from stouchtool.touchstone import (
+    DATA_FORMATS,
+    DEFAULT_DIGITS,
+    TouchstoneData,
+    band_slice,
+    iter_touchstone,
+    load_network,
+    write_header,
+    write_network,
+    write_records,
+)
+from stouchtool.validation import Validation
+
+if TYPE_CHECKING:  # pragma: no cover
+    # scikit-rf is slow to import, it is only loaded when it is needed
+    import skrf as rf
 
 __author__ = "Jesús Lázaro"
 __copyright__ = "Jesús Lázaro"
@@ -20,66 +60,962 @@ __license__ = "MIT"
 
 _logger = logging.getLogger(__name__)
 
+DIAGONAL_POLICIES = ("first", "mean", "last")
+# File names like dut_p1_12.s2p, with the one based ports of the pair
+DEFAULT_PAIR_PATTERN = r"[pP](?P<first>\d+)_(?P<second>\d+)\.[sS]2[pP]$"
 
-def s_cat(inputfiles: List[str], outputfile: str, NumPort: int) -> str:
-    """Concatenate 2 port s files into an n port s file
+
+class ManifestJob(NamedTuple):
+    """One concatenation of a batch
+
+    Attributes:
+        inputfiles (List[str]): List of files
+        outputfile (str): Name of output file, None to derive it from the inputs
+        numports (int): Number of ports, None to guess it from the inputs
+    """
+
+    inputfiles: List[str]
+    outputfile: str
+    numports: int
+
+
+class BatchResult(NamedTuple):
+    """Outcome of one concatenation of a batch
+
+    Attributes:
+        job (ManifestJob): concatenation
+        outputfile (str): output file name, None if it failed
+        error (str): error message, None if it succeeded
+        grid (FrequencyGrid): common grid of the job with its resampled
+            inputs, None without grid
+        check (ReflectionCheck): spread of the reflections of the job, None
+            without check
+        validation (Validation): passivity and reciprocity of the n port of
+            the job, None without validation
+    """
+
+    job: ManifestJob
+    outputfile: str
+    error: str
+    grid: FrequencyGrid
+    check: ReflectionCheck
+    validation: Validation
+
+
+def _load_input(
+    inputfile: str, cache_dir: str = None, fmin: float = None, fmax: float = None
+) -> "rf.Network":
+    """Load one input file, naming it in any error
+
+    Args:
+        inputfile (str): Touchstone file name
+        cache_dir (str): directory of the parse cache, None to not use it
+        fmin (float): lowest frequency in Hz, None for no lower limit
+        fmax (float): highest frequency in Hz, None for no upper limit
+
+    Raises:
+        ValueError: If the file can not be loaded
+
+    Returns:
+        rf.Network: network in the file
+    """
+
+    try:
+        return load_network(inputfile, cache_dir, fmin, fmax)
+    except Exception as e:
+        raise ValueError("Error reading {}: {}".format(inputfile, e)) from e
+
+
+def load_inputs(
+    inputfiles: List[str],
+    jobs: int = 1,
+    cache_dir: str = None,
+    fmin: float = None,
+    fmax: float = None,
+) -> List["rf.Network"]:
+    """Load the input files, in parallel if requested
 
     Args:
         inputfiles (List[str]): List of files
-        outputfile (str): Name of output file - optional
-        NumPort (int): Number of ports - optional
+        jobs (int): Number of worker processes, None or 0 for one per CPU
+        cache_dir (str): directory of the parse cache, None to not use it
+        fmin (float): lowest frequency to load in Hz, None for no lower
+            limit - optional
+        fmax (float): highest frequency to load in Hz, None for no upper
+            limit - optional
 
     Raises:
-        ValueError: In provided number of ports and files do not match
+        ValueError: If any of the files can not be loaded
 
     Returns:
-        str: final output file name
+        List[rf.Network]: networks in the same order as the files
     """
 
-    NumFiles = len(inputfiles)
-    NumPortFound = False
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(inputfiles))
+    load = partial(_load_input, cache_dir=cache_dir, fmin=fmin, fmax=fmax)
+    if jobs <= 1:
+        return [load(inputfile) for inputfile in inputfiles]
+
+    _logger.debug("Loading {} files with {} jobs".format(len(inputfiles), jobs))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # map keeps the order of the inputs whatever order they finish in
+        return list(executor.map(load, inputfiles))
+
+
+def number_of_files(NumPort: int) -> int:
+    """Number of two port files needed to measure all the ports
+
+    Args:
+        NumPort (int): Number of ports
+
+    Returns:
+        int: number of port pairs, n (n - 1) / 2
+    """
+
+    return NumPort * (NumPort - 1) // 2
+
+
+def number_of_ports(NumFiles: int) -> int:
+    """Number of ports measured by a number of two port files
+
+    Args:
+        NumFiles (int): Number of files
+
+    Returns:
+        int: number of ports, None if no number of ports has that many pairs
+    """
+
+    NumPort = int(round((1 + math.sqrt(1 + 8 * NumFiles)) / 2))
+    if number_of_files(NumPort) != NumFiles:
+        return None
+    return NumPort
+
+
+def port_pairs(NumPort: int) -> List[Tuple[int, int]]:
+    """Port pairs measured by each two port file, in the expected file order
+
+    Args:
+        NumPort (int): Number of ports
+
+    Returns:
+        List[Tuple[int, int]]: zero based (port, port) pairs
+    """
+
+    return [
+        (OutputPort, InputPort)
+        for OutputPort in range(NumPort)
+        for InputPort in range(OutputPort + 1, NumPort)
+    ]
+
+
+def pair_label(pair: Tuple[int, int]) -> str:
+    """Label of a port pair, unambiguous with any number of ports
+
+    Args:
+        pair (Tuple[int, int]): zero based ports
+
+    Returns:
+        str: one based ports separated by an underscore, e.g. p1_12
+    """
+
+    return "p{}_{}".format(pair[0] + 1, pair[1] + 1)
+
+
+def map_port_pairs(
+    names: Sequence[str], pattern: str, NumPort: int = None
+) -> Tuple[List[int], List[Tuple[int, int]]]:
+    """Port pairs of the inputs from their file names
+
+    The pattern is searched in the base name of every input, its ``first``
+    and ``second`` named groups are the one based ports of the pair, in the
+    order of the ports of the file. The inputs can then be given in any
+    order, and every pair must be measured by exactly one of them.
+
+    Args:
+        names (Sequence[str]): file names of the inputs
+        pattern (str): regular expression with ``first`` and ``second``
+            named groups
+        NumPort (int): Number of ports, if none, the highest port of the
+            names - optional
+
+    Raises:
+        ValueError: If the pattern is wrong, a name does not match it or has
+            a wrong pair, or a pair is repeated or missing
+
+    Returns:
+        Tuple[List[int], List[Tuple[int, int]]]: positions of the inputs in
+            the order of :func:`port_pairs`, and their zero based pairs
+    """
+
+    try:
+        regex = re.compile(pattern)
+    except re.error as e:
+        raise ValueError("Wrong pair pattern {}: {}".format(pattern, e)) from e
+    if not {"first", "second"} <= set(regex.groupindex):
+        raise ValueError(
+            "The pair pattern has no first and second groups: {}".format(pattern)
+        )
+    found = {}
+    for index, name in enumerate(names):
+        match = regex.search(os.path.basename(name))
+        if match is None:
+            raise ValueError("{} does not match the pair pattern".format(name))
+        try:
+            pair = (int(match.group("first")) - 1, int(match.group("second")) - 1)
+        except (TypeError, ValueError):
+            raise ValueError("Wrong port pair in {}".format(name))
+        if pair[0] == pair[1] or min(pair) < 0:
+            raise ValueError("Wrong port pair in {}: {}".format(name, pair_label(pair)))
+        if NumPort is not None and max(pair) >= NumPort:
+            raise ValueError(
+                "{} measures {}, there are only {} ports".format(
+                    name, pair_label(pair), NumPort
+                )
+            )
+        key = tuple(sorted(pair))
+        if key in found:
+            raise ValueError(
+                "{} and {} both measure {}".format(
+                    names[found[key][0]], name, pair_label(key)
+                )
+            )
+        found[key] = (index, pair)
     if NumPort is None:
-        for NumPort in range(1, 10):
-            if comb(NumPort, 2) == NumFiles:
-                NumPortFound = True
-                break
+        NumPort = max(max(key) for key in found) + 1 if found else 0
+    if NumPort < 2:
+        raise ValueError("Wrong number of files: {}".format(len(names)))
+    missing = [pair_label(pair) for pair in port_pairs(NumPort) if pair not in found]
+    if missing:
+        raise ValueError("Missing port pairs: {}".format(", ".join(missing)))
+    mapped = [found[pair] for pair in port_pairs(NumPort)]
+    return ([index for (index, _) in mapped], [pair for (_, pair) in mapped])
+
+
+def _port_map(
+    names: Sequence[str], NumPort: int, pattern: str
+) -> Tuple[List[int], List[Tuple[int, int]], int]:
+    """Order, port pairs and number of ports of the inputs
+
+    Args:
+        names (Sequence[str]): names of the inputs
+        NumPort (int): Number of ports, None to guess it
+        pattern (str): pair pattern of the file names, None to take the
+            inputs in the order of :func:`port_pairs`
+
+    Raises:
+        ValueError: If the number of ports and inputs do not match, or the
+            names do not match the pattern
+
+    Returns:
+        Tuple[List[int], List[Tuple[int, int]], int]: positions of the inputs
+            in the order of :func:`port_pairs`, their zero based pairs and the
+            number of ports
+    """
+
+    NumFiles = len(names)
+    if pattern is not None:
+        order, pairs = map_port_pairs(names, pattern, NumPort)
+        NumPort = number_of_ports(NumFiles)
     else:
-        if comb(NumPort, 2) == NumFiles:
-            NumPortFound = True
-
-    if not NumPortFound:
-        _logger.debug("Wrong number of files: {}".format(NumFiles))
-        raise ValueError("Wrong number of files: {}".format(NumFiles))
-
-    PortList = list()
-    RFNetworks = list()
-    for OutputPort in range(1, NumPort + 1):
-        for InputPort in range(OutputPort + 1, NumPort + 1):
-            PortList.append("p" + str(OutputPort) + str(InputPort))
+        if NumPort is None:
+            NumPort = number_of_ports(NumFiles)
+        if NumPort is None or number_of_files(NumPort) != NumFiles:
+            _logger.debug("Wrong number of files: {}".format(NumFiles))
+            raise ValueError("Wrong number of files: {}".format(NumFiles))
+        order, pairs = (list(range(NumFiles)), port_pairs(NumPort))
     _logger.debug(
         "Number of files is {} and number of ports is {}".format(NumFiles, NumPort)
     )
-    for (inputfile, port) in zip(inputfiles, PortList):
-        _logger.debug("File {} is {}".format(inputfile, port))
-        tmpNetwork = rf.Network(inputfile)
-        tmpNetwork.name = port
-        RFNetworks.append(tmpNetwork)
+    for index, pair in zip(order, pairs):
+        _logger.debug("File {} is {}".format(names[index], pair_label(pair)))
+    return (order, pairs, NumPort)
 
-    if outputfile is None:
-        _logger.debug("The output file is not given so a new one will be created")
+
+def _diagonal_weights(
+    pairs: Sequence[Tuple[int, int]], NumPort: int, diagonal: str
+) -> np.ndarray:
+    """Weights selecting the reflection of every port among the measured ones
+
+    Reflections are ordered as all the first ports of the pairs followed by
+    all the second ones, the order of measurement of a pair is its index.
+
+    Args:
+        pairs (Sequence[Tuple[int, int]]): zero based port pairs
+        NumPort (int): Number of ports
+        diagonal (str): policy for repeated reflections: first, mean or last
+
+    Raises:
+        ValueError: If the policy is unknown
+
+    Returns:
+        np.ndarray: (NumPort, 2 * len(pairs)) weight matrix
+    """
+
+    if diagonal not in DIAGONAL_POLICIES:
+        raise ValueError("Unknown diagonal policy: {}".format(diagonal))
+    NumPairs = len(pairs)
+    weights = np.zeros((NumPort, 2 * NumPairs))
+    for port in range(NumPort):
+        measured = [
+            side * NumPairs + index
+            for index, pair in enumerate(pairs)
+            for side in (0, 1)
+            if pair[side] == port
+        ]
+        if not measured:
+            continue
+        if diagonal == "mean":
+            weights[port, measured] = 1.0 / len(measured)
+        else:
+            weights[port, measured[0 if diagonal == "first" else -1]] = 1.0
+    return weights
+
+
+def assemble_nport(
+    twoports: Sequence[np.ndarray],
+    pairs: Sequence[Tuple[int, int]],
+    NumPort: int,
+    diagonal: str = "last",
+) -> np.ndarray:
+    """Scatter the two port S parameters into a n port S matrix
+
+    Args:
+        twoports (Sequence[np.ndarray]): (F, 2, 2) S parameters of every pair
+        pairs (Sequence[Tuple[int, int]]): zero based ports of every two port
+        NumPort (int): Number of ports
+        diagonal (str): policy for the reflections measured in several files:
+            first, mean or last - optional
+
+    Returns:
+        np.ndarray: (F, NumPort, NumPort) S parameters
+    """
+
+    stack = np.stack(twoports)
+    rows = np.array([pair[0] for pair in pairs], dtype=int)
+    cols = np.array([pair[1] for pair in pairs], dtype=int)
+    combined = np.zeros(
+        (stack.shape[1], NumPort, NumPort), dtype=np.result_type(stack, complex)
+    )
+    combined[:, rows, cols] = stack[:, :, 0, 1].T
+    combined[:, cols, rows] = stack[:, :, 1, 0].T
+
+    reflections = np.concatenate((stack[:, :, 0, 0], stack[:, :, 1, 1]))
+    diagonal_index = np.arange(NumPort)
+    combined[:, diagonal_index, diagonal_index] = (
+        _diagonal_weights(pairs, NumPort, diagonal) @ reflections
+    ).T
+    return combined
+
+
+def _check_inputs(
+    inputfiles: List[str],
+    frequencies: Sequence[np.ndarray],
+    twoports: Sequence[np.ndarray],
+):
+    """Check the loaded files can be combined
+
+    Args:
+        inputfiles (List[str]): List of files
+        frequencies (Sequence[np.ndarray]): frequency points of every file
+        twoports (Sequence[np.ndarray]): S parameters of every file
+
+    Raises:
+        ValueError: If a file is not a two port or its frequencies do not match
+    """
+
+    for inputfile, frequency, twoport in zip(inputfiles, frequencies, twoports):
+        if twoport.shape[1:] != (2, 2):
+            raise ValueError("{} is not a two port file".format(inputfile))
+        if not np.array_equal(frequency, frequencies[0]):
+            raise ValueError(
+                "Frequency points of {} do not match, a common grid can be "
+                "used to resample them".format(inputfile)
+            )
+
+
+def _next_block(reader: Iterator[TouchstoneData], inputfile: str) -> TouchstoneData:
+    """Next block of a streamed input file, naming it in any error
+
+    Args:
+        reader (Iterator[TouchstoneData]): blocks of the file
+        inputfile (str): Touchstone file name
+
+    Raises:
+        ValueError: If the file can not be read
+
+    Returns:
+        TouchstoneData: next block, None at the end of the file
+    """
+
+    try:
+        return next(reader, None)
+    except Exception as e:
+        raise ValueError("Error reading {}: {}".format(inputfile, e)) from e
+
+
+def _s_cat_stream(
+    inputfiles: List[str],
+    outputfile: str,
+    pairs: List[Tuple[int, int]],
+    NumPort: int,
+    chunk: int,
+    diagonal: str,
+    profiler: Profiler,
+    data_format: str = "ri",
+    digits: int = DEFAULT_DIGITS,
+    fmin: float = None,
+    fmax: float = None,
+    check: ReflectionCheck = None,
+    validation: Validation = None,
+):
+    """Concatenate the files one block of frequency points at a time
+
+    All the inputs are read in step and every block of the n port is written
+    as soon as it is assembled, so memory is bounded by the block size.
+
+    Args:
+        inputfiles (List[str]): List of files
+        outputfile (str): Name of output file
+        pairs (List[Tuple[int, int]]): zero based ports of every file
+        NumPort (int): Number of ports
+        chunk (int): Number of frequency points per block
+        diagonal (str): Reflection kept when a port is in several files
+        profiler (Profiler): profiler of the parse, combine and write stages
+        data_format (str): RI, MA or DB format of the output - optional
+        digits (int): significant digits of the output values - optional
+        fmin (float): lowest frequency in Hz, None for no lower limit -
+            optional
+        fmax (float): highest frequency in Hz, None for no upper limit -
+            optional
+        check (ReflectionCheck): check of the repeated reflections, the
+            output is removed if it fails - optional
+        validation (Validation): passivity and reciprocity of the n port,
+            checked block by block - optional
+
+    Raises:
+        ValueError: If a file can not be read, the files do not match or the
+            check fails
+    """
+
+    if chunk < 1:
+        raise ValueError("Wrong chunk size: {}".format(chunk))
+    weights = _diagonal_weights(pairs, NumPort, diagonal)
+    readers = [
+        iter_touchstone(inputfile, chunk, fmin, fmax) for inputfile in inputfiles
+    ]
+    header = False
+    if check is not None:
+        check.start(inputfiles, pairs, NumPort)
+    if validation is not None:
+        validation.start()
+    try:
+        with open(outputfile, "w") as output:
+            while True:
+                with profiler.stage("parse"):
+                    blocks = [
+                        _next_block(reader, inputfile)
+                        for (reader, inputfile) in zip(readers, inputfiles)
+                    ]
+                if all(block is None for block in blocks):
+                    break
+                for inputfile, block in zip(inputfiles, blocks):
+                    if block is None:
+                        raise ValueError(
+                            "Frequency points of {} do not match".format(inputfile)
+                        )
+                _check_inputs(
+                    inputfiles,
+                    [block.frequency for block in blocks],
+                    [block.s for block in blocks],
+                )
+                if not header:
+                    z0 = weights @ np.array([block.z0 for block in blocks] * 2)
+                    if not np.all(z0 == z0[0]):
+                        raise ValueError(
+                            "Streaming needs the same impedance in all the files"
+                        )
+                    FrequencyUnit = blocks[0].frequency_unit
+                    write_header(output, NumPort, FrequencyUnit, z0[0], data_format)
+                    header = True
+                if check is not None:
+                    with profiler.stage("check"):
+                        check.update(blocks[0].frequency, [block.s for block in blocks])
+                with profiler.stage("combine"):
+                    combined = assemble_nport(
+                        [block.s for block in blocks], pairs, NumPort, diagonal
+                    )
+                if validation is not None:
+                    with profiler.stage("validate"):
+                        validation.update(blocks[0].frequency, combined)
+                with profiler.stage("write"):
+                    write_records(
+                        output,
+                        blocks[0].frequency,
+                        combined,
+                        FrequencyUnit,
+                        data_format,
+                        digits,
+                    )
+            if check is not None and header:
+                check.verify()
+    except Exception:
+        if os.path.exists(outputfile):
+            os.remove(outputfile)
+        raise
+    if not header:
+        os.remove(outputfile)
+        raise ValueError("No data in {}".format(inputfiles))
+
+
+def _default_output(inputfiles: List[str], NumPort: int) -> str:
+    """Output file name derived from the common part of the input file names
+
+    Args:
+        inputfiles (List[str]): List of files
+        NumPort (int): Number of ports
+
+    Returns:
+        str: output file name
+    """
+
+    if len(inputfiles) < 2:
+        common = os.path.splitext(inputfiles[0])[0]
+    else:
         match = SequenceMatcher(None, inputfiles[0], inputfiles[1]).find_longest_match(
             0, len(inputfiles[0]), 0, len(inputfiles[1])
         )
-        outputfile = (
-            inputfiles[0][match.a : match.a + match.size] + ".s" + str(NumPort) + "p"
-        )
+        common = inputfiles[0][match.a : match.a + match.size]
+    return common + ".s" + str(NumPort) + "p"
+
+
+def _input_name(input: Union[str, "rf.Network"], index: int) -> str:
+    """Name of an input in messages
+
+    Args:
+        input (Union[str, rf.Network]): file name or network
+        index (int): zero based position of the input
+
+    Returns:
+        str: the file name, the network name or its position
+    """
+
+    if isinstance(input, str):
+        return input
+    return input.name or "input {}".format(index + 1)
+
+
+def cat_networks(
+    inputs: Sequence[Union[str, "rf.Network"]],
+    NumPort: int = None,
+    jobs: int = 1,
+    diagonal: str = "last",
+    cache_dir: str = None,
+    profiler: Profiler = None,
+    grid: FrequencyGrid = None,
+    fmin: float = None,
+    fmax: float = None,
+    pattern: str = None,
+    check: ReflectionCheck = None,
+) -> "rf.Network":
+    """Concatenate 2 port networks into an n port network, in memory
+
+    Nothing is written, so the result can be plotted or processed further
+    without writing and parsing a Touchstone file, e.g.
+    ``s_plot(cat_networks(inputfiles), "out.pdf", None)``.
+
+    Args:
+        inputs (Sequence[Union[str, rf.Network]]): two port files, or networks
+            already loaded, in the order of :func:`port_pairs` unless a pair
+            pattern is given
+        NumPort (int): Number of ports, if none, it is guessed from the number
+            of inputs - optional
+        jobs (int): Number of parallel jobs loading the files - optional
+        diagonal (str): Reflection kept when a port is in several inputs:
+            first, mean or last - optional
+        cache_dir (str): Directory of the parse cache, None to not use it -
+            optional
+        profiler (Profiler): Profiler of the parse, resample and combine
+            stages, None to not profile - optional
+        grid (FrequencyGrid): Common grid the inputs are resampled to when
+            their frequency points differ, None to require the same points -
+            optional
+        fmin (float): Lowest frequency in Hz, the points below it are not
+            loaded, None for no lower limit - optional
+        fmax (float): Highest frequency in Hz, the files are not read after
+            it, None for no upper limit - optional
+        pattern (str): regular expression giving the port pair of every input
+            from its name, see :func:`map_port_pairs` - optional
+        check (ReflectionCheck): Check of the reflections measured in several
+            inputs, before they are combined - optional
+
+    Raises:
+        ValueError: In provided number of ports and inputs do not match, if
+            an input can not be loaded or combined, or if the check fails
+
+    Returns:
+        rf.Network: n port network
+    """
+
+    names = [_input_name(input, index) for (index, input) in enumerate(inputs)]
+    order, pairs, NumPort = _port_map(names, NumPort, pattern)
+    inputs = [inputs[index] for index in order]
+    names = [names[index] for index in order]
+    if profiler is None:
+        profiler = NULL_PROFILER
+
+    with profiler.stage("parse"):
+        import skrf as rf
+
+        inputfiles = [input for input in inputs if isinstance(input, str)]
+        loaded = iter(load_inputs(inputfiles, jobs, cache_dir, fmin, fmax))
+        RFNetworks = [
+            (
+                next(loaded)
+                if isinstance(input, str)
+                else input[band_slice(input.f, fmin, fmax)]
+            )
+            for input in inputs
+        ]
+    for name, tmpNetwork in zip(names, RFNetworks):
+        if len(tmpNetwork.f) == 0:
+            raise ValueError(
+                "No frequency points of {} between {} and {} Hz".format(
+                    name, fmin, fmax
+                )
+            )
+    if grid is not None:
+        with profiler.stage("resample"):
+            RFNetworks = grid.resample(names, RFNetworks)
+    _check_inputs(
+        names,
+        [tmpNetwork.f for tmpNetwork in RFNetworks],
+        [tmpNetwork.s for tmpNetwork in RFNetworks],
+    )
+
+    if check is not None:
+        with profiler.stage("check"):
+            check.start(names, pairs, NumPort)
+            check.update(RFNetworks[0].f, [tmpNetwork.s for tmpNetwork in RFNetworks])
+            check.verify()
 
     _logger.debug("Combining: {}".format(RFNetworks))
-    combined = rf.network.n_twoports_2_nport(RFNetworks, nports=NumPort)
-    combined.write_touchstone(outputfile)
+    with profiler.stage("combine"):
+        weights = _diagonal_weights(pairs, NumPort, diagonal)
+        z0 = weights @ np.concatenate(
+            [[tmpNetwork.z0[:, 0] for tmpNetwork in RFNetworks]]
+            + [[tmpNetwork.z0[:, 1] for tmpNetwork in RFNetworks]]
+        )
+        combined = rf.Network(
+            frequency=RFNetworks[0].frequency,
+            s=assemble_nport(
+                [tmpNetwork.s for tmpNetwork in RFNetworks], pairs, NumPort, diagonal
+            ),
+            z0=z0.T,
+        )
+    if len(inputfiles) == len(inputs):
+        combined.name = os.path.basename(
+            os.path.splitext(_default_output(inputfiles, NumPort))[0]
+        )
+    return combined
+
+
+def s_cat(
+    inputfiles: List[str],
+    outputfile: str,
+    NumPort: int,
+    jobs: int = 1,
+    diagonal: str = "last",
+    chunk: int = None,
+    cache_dir: str = None,
+    profiler: Profiler = None,
+    data_format: str = "ri",
+    digits: int = DEFAULT_DIGITS,
+    grid: FrequencyGrid = None,
+    fmin: float = None,
+    fmax: float = None,
+    pattern: str = None,
+    check: ReflectionCheck = None,
+    validation: Validation = None,
+) -> str:
+    """Concatenate 2 port s files into an n port s file
+
+    It is :func:`cat_networks` followed by the writing of the n port.
+
+    Args:
+        inputfiles (List[str]): List of files, networks already loaded can be
+            given too when not streaming and with an output file name
+        outputfile (str): Name of output file - optional
+        NumPort (int): Number of ports - optional
+        jobs (int): Number of parallel jobs loading the files - optional
+        diagonal (str): Reflection kept when a port is in several files:
+            first, mean or last - optional
+        chunk (int): Stream the files in blocks of this number of frequency
+            points instead of loading them, jobs and cache_dir are not
+            used - optional
+        cache_dir (str): Directory of the parse cache, None to not use it -
+            optional
+        profiler (Profiler): Profiler of the parse, combine and write stages,
+            None to not profile - optional
+        data_format (str): RI, MA or DB format of the output file - optional
+        digits (int): Significant digits of the output values, from 1 to 17 -
+            optional
+        grid (FrequencyGrid): Common grid the files are resampled to when
+            their frequency points differ, it can not be streamed - optional
+        fmin (float): Lowest frequency in Hz, the points below it are skipped,
+            None for no lower limit - optional
+        fmax (float): Highest frequency in Hz, the files are not read after
+            it, None for no upper limit - optional
+        pattern (str): regular expression giving the port pair of every file
+            from its name, so the files can be given in any order, see
+            :func:`map_port_pairs` - optional
+        check (ReflectionCheck): Check of the reflections measured in several
+            files, nothing is written if it fails - optional
+        validation (Validation): Passivity and reciprocity of the n port, the
+            violations are only recorded - optional
+
+    Raises:
+        ValueError: In provided number of ports and files do not match, if
+            a file can not be loaded or combined, if the output format is not
+            valid, or if the check fails
+
+    Returns:
+        str: final output file name
+    """
+
+    names = [_input_name(input, index) for (index, input) in enumerate(inputfiles)]
+    order, pairs, NumPort = _port_map(names, NumPort, pattern)
+
+    in_memory = not all(isinstance(input, str) for input in inputfiles)
+    if outputfile is None:
+        if in_memory:
+            raise ValueError("An output file name is needed for networks in memory")
+        _logger.debug("The output file is not given so a new one will be created")
+        outputfile = _default_output([inputfiles[index] for index in order], NumPort)
+
+    if profiler is None:
+        profiler = NULL_PROFILER
+    if chunk is not None:
+        if in_memory:
+            raise ValueError("Only files can be streamed")
+        if grid is not None:
+            raise ValueError(
+                "Resampling needs the whole files, they can not be streamed"
+            )
+        _s_cat_stream(
+            [inputfiles[index] for index in order],
+            outputfile,
+            pairs,
+            NumPort,
+            chunk,
+            diagonal,
+            profiler,
+            data_format,
+            digits,
+            fmin,
+            fmax,
+            check,
+            validation,
+        )
+        return outputfile
+
+    combined = cat_networks(
+        inputfiles,
+        NumPort,
+        jobs,
+        diagonal,
+        cache_dir,
+        profiler,
+        grid,
+        fmin,
+        fmax,
+        pattern,
+        check,
+    )
+    if validation is not None:
+        with profiler.stage("validate"):
+            validation.start()
+            validation.update(combined.f, combined.s)
+    with profiler.stage("write"):
+        write_network(combined, outputfile, data_format, digits)
     return outputfile
 
 
+def read_manifest(manifest: str) -> List[ManifestJob]:
+    """Read the list of concatenations of a batch
+
+    JSON manifests hold a list of objects with ``inputs`` (list of files),
+    ``output`` and ``numports``. CSV manifests have a header with the same
+    columns, and the input files separated by ``;``. Only ``inputs`` is
+    mandatory.
+
+    Args:
+        manifest (str): JSON (.json) or CSV manifest file name
+
+    Raises:
+        ValueError: If the manifest is wrong
+
+    Returns:
+        List[ManifestJob]: concatenations in the order of the manifest
+    """
+
+    with open(manifest, "r", newline="") as manifestfile:
+        if manifest.lower().endswith(".json"):
+            entries = json.load(manifestfile)
+        else:
+            entries = list(csv.DictReader(manifestfile))
+    if not isinstance(entries, list):
+        raise ValueError("Wrong manifest {}: it must be a list".format(manifest))
+
+    batch = list()
+    for index, entry in enumerate(entries):
+        try:
+            inputfiles = entry["inputs"]
+            if isinstance(inputfiles, str):
+                inputfiles = [name.strip() for name in inputfiles.split(";")]
+            inputfiles = [name for name in inputfiles if name]
+            numports = entry.get("numports") or None
+            batch.append(
+                ManifestJob(
+                    inputfiles,
+                    entry.get("output") or None,
+                    int(numports) if numports is not None else None,
+                )
+            )
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError("Wrong manifest {} entry {}".format(manifest, index + 1))
+        if not inputfiles:
+            raise ValueError(
+                "No input files in manifest {} entry {}".format(manifest, index + 1)
+            )
+    return batch
+
+
+def _run_manifest_job(
+    job: ManifestJob,
+    grid: FrequencyGrid = None,
+    check: ReflectionCheck = None,
+    validation: Validation = None,
+    **options
+) -> BatchResult:
+    """Run one concatenation of a batch, catching its errors
+
+    Args:
+        job (ManifestJob): concatenation to run
+        grid (FrequencyGrid): common grid, copied for the job - optional
+        check (ReflectionCheck): reflection check, copied for the job -
+            optional
+        validation (Validation): validation, copied for the job - optional
+        options: keyword arguments for :func:`s_cat`
+
+    Returns:
+        BatchResult: output file name or error, and the grid, check and
+            validation of the job
+    """
+
+    # Every job records its own results, also in worker processes
+    grid = copy.deepcopy(grid)
+    check = copy.deepcopy(check)
+    validation = copy.deepcopy(validation)
+    try:
+        outputfile = s_cat(
+            job.inputfiles,
+            job.outputfile,
+            job.numports,
+            grid=grid,
+            check=check,
+            validation=validation,
+            **options
+        )
+    except Exception as e:
+        _logger.debug("Job {} failed: {}".format(job, e))
+        return BatchResult(job, None, str(e), grid, check, validation)
+    return BatchResult(job, outputfile, None, grid, check, validation)
+
+
+def s_cat_batch(
+    batch: List[ManifestJob],
+    jobs: int = 1,
+    diagonal: str = "last",
+    chunk: int = None,
+    cache_dir: str = None,
+    profiler: Profiler = None,
+    data_format: str = "ri",
+    digits: int = DEFAULT_DIGITS,
+    grid: FrequencyGrid = None,
+    fmin: float = None,
+    fmax: float = None,
+    pattern: str = None,
+    check: ReflectionCheck = None,
+    validation: Validation = None,
+) -> List[BatchResult]:
+    """Run many concatenations in a single process, or a pool of them
+
+    A failed concatenation does not stop the others. The grid, the check and
+    the validation are copied for every concatenation, so the ones given are
+    not modified.
+
+    Args:
+        batch (List[ManifestJob]): concatenations to run
+        jobs (int): Number of worker processes, None or 0 for one per CPU -
+            optional
+        diagonal (str): Reflection kept when a port is in several files:
+            first, mean or last - optional
+        chunk (int): Stream the files in blocks of this number of frequency
+            points - optional
+        cache_dir (str): Directory of the parse cache, None to not use it -
+            optional
+        profiler (Profiler): Profiler accumulating the stages of all the
+            concatenations, only used without worker processes - optional
+        data_format (str): RI, MA or DB format of the output files - optional
+        digits (int): Significant digits of the output values - optional
+        grid (FrequencyGrid): Common grid of the files of every concatenation,
+            its resampled files are in the result of the concatenation -
+            optional
+        fmin (float): Lowest frequency in Hz, None for no lower limit -
+            optional
+        fmax (float): Highest frequency in Hz, None for no upper limit -
+            optional
+        pattern (str): regular expression giving the port pair of every file
+            from its name - optional
+        check (ReflectionCheck): Check of the reflections of every
+            concatenation, its spread is in the result of the concatenation,
+            and a concatenation failing it is not written - optional
+        validation (Validation): Passivity and reciprocity of every n port,
+            in the result of its concatenation - optional
+
+    Returns:
+        List[BatchResult]: for every concatenation, in order, the job, the
+            output file name or the error, and its grid, check and validation
+    """
+
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(batch))
+    run_job = partial(
+        _run_manifest_job,
+        diagonal=diagonal,
+        chunk=chunk,
+        cache_dir=cache_dir,
+        data_format=data_format,
+        digits=digits,
+        grid=grid,
+        fmin=fmin,
+        fmax=fmax,
+        pattern=pattern,
+        check=check,
+        validation=validation,
+    )
+    if jobs <= 1:
+        results = [run_job(job, profiler=profiler) for job in batch]
+    else:
+        _logger.debug("Running {} jobs in {} processes".format(len(batch), jobs))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(run_job, batch))
+    return results
+
+
 def parse_args(args: List[str]) -> argparse.Namespace:
     """Parse command line parameters
 
@@ -100,9 +1036,17 @@ def parse_args(args: List[str]) -> argparse.Namespace:
         dest="inputfiles",
         help="Input file with touchstone params",
         type=str,
-        nargs="+",
+        nargs="*",
         metavar="P12_FILE.s2p P13_FILE.s2p P23_FILE.s2p",
     )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        dest="manifest",
+        help="JSON or CSV list of concatenations to run instead of the input files",
+        type=str,
+        metavar="MANIFEST",
+    )
     parser.add_argument(
         "-p",
         "--numports",
@@ -111,6 +1055,23 @@ def parse_args(args: List[str]) -> argparse.Namespace:
         type=int,
         metavar="NUM_PORTS",
     )
+    parser.add_argument(
+        "--pair-pattern",
+        dest="pair_pattern",
+        help="Take the port pair of every input file from its name, so the files "
+        "can be given in any order, with the pattern {}".format(
+            DEFAULT_PAIR_PATTERN.replace("%", "%%")
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--pair-regex",
+        dest="pair_regex",
+        help="Take the port pair of every input file from its name with this "
+        "regular expression, with first and second named groups",
+        type=str,
+        metavar="PATTERN",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -120,6 +1081,173 @@ def parse_args(args: List[str]) -> argparse.Namespace:
         type=str,
         metavar="OUTPUT_FILE",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        help="Number of parallel jobs loading the input files, or running the "
+        "concatenations of a manifest, 0 for one per CPU",
+        type=int,
+        default=1,
+        metavar="JOBS",
+    )
+    parser.add_argument(
+        "--chunk",
+        dest="chunk",
+        help="Stream the input files in blocks of CHUNK frequency points, "
+        "memory is then bounded by the block size",
+        type=int,
+        metavar="CHUNK",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        help="Cache the parsed input files in CACHE_DIR, default is the "
+        "{} environment variable".format(CACHE_DIR_ENV),
+        type=str,
+        metavar="CACHE_DIR",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        help="Do not use the parse cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Save the time and memory used by every stage as JSON in PROFILE",
+        type=str,
+        metavar="PROFILE",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        dest="profile_memory",
+        help="Trace the peak memory of every stage in the profile, it is slow",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--diagonal",
+        dest="diagonal",
+        help="Reflection kept when a port is in several files, default is last",
+        choices=DIAGONAL_POLICIES,
+        default="last",
+    )
+    parser.add_argument(
+        "--reflection-spread",
+        dest="reflection_spread",
+        help="Report how much the reflection of every port differs between "
+        "the files measuring it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--reflection-threshold",
+        dest="reflection_threshold",
+        help="Do not write the output if the reflection of a port in a file "
+        "differs more than THRESHOLD from their mean, as magnitude of the "
+        "complex difference",
+        type=float,
+        metavar="THRESHOLD",
+    )
+    parser.add_argument(
+        "--validate",
+        dest="validate",
+        help="Report the frequency ranges where the output is not passive or "
+        "not reciprocal",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--passivity-tolerance",
+        dest="passivity_tolerance",
+        help="With --validate, margin of the largest singular value over one, "
+        "default is 1e-6",
+        type=float,
+        default=1e-6,
+        metavar="TOLERANCE",
+    )
+    parser.add_argument(
+        "--reciprocity-tolerance",
+        dest="reciprocity_tolerance",
+        help="With --validate, largest |Sij - Sji| allowed, default is 1e-3",
+        type=float,
+        default=1e-3,
+        metavar="TOLERANCE",
+    )
+    parser.add_argument(
+        "--data-format",
+        dest="data_format",
+        help="Format of the output values: real and imaginary, magnitude and "
+        "angle, or dB and angle, default is ri",
+        choices=DATA_FORMATS,
+        default="ri",
+    )
+    parser.add_argument(
+        "--digits",
+        dest="digits",
+        help="Significant digits of the output values, from 1 to 17, default "
+        "is {}".format(DEFAULT_DIGITS),
+        type=int,
+        default=DEFAULT_DIGITS,
+        metavar="DIGITS",
+    )
+    parser.add_argument(
+        "--fmin",
+        dest="fmin",
+        help="Lowest frequency in Hz, the points below it are skipped",
+        type=float,
+        metavar="FMIN",
+    )
+    parser.add_argument(
+        "--fmax",
+        dest="fmax",
+        help="Highest frequency in Hz, the input files are not read after it",
+        type=float,
+        metavar="FMAX",
+    )
+    parser.add_argument(
+        "--grid",
+        dest="grid",
+        help="Resample the input files with different frequency points to the "
+        "points of every file (intersection) or all the points in the band of "
+        "every file (union)",
+        choices=GRID_MODES,
+    )
+    parser.add_argument(
+        "--fstart",
+        dest="fstart",
+        help="First frequency in Hz of an explicit grid to resample to",
+        type=float,
+        metavar="FSTART",
+    )
+    parser.add_argument(
+        "--fstop",
+        dest="fstop",
+        help="Last frequency in Hz of an explicit grid to resample to",
+        type=float,
+        metavar="FSTOP",
+    )
+    parser.add_argument(
+        "--npoints",
+        dest="npoints",
+        help="Number of points of an explicit grid to resample to",
+        type=int,
+        metavar="NPOINTS",
+    )
+    parser.add_argument(
+        "--interpolation",
+        dest="interpolation",
+        help="Interpolation of the resampled files, default is linear",
+        choices=INTERPOLATIONS,
+        default="linear",
+    )
+    parser.add_argument(
+        "--interpolation-format",
+        dest="interpolation_format",
+        help="Interpolate the real and imaginary parts (ri) or the magnitude "
+        "and phase (ma), default is ri",
+        choices=INTERPOLATION_FORMATS,
+        default="ri",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -136,7 +1264,10 @@ def parse_args(args: List[str]) -> argparse.Namespace:
         action="store_const",
         const=logging.DEBUG,
     )
-    return parser.parse_args(args)
+    parsed = parser.parse_args(args)
+    if (parsed.manifest is None) == (len(parsed.inputfiles) == 0):
+        parser.error("either the input files or a manifest are required")
+    return parsed
 
 
 def setup_logging(loglevel: int):
@@ -152,6 +1283,149 @@ def setup_logging(loglevel: int):
     )
 
 
+def _frequency_grid(args: argparse.Namespace) -> FrequencyGrid:
+    """Common grid of the command line
+
+    Args:
+        args (argparse.Namespace): command line parameters namespace
+
+    Raises:
+        ValueError: If the grid options are not valid
+
+    Returns:
+        FrequencyGrid: common grid, None if no grid is requested
+    """
+
+    if args.grid is None and all(
+        value is None for value in (args.fstart, args.fstop, args.npoints)
+    ):
+        return None
+    return FrequencyGrid(
+        args.grid or "intersection",
+        args.fstart,
+        args.fstop,
+        args.npoints,
+        args.interpolation,
+        args.interpolation_format,
+    )
+
+
+def _reflection_check(args: argparse.Namespace) -> ReflectionCheck:
+    """Check of the reflections of the command line
+
+    Args:
+        args (argparse.Namespace): command line parameters namespace
+
+    Raises:
+        ValueError: If the threshold is not valid
+
+    Returns:
+        ReflectionCheck: check, None if it is not requested
+    """
+
+    if not args.reflection_spread and args.reflection_threshold is None:
+        return None
+    return ReflectionCheck(args.reflection_threshold)
+
+
+def _validation(args: argparse.Namespace) -> Validation:
+    """Validation of the n port of the command line
+
+    Args:
+        args (argparse.Namespace): command line parameters namespace
+
+    Raises:
+        ValueError: If a tolerance is not valid
+
+    Returns:
+        Validation: validation, None if it is not requested
+    """
+
+    if not args.validate:
+        return None
+    return Validation(args.passivity_tolerance, args.reciprocity_tolerance)
+
+
+def _pair_pattern(args: argparse.Namespace) -> str:
+    """Pair pattern of the command line
+
+    Args:
+        args (argparse.Namespace): command line parameters namespace
+
+    Returns:
+        str: regular expression of the port pairs, None to take the input
+            files in order
+    """
+
+    if args.pair_regex is not None:
+        return args.pair_regex
+    return DEFAULT_PAIR_PATTERN if args.pair_pattern else None
+
+
+def _main_manifest(args: argparse.Namespace):
+    """Run the concatenations of a manifest and print a summary
+
+    Args:
+        args (argparse.Namespace): command line parameters namespace
+    """
+
+    try:
+        batch = read_manifest(args.manifest)
+        grid = _frequency_grid(args)
+        check = _reflection_check(args)
+        validation = _validation(args)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    profiler = Profiler(args.profile_memory) if args.profile else None
+    results = s_cat_batch(
+        batch,
+        jobs=args.jobs,
+        diagonal=args.diagonal,
+        chunk=args.chunk,
+        cache_dir=resolve_cache_dir(args.cache_dir, args.no_cache),
+        profiler=profiler,
+        data_format=args.data_format,
+        digits=args.digits,
+        grid=grid,
+        fmin=args.fmin,
+        fmax=args.fmax,
+        pattern=_pair_pattern(args),
+        check=check,
+        validation=validation,
+    )
+    if profiler is not None:
+        profiler.close()
+        profiler.write(args.profile, command="s_cat", manifest=args.manifest)
+    failed = 0
+    for result in results:
+        if result.grid is not None:
+            for line in result.grid.report():
+                print(line)
+        if result.check is not None:
+            for line in result.check.report():
+                print(line)
+        if result.validation is not None and result.error is None:
+            for line in result.validation.report():
+                print(line)
+        if result.error is None:
+            print(
+                "The cat from files {} has been stored in {}".format(
+                    result.job.inputfiles, result.outputfile
+                )
+            )
+        else:
+            failed += 1
+            print(
+                "The cat from files {} failed: {}".format(
+                    result.job.inputfiles, result.error
+                )
+            )
+    print("{} of {} concatenations failed".format(failed, len(results)))
+    if failed:
+        sys.exit(1)
+
+
 def main(arguments: List[str]):
     """Wrapper allowing :func:`plot_s_cat` to be called as CLI
 
@@ -163,11 +1437,53 @@ def main(arguments: List[str]):
     setup_logging(args.loglevel)
     _logger.debug("Starting plotting...")
 
+    if args.manifest is not None:
+        _main_manifest(args)
+        return
+    profiler = Profiler(args.profile_memory) if args.profile else None
+    check = None
     try:
-        outputfilename = s_cat(args.inputfiles, args.output, args.numports)
+        grid = _frequency_grid(args)
+        check = _reflection_check(args)
+        validation = _validation(args)
+        outputfilename = s_cat(
+            args.inputfiles,
+            args.output,
+            args.numports,
+            jobs=args.jobs,
+            diagonal=args.diagonal,
+            chunk=args.chunk,
+            cache_dir=resolve_cache_dir(args.cache_dir, args.no_cache),
+            profiler=profiler,
+            data_format=args.data_format,
+            digits=args.digits,
+            grid=grid,
+            fmin=args.fmin,
+            fmax=args.fmax,
+            pattern=_pair_pattern(args),
+            check=check,
+            validation=validation,
+        )
     except ValueError as e:
+        if check is not None:
+            for line in check.report():
+                print(line)
         print(e)
         sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.close()
+    if profiler is not None:
+        profiler.write(args.profile, command="s_cat", inputfiles=args.inputfiles)
+    if grid is not None:
+        for line in grid.report():
+            print(line)
+    if check is not None:
+        for line in check.report():
+            print(line)
+    if validation is not None:
+        for line in validation.report():
+            print(line)
     print(
         "The cat from files {} has been stored in {}".format(
             args.inputfiles, outputfilename
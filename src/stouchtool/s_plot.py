@@ -7,16 +7,32 @@ References:
 """
 
 import argparse
+import contextlib
+import glob
 import logging
 import os
+import re
 import sys
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Tuple, Union
 
-import matplotlib.pyplot as plt
-import skrf as rf
-from matplotlib import ticker
+import numpy as np
 
 from stouchtool import __version__
+from stouchtool.cache import CACHE_DIR_ENV, resolve_cache_dir
+from stouchtool.profiling import NULL_PROFILER, Profiler
+from stouchtool.render_cache import RenderCache, options_fingerprint
+from stouchtool.touchstone import (
+    TouchstoneFormatError,
+    band_slice,
+    load_network,
+    ports_from_filename,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    # scikit-rf is slow to import, it is only loaded when it is needed
+    import skrf as rf
 
 __author__ = "Jesús Lázaro"
 __copyright__ = "Jesús Lázaro"
@@ -24,6 +40,29 @@ __license__ = "MIT"
 
 _logger = logging.getLogger(__name__)
 
+# What can be plotted: a file name, a network or (frequency, S) arrays
+PlotInput = Union[str, "rf.Network", Tuple[np.ndarray, np.ndarray]]
+
+
+def _pyplot():
+    """matplotlib.pyplot, imported on first use
+
+    matplotlib is slow to import, so it is not loaded for the CLI help or
+    argument errors. Only files are written, so a non-interactive backend is
+    selected unless pyplot is already in use or MPLBACKEND is set.
+
+    Returns:
+        module: matplotlib.pyplot
+    """
+
+    import matplotlib
+
+    if "matplotlib.pyplot" not in sys.modules and "MPLBACKEND" not in os.environ:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
 
 # ---- Python API ----
 # The functions defined in this section can be imported by users in their
@@ -32,64 +71,1181 @@ _logger = logging.getLogger(__name__)
 # when using this Python module as a library.
 
 
-def s_plot(input: str, output: str, title: str) -> Tuple[str, str, int]:
-    """Generate a plot in pdf with the provided touchstone data
+def minmax_decimate(x: np.ndarray, y: np.ndarray, columns: int) -> np.ndarray:
+    """Points of traces that keep their envelope on a given number of columns
+
+    The x range is split in columns of the same width and, for every trace,
+    only the minimum and the maximum of every column are kept, in their
+    original order. Plotted on that many pixel columns, the result looks the
+    same as the whole traces.
+
+    Args:
+        x (np.ndarray): (F,) increasing x values shared by all the traces
+        y (np.ndarray): (F, T) values of the T traces
+        columns (int): number of columns
+
+    Returns:
+        np.ndarray: (2 * C, T) indices of the kept points of every trace,
+            C <= columns being the number of columns with points
+    """
+
+    NumPoints = len(x)
+    span = x[-1] - x[0]
+    if span > 0:
+        column = ((x - x[0]) * (columns / span)).astype(np.intp)
+    else:
+        column = np.arange(NumPoints) * columns // NumPoints
+    np.minimum(column, columns - 1, out=column)
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    counts = np.diff(np.r_[starts, NumPoints])
+    position = np.arange(NumPoints)[:, None]
+
+    def first(extreme: np.ndarray) -> np.ndarray:
+        # First position of the extreme of every column, its start if all NaN
+        where = np.where(y == np.repeat(extreme, counts, axis=0), position, NumPoints)
+        where = np.minimum.reduceat(where, starts, axis=0)
+        return np.where(where == NumPoints, starts[:, None], where)
+
+    lowest = first(np.fmin.reduceat(y, starts, axis=0))
+    highest = first(np.fmax.reduceat(y, starts, axis=0))
+    indices = np.empty((2 * len(starts), y.shape[1]), dtype=np.intp)
+    indices[0::2] = np.minimum(lowest, highest)
+    indices[1::2] = np.maximum(lowest, highest)
+    return indices
+
+
+TRACE_GROUPS = ("all", "reflection", "transmission", "upper")
+LAYOUTS = ("overlay", "grid")
+OUTPUT_FORMATS = ("pdf", "png", "svg")
+
+_TRACE_RE = re.compile(r"^S(?:(\d)(\d)|(\d+)_(\d+))$", re.IGNORECASE)
+
+# Legend inside the axes up to this number of traces, outside above it
+_INNER_LEGEND_TRACES = 16
+# Corners tried for the inner legend, in order of preference
+_LEGEND_CORNERS = (
+    ("upper right", (1, 1)),
+    ("upper left", (0, 1)),
+    ("lower left", (0, 0)),
+    ("lower right", (1, 0)),
+)
+
+
+def select_traces(traces: str, NumPorts: int) -> np.ndarray:
+    """S parameters selected to be plotted
+
+    Args:
+        traces (str): comma separated S parameters, like S21 or S2_11, and
+            groups: all, reflection (Sii), transmission (Sij with i != j) or
+            upper (Sij with i <= j, enough for reciprocal networks). If none,
+            all of them
+        NumPorts (int): number of ports
+
+    Raises:
+        ValueError: If a S parameter or group is not valid for the network, or
+            if nothing is selected
+
+    Returns:
+        np.ndarray: sorted indices m * N + n of the selected Smn, 0 based
+    """
+
+    output_port, input_port = np.divmod(np.arange(NumPorts * NumPorts), NumPorts)
+    if traces is None:
+        return np.arange(NumPorts * NumPorts)
+    selected = np.zeros(NumPorts * NumPorts, dtype=bool)
+    for item in traces.split(","):
+        item = item.strip()
+        if item.lower() in TRACE_GROUPS:
+            selected |= {
+                "all": True,
+                "reflection": output_port == input_port,
+                "transmission": output_port != input_port,
+                "upper": output_port <= input_port,
+            }[item.lower()]
+            continue
+        match = _TRACE_RE.match(item)
+        if match is None:
+            raise ValueError("Unknown S parameter or group: {}".format(item))
+        first, second = (int(port) for port in match.groups() if port is not None)
+        if not (1 <= first <= NumPorts and 1 <= second <= NumPorts):
+            raise ValueError(
+                "{} is not a S parameter of a {} port network".format(item, NumPorts)
+            )
+        selected[(first - 1) * NumPorts + second - 1] = True
+    if not selected.any():
+        raise ValueError(
+            "{} selects no S parameter of a {} port network".format(traces, NumPorts)
+        )
+    return np.flatnonzero(selected)
+
+
+def trace_label(trace: int, NumPorts: int) -> str:
+    """Short name of a S parameter, Smn for the output port m and input port n
+
+    Over 9 ports the ports are separated, Sm_n, as in :func:`select_traces`.
+
+    Args:
+        trace (int): index m * N + n of the S parameter, 0 based
+        NumPorts (int): number of ports
+
+    Returns:
+        str: name of the S parameter
+    """
+
+    return ("S{}_{}" if NumPorts > 9 else "S{}{}").format(
+        trace // NumPorts + 1, trace % NumPorts + 1
+    )
+
+
+def _trace_segments(
+    frequency: np.ndarray, s: np.ndarray, selected: np.ndarray, max_points: int
+) -> np.ndarray:
+    """Points of the selected traces, in dB
+
+    Only the selected S parameters are converted and, if longer than
+    ``max_points``, decimated with :func:`minmax_decimate`.
+
+    Args:
+        frequency (np.ndarray): frequency points in Hz
+        s (np.ndarray): (F, N, N) complex S parameters
+        selected (np.ndarray): indices m * N + n of the selected traces
+        max_points (int): maximum number of points of a trace, 0 for all
+
+    Returns:
+        np.ndarray: (T, P, 2) frequency and magnitude in dB of every point of
+            the T selected traces
+    """
+
+    NumPorts = s.shape[1]
+    output_port, input_port = np.divmod(selected, NumPorts)
+    with np.errstate(divide="ignore"):
+        s_db = 20 * np.log10(np.abs(s[:, output_port, input_port]))
+    # Zeros can not be plotted in dB, they are left as gaps
+    s_db[~np.isfinite(s_db)] = np.nan
+    if 0 < max_points < len(frequency):
+        indices = minmax_decimate(frequency, s_db, max(1, max_points // 2))
+        return np.stack(
+            (frequency[indices.T], s_db[indices, np.arange(len(selected))].T),
+            axis=-1,
+        )
+    segments = np.empty((len(selected), len(frequency), 2))
+    segments[:, :, 0] = frequency
+    segments[:, :, 1] = s_db.T
+    return segments
+
+
+def _format_axes(ax):
+    """Grids, ticks and frequency in MHz of a plot
+
+    Args:
+        ax (matplotlib.axes.Axes): axes of the plot
+    """
+
+    from matplotlib import ticker
+
+    ax.yaxis.set_minor_locator(ticker.MultipleLocator(base=5.0))
+    ax.xaxis.set_minor_locator(ticker.MultipleLocator(base=100e6))
+    ax.xaxis.set_major_formatter(
+        ticker.FuncFormatter(lambda x, pos: "{:.0f}".format(x / 1e6))
+    )
+
+    ax.grid(which="major", color="#CCCCCC", linestyle="--")
+    ax.grid(which="minor", color="#CCCCCC", linestyle=":")
+
+
+def _trace_colors(plt, count: int) -> List[str]:
+    """Colors of the traces, as matplotlib would cycle them
+
+    Args:
+        plt (module): matplotlib.pyplot
+        count (int): number of traces
+
+    Returns:
+        List[str]: one color per trace
+    """
+
+    colors = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+    return [colors[trace % len(colors)] for trace in range(count)]
+
+
+class _Plotter:
+    """One figure reused to plot many networks, all the traces in one axes
+
+    All the traces are drawn as a single LineCollection, updated in place, so
+    the figure, axes, grids and locators are only set up once and the cost of
+    a plot barely depends on the number of traces. The figure is closed when
+    the plotter is closed, also on errors when used as a context manager.
+
+    Traces longer than ``max_points`` are decimated with
+    :func:`minmax_decimate`, so long sweeps do not make huge PDF files.
+
+    Args:
+        max_points (int): maximum number of points of a trace, if none, twice
+            the width of the axes in pixels, 0 to never decimate - optional
+        rasterize (bool): draw the traces as an image in vector outputs, the
+            axes and texts are kept as vectors - optional
+    """
+
+    def __init__(self, max_points: int = None, rasterize: bool = False):
+        plt = _pyplot()
+        from matplotlib.collections import LineCollection
+
+        self._plt = plt
+        self.fig, self.ax = plt.subplots()
+        ax = self.ax
+        _format_axes(ax)
+        ax.set_xlabel("Frequency (MHz)")
+        ax.set_ylabel("Magnitude (dB)")
+
+        self.traces = LineCollection(
+            [], linewidths=plt.rcParams["lines.linewidth"], rasterized=rasterize
+        )
+        ax.add_collection(self.traces, autolim=False)
+        self._handles = []
+        self._labels = []
+
+        if max_points is None:
+            # A minimum and a maximum per pixel column
+            max_points = 2 * int(ax.get_window_extent().width)
+        self.max_points = max_points
+
+    def __enter__(self) -> "_Plotter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _set_traces(self, labels: List[str]):
+        """Colors and legend entries of the traces
+
+        Args:
+            labels (List[str]): names of the traces
+        """
+
+        from matplotlib.lines import Line2D
+
+        colors = _trace_colors(self._plt, len(labels))
+        self.traces.set_color(colors)
+        self._handles = [
+            Line2D([], [], color=color, label=label)
+            for (color, label) in zip(colors, labels)
+        ]
+        self._labels = labels
+
+    def _legend(self, NumPorts: int, segments: np.ndarray):
+        """Legend of the traces
+
+        Up to :data:`_INNER_LEGEND_TRACES` traces, the legend is a column in
+        the corner of the axes hiding the fewest points. Above it, it is a
+        table outside the axes with up to a column per output port.
+
+        Args:
+            NumPorts (int): number of ports
+            segments (np.ndarray): (T, P, 2) points of the traces
+        """
+
+        ax = self.ax
+        if len(self._handles) > _INNER_LEGEND_TRACES:
+            ax.legend(
+                handles=self._handles,
+                loc="upper left",
+                bbox_to_anchor=(1.02, 1),
+                ncol=-(-len(self._handles) // NumPorts),
+                fontsize="x-small",
+                columnspacing=1.0,
+                handlelength=1.5,
+            )
+            return
+
+        legend = ax.legend(handles=self._handles, loc=_LEGEND_CORNERS[0][0])
+        box = legend.get_window_extent().transformed(ax.transAxes.inverted())
+        points = ax.transLimits.transform(segments.reshape(-1, 2))
+        hidden = []
+        for _, (right, top) in _LEGEND_CORNERS:
+            inside_x = (
+                points[:, 0] > 1 - box.width if right else points[:, 0] < box.width
+            )
+            inside_y = (
+                points[:, 1] > 1 - box.height if top else points[:, 1] < box.height
+            )
+            hidden.append(np.count_nonzero(inside_x & inside_y))
+        best = _LEGEND_CORNERS[int(np.argmin(hidden))][0]
+        if best != _LEGEND_CORNERS[0][0]:
+            ax.legend(handles=self._handles, loc=best)
+
+    def draw(
+        self, frequency: np.ndarray, s: np.ndarray, title: str, traces: str = None
+    ):
+        """Plot the magnitude in dB of the S parameters
+
+        Args:
+            frequency (np.ndarray): frequency points in Hz
+            s (np.ndarray): (F, N, N) complex S parameters
+            title (str): title of the plot
+            traces (str): S parameters to plot, see :func:`select_traces`, if
+                none, all of them - optional
+
+        Raises:
+            ValueError: If the traces are not valid for the network
+        """
+
+        NumPorts = s.shape[1]
+        selected = select_traces(traces, NumPorts)
+        segments = _trace_segments(frequency, s, selected, self.max_points)
+
+        labels = [trace_label(trace, NumPorts) for trace in selected]
+        if labels != self._labels:
+            self._set_traces(labels)
+        self.traces.set_segments(segments)
+
+        ax = self.ax
+        ax.ignore_existing_data_limits = True
+        finite = np.isfinite(segments).all(axis=-1)
+        if finite.any():
+            ax.update_datalim(
+                [segments[finite].min(axis=0), segments[finite].max(axis=0)]
+            )
+        ax.autoscale_view()
+        ax.set_title(title)
+        self._legend(NumPorts, segments)
+
+    def close(self):
+        """Free the figure"""
+
+        if self.fig is not None:
+            self._plt.close(self.fig)
+            self.fig = None
+
+
+class _GridPlotter:
+    """One figure reused to plot many networks, every trace in its own axes
+
+    Smn is plotted in the axes of row m and column n of a N x N grid with
+    shared axes, the axes of the traces not selected are hidden. The figure
+    is only set up again when the number of ports changes.
+
+    Args:
+        max_points (int): maximum number of points of a trace, if none, twice
+            the width of an axes in pixels, 0 to never decimate - optional
+        rasterize (bool): draw the traces as images in vector outputs, the
+            axes and texts are kept as vectors - optional
+    """
+
+    def __init__(self, max_points: int = None, rasterize: bool = False):
+        self._plt = _pyplot()
+        self._max_points = max_points
+        self._rasterize = rasterize
+        self.fig = None
+        self.axes = None
+
+    def __enter__(self) -> "_GridPlotter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _set_ports(self, NumPorts: int):
+        """New figure with the grid of a network
+
+        Args:
+            NumPorts (int): number of ports
+        """
+
+        self.close()
+        self.fig, self.axes = self._plt.subplots(
+            NumPorts,
+            NumPorts,
+            sharex=True,
+            sharey=True,
+            squeeze=False,
+            figsize=(1 + 2.4 * NumPorts, 0.8 + 1.8 * NumPorts),
+        )
+        colors = _trace_colors(self._plt, NumPorts * NumPorts)
+        for trace, ax in enumerate(self.axes.flat):
+            _format_axes(ax)
+            ax.tick_params(labelsize="x-small")
+            ax.plot([], [], color=colors[trace], rasterized=self._rasterize)
+            ax.set_title(trace_label(trace, NumPorts), fontsize="small")
+        self.fig.supxlabel("Frequency (MHz)")
+        self.fig.supylabel("Magnitude (dB)")
+
+        self.max_points = self._max_points
+        if self.max_points is None:
+            # A minimum and a maximum per pixel column
+            self.max_points = 2 * int(self.axes[0, 0].get_window_extent().width)
+
+    def draw(
+        self, frequency: np.ndarray, s: np.ndarray, title: str, traces: str = None
+    ):
+        """Plot the magnitude in dB of the S parameters
+
+        Args:
+            frequency (np.ndarray): frequency points in Hz
+            s (np.ndarray): (F, N, N) complex S parameters
+            title (str): title of the plot
+            traces (str): S parameters to plot, see :func:`select_traces`, if
+                none, all of them - optional
+
+        Raises:
+            ValueError: If the traces are not valid for the network
+        """
+
+        NumPorts = s.shape[1]
+        selected = select_traces(traces, NumPorts)
+        if self.axes is None or self.axes.shape[0] != NumPorts:
+            self._set_ports(NumPorts)
+        segments = _trace_segments(frequency, s, selected, self.max_points)
+
+        visible = np.zeros(NumPorts * NumPorts, dtype=bool)
+        visible[selected] = True
+        visible = visible.reshape(NumPorts, NumPorts)
+        for (row, column), ax in np.ndenumerate(self.axes):
+            ax.set_visible(visible[row, column])
+            # Tick labels on the outer visible axes of every row and column
+            ax.tick_params(
+                labelbottom=not visible[row + 1 :, column].any(),
+                labelleft=not visible[row, :column].any(),
+            )
+        for trace, segment in zip(selected, segments):
+            ax = self.axes.flat[trace]
+            ax.lines[0].set_data(segment[:, 0], segment[:, 1])
+            ax.relim()
+        # The limits are shared, scaling one axes scales all of them
+        self.axes.flat[selected[0]].autoscale_view()
+        self.fig.suptitle(title)
+
+    def close(self):
+        """Free the figure"""
+
+        if self.fig is not None:
+            self._plt.close(self.fig)
+            self.fig = None
+            self.axes = None
+
+
+def _check_layout(layout: str):
+    """Check that a layout is known
+
+    Args:
+        layout (str): layout name
+
+    Raises:
+        ValueError: If the layout is unknown
+    """
+
+    if layout not in LAYOUTS:
+        raise ValueError(
+            "Unknown layout {}, it must be one of {}".format(layout, ", ".join(LAYOUTS))
+        )
+
+
+def output_format(filename: str) -> str:
+    """Format of an output file, from its extension
+
+    Args:
+        filename (str): output file name
+
+    Raises:
+        ValueError: If the extension is not a known format
+
+    Returns:
+        str: pdf, png or svg
+    """
+
+    extension = os.path.splitext(filename)[1][1:].lower()
+    if extension not in OUTPUT_FORMATS:
+        raise ValueError(
+            "Unknown output format of {}, the extension must be one of {}".format(
+                filename, ", ".join(OUTPUT_FORMATS)
+            )
+        )
+    return extension
+
+
+class _PlotOptions(NamedTuple):
+    """What is plotted, and how it is drawn and saved, see :func:`s_plot`"""
+
+    max_points: int = None
+    traces: str = None
+    layout: str = "overlay"
+    dpi: float = None
+    rasterize: bool = False
+    fmin: float = None
+    fmax: float = None
+
+
+def _make_plotter(options: _PlotOptions):
+    """Plotter of a layout
+
+    Args:
+        options (_PlotOptions): layout, decimation and rasterization
+
+    Raises:
+        ValueError: If the layout is unknown
+
+    Returns:
+        _Plotter or _GridPlotter: plotter of the layout
+    """
+
+    _check_layout(options.layout)
+    if options.layout == "grid":
+        return _GridPlotter(options.max_points, options.rasterize)
+    return _Plotter(options.max_points, options.rasterize)
+
+
+def _savefig(fig, output: str, options: _PlotOptions, pages=None):
+    """Save a plot in the format of its output file
+
+    Args:
+        fig (matplotlib.figure.Figure): figure of the plot
+        output (str): output file name
+        options (_PlotOptions): resolution of the images
+        pages (PdfPages): the open multipage PDF to add the plot to, if any -
+            optional
+    """
+
+    dpi = options.dpi or "figure"
+    if pages is not None:
+        pages.savefig(fig, bbox_inches="tight", dpi=dpi)
+    else:
+        fig.savefig(output, format=output_format(output), bbox_inches="tight", dpi=dpi)
+
+
+def _default_title(input: str) -> str:
+    """Title of the plot of a file, its name without extension
 
     Args:
         input (str): input file name
-        output (str): output file name, if none, it will be derived from input
+
+    Returns:
+        str: title
+    """
+
+    return os.path.splitext(os.path.basename(input))[0]
+
+
+def _default_output(input: str, default_format: str) -> str:
+    """Output file of an input plotted in its own file
+
+    Args:
+        input (str): input file name
+        default_format (str): extension of the output file
+
+    Returns:
+        str: input file name with the extension of the format
+    """
+
+    return os.path.splitext(input)[0] + "." + default_format
+
+
+def _shared_outputs(inputs: List[str], default_format: str) -> Dict[int, str]:
+    """Inputs whose own output file is the one of an earlier input
+
+    Inputs with the same name and another extension, e.g. dut.s2p and dut.s3p,
+    would be plotted in the same file.
+
+    Args:
+        inputs (List[str]): input file names
+        default_format (str): extension of the output files
+
+    Returns:
+        Dict[int, str]: position and error of every input after the first one
+            of an output file
+    """
+
+    first = {}
+    errors = {}
+    for index, input in enumerate(inputs):
+        output = _default_output(input, default_format)
+        key = os.path.normcase(os.path.abspath(output))
+        if key in first:
+            errors[index] = "The output file {} is already plotted from {}".format(
+                output, inputs[first[key]]
+            )
+        else:
+            first[key] = index
+    return errors
+
+
+def _load_plot_data(
+    input: PlotInput,
+    cache_dir: str,
+    profiler,
+    fmin: float = None,
+    fmax: float = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Frequency and S parameters of a file or of data in memory to plot
+
+    Args:
+        input (PlotInput): input file name, network or (frequency, S) arrays
+        cache_dir (str): directory of the parse cache, if none, it is not used
+        profiler (Profiler): profiler of the parse stage
+        fmin (float): lowest frequency in Hz, if none, no lower limit
+        fmax (float): highest frequency in Hz, if none, no upper limit
+
+    Raises:
+        ValueError: If the file can not be read, the arrays are not valid or
+            no point is inside the band
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: frequency in Hz and S parameters
+    """
+
+    if isinstance(input, tuple):
+        frequency, s = (np.asarray(array) for array in input)
+        if (
+            frequency.ndim != 1
+            or s.ndim != 3
+            or s.shape[0] != len(frequency)
+            or s.shape[1] != s.shape[2]
+        ):
+            raise ValueError(
+                "Wrong S parameters: {} for {} frequency points".format(
+                    s.shape, frequency.shape
+                )
+            )
+    elif not isinstance(input, str):
+        frequency, s = (input.f, input.s)
+    else:
+        try:
+            with profiler.stage("parse"):
+                slot = load_network(input, cache_dir, fmin, fmax)
+        except Exception as e:
+            _logger.debug("s_plot: Exception {} when opening file: {}".format(e, input))
+            raise ValueError("Error reading {}: {}".format(input, e)) from e
+        return (slot.f, slot.s)
+    # Data in memory, the band is a view of it
+    rows = band_slice(frequency, fmin, fmax)
+    if rows.start >= rows.stop:
+        raise ValueError("No frequency points between {} and {} Hz".format(fmin, fmax))
+    return (frequency[rows], s[rows])
+
+
+def plot_figure(
+    input: PlotInput,
+    title: str = None,
+    cache_dir: str = None,
+    max_points: int = None,
+    traces: str = None,
+    layout: str = "overlay",
+    rasterize: bool = False,
+    fmin: float = None,
+    fmax: float = None,
+):
+    """Plot touchstone data into a new figure, without saving it
+
+    The figure belongs to the caller, who can change it, save it and must
+    close it with ``matplotlib.pyplot.close``.
+
+    Args:
+        input (PlotInput): input file name, network or (frequency, S) arrays,
+            the frequency in Hz and the S parameters as a (F, N, N) array
+        title (str): title of the plot, if none, the name of the input
+        cache_dir (str): directory of the parse cache, if none, it is not used
+        max_points (int): maximum number of points of a trace, as in
+            :func:`s_plot`
+        traces (str): S parameters to plot, as in :func:`s_plot`
+        layout (str): overlay or grid, as in :func:`s_plot`
+        rasterize (bool): draw the traces as an image in vector files
+        fmin (float): lowest frequency to plot in Hz, as in :func:`s_plot`
+        fmax (float): highest frequency to plot in Hz, as in :func:`s_plot`
+
+    Raises:
+        ValueError: If the input can not be read, or the traces or the layout
+            are not valid
+
+    Returns:
+        matplotlib.figure.Figure: the plot
+    """
+
+    frequency, s = _load_plot_data(input, cache_dir, NULL_PROFILER, fmin, fmax)
+    if title is None:
+        title = _input_title(input)
+    plotter = _make_plotter(_PlotOptions(max_points, traces, layout, None, rasterize))
+    try:
+        plotter.draw(frequency, s, title, traces)
+    except Exception:
+        plotter.close()
+        raise
+    return plotter.fig
+
+
+def _input_title(input: PlotInput) -> str:
+    """Title of the plot of an input
+
+    Args:
+        input (PlotInput): input file name, network or (frequency, S) arrays
+
+    Returns:
+        str: the file name without extension, the network name or nothing
+    """
+
+    if isinstance(input, str):
+        return _default_title(input)
+    if isinstance(input, tuple):
+        return ""
+    return input.name or ""
+
+
+def s_plot(
+    input: PlotInput,
+    output: str,
+    title: str,
+    cache_dir: str = None,
+    profiler: Profiler = None,
+    max_points: int = None,
+    traces: str = None,
+    layout: str = "overlay",
+    dpi: float = None,
+    rasterize: bool = False,
+    default_format: str = "pdf",
+    render_cache: RenderCache = None,
+    fmin: float = None,
+    fmax: float = None,
+) -> Tuple[PlotInput, str, int]:
+    """Generate a plot with the provided touchstone data
+
+    The format of the plot, PDF, PNG or SVG, is the one of the extension of
+    the output file. The data can be in memory, e.g. the result of
+    :func:`stouchtool.s_cat.cat_networks`, so it is not written and parsed
+    again; :func:`plot_figure` does not even save the plot.
+
+    Args:
+        input (PlotInput): input file name, network or (frequency, S) arrays,
+            the frequency in Hz and the S parameters as a (F, N, N) array
+        output (str): output file name, if none, it will be derived from input,
+            it is mandatory for data in memory
         title (str): title of the plot, if none, it will derived from input
+        cache_dir (str): directory of the parse cache, if none, it is not used
+        profiler (Profiler): profiler of the parse, plot and savefig stages, if
+            none, nothing is measured
+        max_points (int): maximum number of points of a trace, longer traces
+            are decimated keeping their envelope, if none, it depends on the
+            width of the plot, 0 to never decimate
+        traces (str): comma separated S parameters to plot, like S21 or S2_11,
+            and groups: all, reflection, transmission or upper, if none, all
+            of them
+        layout (str): overlay, all the traces in one plot, or grid, every
+            trace in its own plot of a N x N grid
+        dpi (float): resolution of images, if none, the one of the figure
+        rasterize (bool): draw the traces as an image in PDF and SVG files,
+            keeping the axes and texts as vectors
+        default_format (str): extension of the output file when it is derived
+            from the input
+        render_cache (RenderCache): manifests of the rendered plots, the plot
+            of a file is not rendered again if it is up to date. It is updated
+            but not saved
+        fmin (float): lowest frequency to plot in Hz, the points of a file
+            below it are skipped, if none, no lower limit
+        fmax (float): highest frequency to plot in Hz, a file is not read
+            after it, if none, no upper limit
+
+    Raises:
+        ValueError: If the input can not be read, or the output file, the
+            output format, the traces or the layout are not valid
 
     Returns:
-        Tuple[str, str, int]: input file name, output file name, number of ports
+        Tuple[PlotInput, str, int]: input, output file name, number of ports
     """
 
     _logger.info("s_plot: The input file is:{}".format(input))
+    in_memory = not isinstance(input, str)
 
     # output file may be none, generate correct one
     if output is None:
+        if in_memory:
+            raise ValueError("An output file name is needed for data in memory")
         _logger.info(
             "s_plot: The output file is not given so a new one will be created"
         )
-        output = os.path.splitext(input)[0] + ".pdf"
+        output = _default_output(input, default_format)
     _logger.info("s_plot: The output file is:{}".format(output))
+    output_format(output)
     if title is None:
         _logger.info("s_plot: The title is not given so a new one will be created")
-        title = os.path.splitext(os.path.basename(input))[0]
+        title = _input_title(input)
 
     _logger.info("s_plot: The title is:{}".format(title))
+    if profiler is None:
+        profiler = NULL_PROFILER
+    if in_memory:
+        # Only files can be checked for changes
+        render_cache = None
+
+    options = _PlotOptions(max_points, traces, layout, dpi, rasterize, fmin, fmax)
+    if render_cache is not None:
+        key = options_fingerprint(title=title, **options._asdict())
+        ports = render_cache.ports(output, [input], key)
+        if ports is not None:
+            _logger.info("s_plot: {} is up to date".format(output))
+            return (input, output, ports[0])
+
+    frequency, s = _load_plot_data(input, cache_dir, profiler, fmin, fmax)
+
+    with _make_plotter(options) as plotter:
+        with profiler.stage("plot"):
+            plotter.draw(frequency, s, title, traces)
+
+        with profiler.stage("savefig"):
+            _savefig(plotter.fig, output, options)
+
+    if render_cache is not None:
+        render_cache.record(output, [input], key, [s.shape[1]])
+    return (input, output, s.shape[1])
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """Input file names from names, directories and glob patterns
+
+    Args:
+        patterns (List[str]): file names, directories whose Touchstone files
+            are plotted, or glob patterns
+
+    Raises:
+        ValueError: If a directory or pattern matches no file
 
+    Returns:
+        List[str]: file names, the matches of every directory or pattern sorted
+    """
+
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = []
+            for name in sorted(os.listdir(pattern)):
+                try:
+                    ports_from_filename(name)
+                except TouchstoneFormatError:
+                    continue
+                matches.append(os.path.join(pattern, name))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+        else:
+            inputs.append(pattern)
+            continue
+        if not matches:
+            raise ValueError("No file matches {}".format(pattern))
+        inputs.extend(matches)
+    return inputs
+
+
+def _plot_file(
+    plotter: _Plotter,
+    input: str,
+    output: str,
+    pages,
+    cache_dir: str,
+    profiler,
+    options: _PlotOptions,
+    default_format: str,
+) -> Tuple[str, str, int, str]:
+    """Plot one file of a batch, catching its errors
+
+    Args:
+        plotter (_Plotter or _GridPlotter): figure to reuse
+        input (str): input file name
+        output (str): file name of the multipage PDF, if none, the input is
+            plotted in its own file
+        pages (PdfPages): the open multipage PDF, if any
+        cache_dir (str): directory of the parse cache, if none, it is not used
+        profiler (Profiler): profiler of the parse, plot and savefig stages
+        options (_PlotOptions): how the plot is drawn and saved
+        default_format (str): extension of the output file of the input
+
+    Returns:
+        Tuple[str, str, int, str]: input file name, output file name, number
+            of ports and None, or input file name, None, None and the error
+    """
+
+    _logger.info("s_plot_batch: Plotting {}".format(input))
     try:
-        slot = rf.Network(input)
+        frequency, s = _load_plot_data(
+            input, cache_dir, profiler, options.fmin, options.fmax
+        )
+        with profiler.stage("plot"):
+            plotter.draw(frequency, s, _default_title(input), options.traces)
+        with profiler.stage("savefig"):
+            if output is None:
+                output = _default_output(input, default_format)
+            _savefig(plotter.fig, output, options, pages)
     except Exception as e:
-        _logger.debug("s_plot: Exception {} when opening file: {}".format(e, input))
-        sys.exit(1)
+        _logger.debug("s_plot_batch: {} failed: {}".format(input, e))
+        return (input, None, None, str(e))
+    return (input, output, s.shape[1], None)
 
-    fig, ax = plt.subplots()
-    slot.plot_s_db(ax=ax)
-    ax.yaxis.set_minor_locator(ticker.MultipleLocator(base=5.0))
-    ax.xaxis.set_minor_locator(ticker.MultipleLocator(base=100e6))
-    ax.xaxis.set_major_formatter(
-        ticker.FuncFormatter(lambda x, pos: "{:.0f}".format(x / 1e6))
+
+# Figure of a worker process, reused for all the files it plots
+_worker_plotter = None
+
+
+def _plot_file_worker(
+    input: str, cache_dir: str, options: _PlotOptions, default_format: str
+) -> Tuple[str, str, int, str]:
+    """Plot one file of a batch in a worker process
+
+    Args:
+        input (str): input file name
+        cache_dir (str): directory of the parse cache, if none, it is not used
+        options (_PlotOptions): how the plot is drawn and saved
+        default_format (str): extension of the output file
+
+    Returns:
+        Tuple[str, str, int, str]: as :func:`_plot_file`
+    """
+
+    global _worker_plotter
+    if _worker_plotter is None:
+        import matplotlib
+
+        # Workers only write files, whatever backend the parent process uses
+        matplotlib.use("Agg")
+        _worker_plotter = _make_plotter(options)
+    return _plot_file(
+        _worker_plotter,
+        input,
+        None,
+        None,
+        cache_dir,
+        NULL_PROFILER,
+        options,
+        default_format,
     )
 
-    ax.grid(which="major", color="#CCCCCC", linestyle="--")
-    ax.grid(which="minor", color="#CCCCCC", linestyle=":")
 
-    ax.set_xlabel("Frequency (MHz)")
-    ax.set_title(title)
+def s_plot_batch(
+    inputs: List[str],
+    output: str = None,
+    cache_dir: str = None,
+    profiler: Profiler = None,
+    jobs: int = 1,
+    max_points: int = None,
+    traces: str = None,
+    layout: str = "overlay",
+    dpi: float = None,
+    rasterize: bool = False,
+    default_format: str = "pdf",
+    render_cache: RenderCache = None,
+    fmin: float = None,
+    fmax: float = None,
+) -> List[Tuple[str, str, int, str]]:
+    """Plot many touchstone files reusing a single figure
+
+    Every plot is titled with the name of its file. A file that can not be
+    plotted does not stop the others. Without multipage output, the inputs
+    whose own file is the one of an earlier input fail, so no plot is
+    overwritten.
+
+    Args:
+        inputs (List[str]): input file names
+        output (str): multipage PDF with one page per input, if none, every
+            input is plotted in its own file
+        cache_dir (str): directory of the parse cache, if none, it is not used
+        profiler (Profiler): profiler of the parse, plot and savefig stages,
+            only used without worker processes, if none, nothing is measured
+        jobs (int): number of worker processes plotting one file per input,
+            None or 0 for one per CPU. A multipage PDF is always
+            plotted in a single process - optional
+        max_points (int): maximum number of points of a trace, longer traces
+            are decimated keeping their envelope, if none, it depends on the
+            width of the plot, 0 to never decimate - optional
+        traces (str): comma separated S parameters to plot, like S21 or S2_11,
+            and groups: all, reflection, transmission or upper, if none, all
+            of them - optional
+        layout (str): overlay, all the traces in one plot, or grid, every
+            trace in its own plot of a N x N grid -
+            optional
+        dpi (float): resolution of images, if none, the one of the figure -
+            optional
+        rasterize (bool): draw the traces as an image in PDF and SVG files,
+            keeping the axes and texts as vectors - optional
+        default_format (str): pdf, png or svg, format of the file of every
+            input without multipage output - optional
+        render_cache (RenderCache): manifests of the rendered plots, the
+            plots that are up to date are not rendered again. It is updated
+            but not saved - optional
+        fmin (float): lowest frequency to plot in Hz, if none, no lower limit
+            - optional
+        fmax (float): highest frequency to plot in Hz, if none, no upper limit
+            - optional
+
+    Raises:
+        ValueError: If the layout or the output formats are not valid
+
+    Returns:
+        List[Tuple[str, str, int, str]]: for every input, in order, the input
+            file name, the output file name, the number of ports and the error,
+            either the error or the other two are None
+    """
+
+    _check_layout(layout)
+    if output is not None and output_format(output) != "pdf":
+        raise ValueError("The multipage output {} must be a PDF file".format(output))
+    if default_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            "Unknown output format {}, it must be one of {}".format(
+                default_format, ", ".join(OUTPUT_FORMATS)
+            )
+        )
+    options = _PlotOptions(max_points, traces, layout, dpi, rasterize, fmin, fmax)
+    if profiler is None:
+        profiler = NULL_PROFILER
+    shared = {} if output is not None else _shared_outputs(inputs, default_format)
+    plotted = iter(
+        _plot_batch(
+            [input for (index, input) in enumerate(inputs) if index not in shared],
+            output,
+            cache_dir,
+            profiler,
+            jobs,
+            options,
+            default_format,
+            render_cache,
+        )
+    )
+    return [
+        (input, None, None, shared[index]) if index in shared else next(plotted)
+        for (index, input) in enumerate(inputs)
+    ]
+
 
-    # Change legend names since the default are very long names with the filename in it
-    legend_list = []
-    for output_port in range(slot.number_of_ports):
-        for input_port in range(slot.number_of_ports):
-            legend_list.append("S{}{}".format(output_port + 1, input_port + 1))
+def _plot_batch(
+    inputs: List[str],
+    output: str,
+    cache_dir: str,
+    profiler,
+    jobs: int,
+    options: _PlotOptions,
+    default_format: str,
+    render_cache: RenderCache,
+) -> List[Tuple[str, str, int, str]]:
+    """Plot many touchstone files not up to date, see :func:`s_plot_batch`
 
-    ax.legend(legend_list)
+    Args:
+        inputs (List[str]): input file names, with different output files
+        output (str): multipage PDF with one page per input, if none, every
+            input is plotted in its own file
+        cache_dir (str): directory of the parse cache, if none, it is not used
+        profiler (Profiler): profiler of the parse, plot and savefig stages
+        jobs (int): number of worker processes, None or 0 for one per CPU
+        options (_PlotOptions): how the plots are drawn and saved
+        default_format (str): format of the file of every input
+        render_cache (RenderCache): manifests of the rendered plots, if none,
+            everything is rendered
 
-    plt.savefig(output, format="pdf", bbox_inches="tight")
+    Returns:
+        List[Tuple[str, str, int, str]]: as :func:`s_plot_batch`
+    """
 
-    return (input, output, slot.number_of_ports)
+    if render_cache is None:
+        return _render_batch(
+            inputs, output, cache_dir, profiler, jobs, options, default_format
+        )
+
+    key = options_fingerprint(**options._asdict())
+    if output is not None:
+        ports = render_cache.ports(output, inputs, key)
+        if ports is not None:
+            return [(input, output, port, None) for (input, port) in zip(inputs, ports)]
+        results = _render_batch(
+            inputs, output, cache_dir, profiler, jobs, options, default_format
+        )
+        if all(error is None for (_, _, _, error) in results):
+            render_cache.record(
+                output, inputs, key, [ports for (_, _, ports, _) in results]
+            )
+        return results
+
+    results = []
+    for input in inputs:
+        outputfile = _default_output(input, default_format)
+        ports = render_cache.ports(outputfile, [input], key)
+        results.append(None if ports is None else (input, outputfile, ports[0], None))
+    pending = [index for (index, result) in enumerate(results) if result is None]
+    rendered = _render_batch(
+        [inputs[index] for index in pending],
+        None,
+        cache_dir,
+        profiler,
+        jobs,
+        options,
+        default_format,
+    )
+    for index, result in zip(pending, rendered):
+        results[index] = result
+        input, outputfile, ports, error = result
+        if error is None:
+            render_cache.record(outputfile, [input], key, [ports])
+    return results
+
+
+def _render_batch(
+    inputs: List[str],
+    output: str,
+    cache_dir: str,
+    profiler,
+    jobs: int,
+    options: _PlotOptions,
+    default_format: str,
+) -> List[Tuple[str, str, int, str]]:
+    """Plot many touchstone files, see :func:`s_plot_batch`
+
+    Args:
+        inputs (List[str]): input file names
+        output (str): multipage PDF with one page per input, if none, every
+            input is plotted in its own file
+        cache_dir (str): directory of the parse cache, if none, it is not used
+        profiler (Profiler): profiler of the parse, plot and savefig stages
+        jobs (int): number of worker processes, None or 0 for one per CPU
+        options (_PlotOptions): how the plots are drawn and saved
+        default_format (str): format of the file of every input
+
+    Returns:
+        List[Tuple[str, str, int, str]]: as :func:`s_plot_batch`
+    """
+
+    if not inputs:
+        return []
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(inputs))
+
+    if output is None and jobs > 1:
+        _logger.debug("Plotting {} files in {} processes".format(len(inputs), jobs))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(
+                executor.map(
+                    partial(
+                        _plot_file_worker,
+                        cache_dir=cache_dir,
+                        options=options,
+                        default_format=default_format,
+                    ),
+                    inputs,
+                    # Some files per task to amortize the inter process calls
+                    chunksize=max(1, min(16, len(inputs) // (4 * jobs))),
+                )
+            )
+
+    with contextlib.ExitStack() as stack:
+        plotter = stack.enter_context(_make_plotter(options))
+        pages = None
+        if output is not None:
+            from matplotlib.backends.backend_pdf import PdfPages
+
+            pages = stack.enter_context(PdfPages(output))
+        return [
+            _plot_file(
+                plotter,
+                input,
+                output,
+                pages,
+                cache_dir,
+                profiler,
+                options,
+                default_format,
+            )
+            for input in inputs
+        ]
 
 
 # ---- CLI ----
@@ -115,17 +1271,20 @@ def parse_args(args: List[str]) -> argparse.Namespace:
         version="STouchTool {ver}".format(ver=__version__),
     )
     parser.add_argument(
-        dest="input",
-        help="Input file with touchstone params",
+        dest="inputs",
+        help="Input files with touchstone params, or glob patterns",
         type=str,
+        nargs="+",
         metavar="INPUT FILE",
     )
     parser.add_argument(
         "-o",
         "--output",
         dest="output",
-        help="Output file to write result, if none given, \
-            it will be the input file with the PDF extension",
+        help="Output file to write result, PDF, PNG or SVG from its \
+            extension. If none given, it will be the input file with the \
+            FORMAT extension. With several input files, a multipage PDF with \
+            one page per input",
         type=str,
         metavar="OUTPUT FILE",
     )
@@ -133,10 +1292,130 @@ def parse_args(args: List[str]) -> argparse.Namespace:
         "-t",
         "--title",
         dest="title",
-        help="Title of the plot",
+        help="Title of the plot, only for a single input file",
         type=str,
         metavar="TITLE",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        help="Number of parallel jobs plotting the input files in their own "
+        "PDF files, 0 for one per CPU",
+        type=int,
+        default=1,
+        metavar="JOBS",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="default_format",
+        help="Format of the output files derived from the input files. "
+        "Default is pdf",
+        choices=OUTPUT_FORMATS,
+        default="pdf",
+    )
+    parser.add_argument(
+        "--dpi",
+        dest="dpi",
+        help="Resolution of images, PNG files and rasterized traces, in dots "
+        "per inch. Default is 100",
+        type=float,
+        metavar="DPI",
+    )
+    parser.add_argument(
+        "--rasterize",
+        dest="rasterize",
+        help="Draw the traces as an image in PDF and SVG files, keeping the "
+        "axes and texts as vectors",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--traces",
+        dest="traces",
+        help="Comma separated S parameters to plot, like S21,S31 or S2_11, "
+        "and groups: {}. Default is all".format(", ".join(TRACE_GROUPS)),
+        type=str,
+        metavar="TRACES",
+    )
+    parser.add_argument(
+        "--layout",
+        dest="layout",
+        help="All the traces in one plot, or every trace in its own plot of a "
+        "N x N grid. Default is overlay",
+        choices=LAYOUTS,
+        default="overlay",
+    )
+    parser.add_argument(
+        "--max-points",
+        dest="max_points",
+        help="Decimate the traces to this number of points keeping their "
+        "envelope, default is twice the width of the plot in pixels",
+        type=int,
+        metavar="MAX_POINTS",
+    )
+    parser.add_argument(
+        "--no-decimation",
+        dest="max_points",
+        help="Plot every point of the traces",
+        action="store_const",
+        const=0,
+    )
+    parser.add_argument(
+        "--fmin",
+        dest="fmin",
+        help="Lowest frequency to plot in Hz, the points below it are skipped",
+        type=float,
+        metavar="FMIN",
+    )
+    parser.add_argument(
+        "--fmax",
+        dest="fmax",
+        help="Highest frequency to plot in Hz, the input files are not read "
+        "after it",
+        type=float,
+        metavar="FMAX",
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        help="Do not plot again the plots whose input files and options did "
+        "not change, they are recorded in a manifest in the output directory",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--force",
+        dest="force",
+        help="With --incremental, plot everything again",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Save the time and memory used by every stage as JSON in PROFILE",
+        type=str,
+        metavar="PROFILE",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        dest="profile_memory",
+        help="Trace the peak memory of every stage in the profile, it is slow",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        help="Cache the parsed input file in CACHE_DIR, default is the "
+        "{} environment variable".format(CACHE_DIR_ENV),
+        type=str,
+        metavar="CACHE_DIR",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        help="Do not use the parse cache",
+        action="store_true",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -174,15 +1453,90 @@ def main(arguments: List[str]):
     args = parse_args(arguments)
     setup_logging(args.loglevel)
     _logger.debug("Starting plotting...")
-    inputfilename, outputfilename, numberofports = s_plot(
-        args.input, args.output, args.title
-    )
-    print(
-        "The plot from file {} has {} ports and has been ploted in {}".format(
-            inputfilename, numberofports, outputfilename
-        )
-    )
+    try:
+        inputs = expand_inputs(args.inputs)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    profiler = Profiler(args.profile_memory) if args.profile else None
+    cache_dir = resolve_cache_dir(args.cache_dir, args.no_cache)
+    render_cache = RenderCache(args.force) if args.incremental else None
+    try:
+        if len(inputs) == 1:
+            try:
+                results = [
+                    s_plot(
+                        inputs[0],
+                        args.output,
+                        args.title,
+                        cache_dir=cache_dir,
+                        profiler=profiler,
+                        max_points=args.max_points,
+                        traces=args.traces,
+                        layout=args.layout,
+                        dpi=args.dpi,
+                        rasterize=args.rasterize,
+                        default_format=args.default_format,
+                        render_cache=render_cache,
+                        fmin=args.fmin,
+                        fmax=args.fmax,
+                    )
+                    + (None,)
+                ]
+            except ValueError as e:
+                results = [(inputs[0], None, None, str(e))]
+        else:
+            if args.title is not None:
+                _logger.warning("s_plot: The title is ignored with several inputs")
+            try:
+                results = s_plot_batch(
+                    inputs,
+                    args.output,
+                    cache_dir=cache_dir,
+                    profiler=profiler,
+                    jobs=args.jobs,
+                    max_points=args.max_points,
+                    traces=args.traces,
+                    layout=args.layout,
+                    dpi=args.dpi,
+                    rasterize=args.rasterize,
+                    default_format=args.default_format,
+                    render_cache=render_cache,
+                    fmin=args.fmin,
+                    fmax=args.fmax,
+                )
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.close()
+        if render_cache is not None:
+            render_cache.save()
+    if profiler is not None:
+        profiler.write(args.profile, command="s_plot", inputs=inputs)
+    failed = 0
+    for inputfilename, outputfilename, numberofports, error in results:
+        if render_cache is not None and outputfilename in render_cache.skipped:
+            print(
+                "The plot from file {} is up to date in {}".format(
+                    inputfilename, outputfilename
+                )
+            )
+        elif error is None:
+            print(
+                "The plot from file {} has {} ports and has been ploted in {}".format(
+                    inputfilename, numberofports, outputfilename
+                )
+            )
+        else:
+            failed += 1
+            print("The plot from file {} failed: {}".format(inputfilename, error))
+    if len(results) > 1:
+        print("{} of {} plots failed".format(failed, len(results)))
     _logger.info("s_plot: Script ends here")
+    if failed:
+        sys.exit(1)
 
 
 def run():
@@ -0,0 +1,984 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+Native Touchstone reader and writer.
+
+The whole numeric block of a Touchstone v1 file is parsed in a single NumPy pass
+straight into a (F, N, N) complex array. Files that this reader does not support
+(Touchstone v2 keywords, non S parameters, noise data...) are handed over to
+scikit-rf by :func:`load_network`. The writer formats whole blocks of records
+with NumPy too, see :func:`write_records`.
+
+A band of frequencies of a file is read one block of records at a time,
+keeping only the records inside the band and stopping at the first record
+above it, so the rest of the file is neither kept in memory nor read.
+
+
+References:
+    - https://ibis.org/connector/touchstone_spec11.pdf
+"""
+
+import logging
+import os
+import re
+import warnings
+from typing import TYPE_CHECKING, Iterator, NamedTuple, TextIO, Tuple
+
+import numpy as np
+
+from stouchtool import __version__
+
+if TYPE_CHECKING:  # pragma: no cover
+    # scikit-rf is slow to import, it is only loaded when it is needed
+    import skrf as rf
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+FREQUENCY_MULTIPLIERS = {"hz": 1.0, "khz": 1e3, "mhz": 1e6, "ghz": 1e9}
+FREQUENCY_UNITS = {"hz": "Hz", "khz": "kHz", "mhz": "MHz", "ghz": "GHz"}
+DATA_FORMATS = ("ri", "ma", "db")
+
+_COMMENT_RE = re.compile(r"!.*")
+_OPTION_RE = re.compile(r"^[ \t]*#(.*)$", re.MULTILINE)
+_KEYWORD_RE = re.compile(r"^[ \t]*\[", re.MULTILINE)
+_EXTENSION_RE = re.compile(r"\.s(\d+)p$", re.IGNORECASE)
+# Size in characters of the text read at once by the streaming reader
+_READ_HINT = 1 << 20
+# Complex values parsed at once when reading a band of a file
+_BAND_BLOCK = 1 << 16
+
+# Significant digits written by default, the precision of a double
+DEFAULT_DIGITS = 15
+# Most digits formatted with NumPy, more are formatted by printf
+_FAST_DIGITS = 15
+# Digits that write any double exactly
+_EXACT_DIGITS = 17
+# Complex values formatted at once by the writer
+_WRITE_BLOCK = 1 << 16
+# ASCII codes of the four digits of the numbers from 0 to 9999
+_DIGIT_CHARS = (
+    np.arange(10000)[:, None] // np.array([1000, 100, 10, 1]) % 10 + ord("0")
+).astype(np.uint8)
+# The same four ASCII codes as a single 32 bits word
+_DIGIT_WORDS = _DIGIT_CHARS.view(np.uint32).ravel()
+# Trailing zeros of the numbers from 0 to 9999, four for zero
+_TRAILING_ZEROS = sum(np.arange(10000) % 10**power == 0 for power in range(1, 5))
+
+
+class TouchstoneFormatError(ValueError):
+    """The file is not a Touchstone file the native reader can handle"""
+
+
+class TouchstoneData(NamedTuple):
+    """Raw content of a Touchstone file
+
+    Attributes:
+        frequency (np.ndarray): frequency points in Hz, shape (F,)
+        s (np.ndarray): complex S parameters, shape (F, N, N)
+        z0 (float): reference impedance
+        frequency_unit (str): frequency unit of the option line
+        data_format (str): data format of the option line (RI, MA or DB)
+        name (str): file name without path nor extension
+    """
+
+    frequency: np.ndarray
+    s: np.ndarray
+    z0: float
+    frequency_unit: str
+    data_format: str
+    name: str
+
+    @property
+    def number_of_ports(self) -> int:
+        return self.s.shape[1]
+
+
+def ports_from_filename(filename: str) -> int:
+    """Get the number of ports from the .sNp extension
+
+    Args:
+        filename (str): Touchstone file name
+
+    Raises:
+        TouchstoneFormatError: If the extension is not a .sNp one
+
+    Returns:
+        int: number of ports
+    """
+
+    match = _EXTENSION_RE.search(filename)
+    if match is None or int(match.group(1)) < 1:
+        raise TouchstoneFormatError("Unknown Touchstone extension: {}".format(filename))
+    return int(match.group(1))
+
+
+def parse_options(option_line: str) -> Tuple[str, str, str, float]:
+    """Parse the option line of a Touchstone file
+
+    Args:
+        option_line (str): option line without the leading ``#``
+
+    Raises:
+        TouchstoneFormatError: If the option line is not valid
+
+    Returns:
+        Tuple[str, str, str, float]: frequency unit, parameter, format and z0
+    """
+
+    unit, parameter, data_format, z0 = "ghz", "s", "ma", 50.0
+    tokens = option_line.lower().split()
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in FREQUENCY_MULTIPLIERS:
+            unit = token
+        elif token in DATA_FORMATS:
+            data_format = token
+        elif token in ("s", "y", "z", "g", "h"):
+            parameter = token
+        elif token == "r" and index + 1 < len(tokens):
+            index += 1
+            try:
+                z0 = float(tokens[index])
+            except ValueError:
+                raise TouchstoneFormatError(
+                    "Wrong reference impedance: {}".format(tokens[index])
+                )
+        else:
+            raise TouchstoneFormatError("Wrong option: {}".format(token))
+        index += 1
+    return (unit, parameter, data_format, z0)
+
+
+def to_complex(pairs: np.ndarray, data_format: str) -> np.ndarray:
+    """Convert pairs of real values into complex values
+
+    Args:
+        pairs (np.ndarray): array whose last dimension holds the two values
+        data_format (str): RI, MA or DB (case insensitive)
+
+    Returns:
+        np.ndarray: complex array with the last dimension removed
+    """
+
+    data_format = data_format.lower()
+    first, second = pairs[..., 0], pairs[..., 1]
+    if data_format == "ri":
+        return first + 1j * second
+    if data_format == "db":
+        first = np.power(10.0, first / 20.0)
+    return first * np.exp(1j * np.deg2rad(second))
+
+
+def band_slice(frequency: np.ndarray, fmin: float = None, fmax: float = None) -> slice:
+    """Frequency points inside a band
+
+    Args:
+        frequency (np.ndarray): increasing frequency points in Hz
+        fmin (float): lowest frequency in Hz, if none, no lower limit - optional
+        fmax (float): highest frequency in Hz, if none, no upper limit -
+            optional
+
+    Raises:
+        ValueError: If the band is empty
+
+    Returns:
+        slice: points between fmin and fmax, both included
+    """
+
+    if fmin is not None and fmax is not None and fmin > fmax:
+        raise ValueError("Wrong band: {} Hz is above {} Hz".format(fmin, fmax))
+    start = 0 if fmin is None else int(np.searchsorted(frequency, fmin, "left"))
+    stop = len(frequency)
+    if fmax is not None:
+        stop = int(np.searchsorted(frequency, fmax, "right"))
+    return slice(start, stop)
+
+
+def select_band(
+    data: TouchstoneData, fmin: float = None, fmax: float = None
+) -> TouchstoneData:
+    """Keep the frequency points of some data inside a band
+
+    Args:
+        data (TouchstoneData): content of a file
+        fmin (float): lowest frequency in Hz, if none, no lower limit - optional
+        fmax (float): highest frequency in Hz, if none, no upper limit -
+            optional
+
+    Raises:
+        ValueError: If the band is empty, or no point is inside it
+
+    Returns:
+        TouchstoneData: points inside the band
+    """
+
+    rows = band_slice(data.frequency, fmin, fmax)
+    if rows.start >= rows.stop:
+        raise ValueError(
+            "No frequency points of {} between {} and {} Hz".format(
+                data.name, fmin, fmax
+            )
+        )
+    return data._replace(frequency=data.frequency[rows], s=data.s[rows])
+
+
+def _parse_values(text: str, filename: str) -> np.ndarray:
+    """Parse the numbers of a piece of Touchstone text
+
+    Args:
+        text (str): Touchstone text, it may contain comments and option lines
+        filename (str): file name for the error messages
+
+    Raises:
+        TouchstoneFormatError: If there is anything else than numbers
+
+    Returns:
+        np.ndarray: flat array of values
+    """
+
+    if "!" in text:
+        text = _COMMENT_RE.sub("", text)
+    if _KEYWORD_RE.search(text) is not None:
+        raise TouchstoneFormatError("Touchstone keywords are not supported")
+    if "#" in text:
+        # Only the first option line is meaningful, the rest are ignored
+        text = _OPTION_RE.sub("", text)
+
+    with warnings.catch_warnings():
+        # Older numpy only warns on trailing garbage, newer ones raise
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=float, sep=" ")
+        except (ValueError, DeprecationWarning):
+            raise TouchstoneFormatError("Wrong numeric data in {}".format(filename))
+
+
+def _records_to_data(
+    records: np.ndarray,
+    unit: str,
+    data_format: str,
+    z0: float,
+    filename: str,
+) -> TouchstoneData:
+    """Convert the (F, 1 + 2 * N * N) records of a file into S parameters
+
+    Args:
+        records (np.ndarray): one row per frequency point
+        unit (str): frequency unit of the option line
+        data_format (str): data format of the option line
+        z0 (float): reference impedance
+        filename (str): Touchstone file name
+
+    Raises:
+        TouchstoneFormatError: If the frequency is not increasing
+
+    Returns:
+        TouchstoneData: content of the records
+    """
+
+    NumPorts = ports_from_filename(filename)
+    frequency = records[:, 0] * FREQUENCY_MULTIPLIERS[unit]
+    if np.any(np.diff(frequency) <= 0):
+        # Noise parameters, or a broken file
+        raise TouchstoneFormatError(
+            "Frequency is not increasing in {}".format(filename)
+        )
+
+    s = to_complex(records[:, 1:].reshape(-1, NumPorts, NumPorts, 2), data_format)
+    if NumPorts == 2:
+        # Two port files are stored as S11 S21 S12 S22
+        s = s.transpose(0, 2, 1)
+
+    return TouchstoneData(
+        frequency,
+        np.ascontiguousarray(s),
+        z0,
+        FREQUENCY_UNITS[unit],
+        data_format.upper(),
+        os.path.splitext(os.path.basename(filename))[0],
+    )
+
+
+def read_touchstone(
+    filename: str, fmin: float = None, fmax: float = None
+) -> TouchstoneData:
+    """Read a Touchstone v1 file with S parameters
+
+    Args:
+        filename (str): Touchstone file name
+        fmin (float): lowest frequency to read in Hz, if none, no lower
+            limit - optional
+        fmax (float): highest frequency to read in Hz, if none, no upper
+            limit - optional
+
+    Raises:
+        TouchstoneFormatError: If the file can not be read by this reader
+        ValueError: If the band is empty, or no point is inside it
+
+    Returns:
+        TouchstoneData: content of the file, inside the band if any
+    """
+
+    NumPorts = ports_from_filename(filename)
+    if fmin is not None or fmax is not None:
+        # Blocks of records, the ones outside the band are dropped at once
+        BlockSize = max(1, _BAND_BLOCK // (NumPorts * NumPorts))
+        blocks = list(iter_touchstone(filename, BlockSize, fmin, fmax))
+        if not blocks:
+            raise ValueError(
+                "No frequency points of {} between {} and {} Hz".format(
+                    filename, fmin, fmax
+                )
+            )
+        return blocks[0]._replace(
+            frequency=np.concatenate([block.frequency for block in blocks]),
+            s=np.concatenate([block.s for block in blocks]),
+        )
+    with open(filename, "r") as touchstone:
+        text = touchstone.read()
+
+    if "!" in text:
+        text = _COMMENT_RE.sub("", text)
+    options = _OPTION_RE.search(text)
+    unit, parameter, data_format, z0 = parse_options(
+        options.group(1) if options is not None else ""
+    )
+    if parameter != "s":
+        raise TouchstoneFormatError("Only S parameters are supported")
+    values = _parse_values(text, filename)
+
+    RecordLength = 1 + 2 * NumPorts * NumPorts
+    if values.size == 0 or values.size % RecordLength != 0:
+        raise TouchstoneFormatError(
+            "Wrong number of values in {}: {}".format(filename, values.size)
+        )
+    return _records_to_data(
+        values.reshape(-1, RecordLength), unit, data_format, z0, filename
+    )
+
+
+def _iter_network(
+    filename: str, chunk_size: int, fmin: float = None, fmax: float = None
+) -> Iterator[TouchstoneData]:
+    """Blocks of a file the native reader does not handle, read by scikit-rf
+
+    The blocks are cut as in :func:`iter_touchstone`, the whole file in blocks
+    of chunk_size points and then the band of every block, so the blocks of
+    files read by both readers match.
+
+    Args:
+        filename (str): Touchstone file name
+        chunk_size (int): frequency points per block
+        fmin (float): lowest frequency in Hz, if none, no lower limit
+        fmax (float): highest frequency in Hz, if none, no upper limit
+
+    Raises:
+        TouchstoneFormatError: If the reference impedance is not a single value
+        ValueError: If the band is empty
+
+    Yields:
+        TouchstoneData: consecutive blocks of the file, inside the band if any
+    """
+
+    import skrf as rf
+
+    network = rf.Network(filename)
+    if not np.all(network.z0 == network.z0[0, 0]):
+        raise TouchstoneFormatError(
+            "Only one reference impedance is supported in {}".format(filename)
+        )
+    for first in range(0, len(network.f), chunk_size):
+        frequency = network.f[first : first + chunk_size]
+        rows = band_slice(frequency, fmin, fmax)
+        if rows.start < rows.stop:
+            yield TouchstoneData(
+                frequency[rows],
+                network.s[first : first + chunk_size][rows],
+                network.z0[0, 0].real,
+                network.frequency.unit,
+                "RI",
+                network.name,
+            )
+        if fmax is not None and frequency[-1] >= fmax:
+            return
+
+
+def iter_touchstone(
+    filename: str, chunk_size: int, fmin: float = None, fmax: float = None
+) -> Iterator[TouchstoneData]:
+    """Read a Touchstone file in blocks of frequency points
+
+    Only the block being parsed is kept in memory. Files the native reader does
+    not handle are loaded with scikit-rf and then split in blocks.
+
+    With a band, the records outside it are dropped as soon as their block is
+    parsed and the file is not read any further after the first record above
+    the band, since Touchstone frequencies are increasing. The blocks then
+    have up to chunk_size points.
+
+    Args:
+        filename (str): Touchstone file name
+        chunk_size (int): frequency points per block
+        fmin (float): lowest frequency in Hz, if none, no lower limit -
+            optional
+        fmax (float): highest frequency in Hz, if none, no upper limit -
+            optional
+
+    Raises:
+        TouchstoneFormatError: If the data of the file is wrong
+        ValueError: If the band is empty
+
+    Yields:
+        TouchstoneData: consecutive blocks of the file, inside the band if any
+    """
+
+    NumPorts = ports_from_filename(filename)
+    RecordLength = 1 + 2 * NumPorts * NumPorts
+    ChunkLength = chunk_size * RecordLength
+    with open(filename, "r") as touchstone:
+        # The header ends with the first line holding numbers
+        options = None
+        content = first_line = ""
+        for line in touchstone:
+            content = _COMMENT_RE.sub("", line).strip()
+            if content.startswith("#"):
+                if options is None:
+                    options = content[1:]
+            elif content:
+                first_line = line
+                break
+        try:
+            if content.startswith("["):
+                raise TouchstoneFormatError("Touchstone keywords are not supported")
+            unit, parameter, data_format, z0 = parse_options(options or "")
+            if parameter != "s":
+                raise TouchstoneFormatError("Only S parameters are supported")
+        except TouchstoneFormatError as e:
+            _logger.debug("iter_touchstone: {}, using scikit-rf".format(e))
+            yield from _iter_network(filename, chunk_size, fmin, fmax)
+            return
+
+        pending = [_parse_values(first_line, filename)]
+        PendingLength = pending[0].size
+        LastFrequency = -np.inf
+        while True:
+            lines = touchstone.readlines(_READ_HINT)
+            if lines:
+                values = _parse_values("".join(lines), filename)
+                pending.append(values)
+                PendingLength += values.size
+            while PendingLength >= ChunkLength or (not lines and PendingLength > 0):
+                values = np.concatenate(pending)
+                NumRecords = min(chunk_size, values.size // RecordLength)
+                if NumRecords == 0:
+                    raise TouchstoneFormatError(
+                        "Wrong number of values in {}".format(filename)
+                    )
+                records = values[: NumRecords * RecordLength].reshape(-1, RecordLength)
+                frequency = records[:, 0] * FREQUENCY_MULTIPLIERS[unit]
+                if frequency[0] <= LastFrequency:
+                    raise TouchstoneFormatError(
+                        "Frequency is not increasing in {}".format(filename)
+                    )
+                LastFrequency = frequency[-1]
+                rows = band_slice(frequency, fmin, fmax)
+                if rows.start < rows.stop:
+                    yield _records_to_data(
+                        records[rows], unit, data_format, z0, filename
+                    )
+                if fmax is not None and LastFrequency >= fmax:
+                    # Everything after this block is above the band
+                    return
+                pending = [values[NumRecords * RecordLength :]]
+                PendingLength = pending[0].size
+            if not lines:
+                return
+
+
+def to_network(data: TouchstoneData) -> "rf.Network":
+    """Build a scikit-rf network from the raw Touchstone data
+
+    Args:
+        data (TouchstoneData): content of a Touchstone file
+
+    Returns:
+        rf.Network: equivalent network
+    """
+
+    import skrf as rf
+
+    frequency = rf.Frequency.from_f(data.frequency, unit="hz")
+    frequency.unit = data.frequency_unit
+    return rf.Network(frequency=frequency, s=data.s, z0=data.z0, name=data.name)
+
+
+def load_network(
+    filename: str, cache_dir: str = None, fmin: float = None, fmax: float = None
+) -> "rf.Network":
+    """Load a Touchstone file, falling back to scikit-rf if needed
+
+    With the parse cache, the whole file is cached and the band is taken from
+    its memory mapped arrays.
+
+    Args:
+        filename (str): Touchstone file name
+        cache_dir (str): directory of the parse cache, None to not use it
+        fmin (float): lowest frequency in Hz, if none, no lower limit -
+            optional
+        fmax (float): highest frequency in Hz, if none, no upper limit -
+            optional
+
+    Raises:
+        ValueError: If the band is empty, or no point is inside it
+
+    Returns:
+        rf.Network: network in the file, inside the band if any
+    """
+
+    try:
+        if cache_dir is None:
+            return to_network(read_touchstone(filename, fmin, fmax))
+        # Imported here since the cache module depends on this one
+        from stouchtool.cache import read_cached
+
+        data = read_cached(filename, cache_dir)
+        if fmin is not None or fmax is not None:
+            data = select_band(data, fmin, fmax)
+        return to_network(data)
+    except TouchstoneFormatError as e:
+        _logger.debug("load_network: {}, using scikit-rf for {}".format(e, filename))
+        import skrf as rf
+
+        network = rf.Network(filename)
+        rows = band_slice(network.f, fmin, fmax)
+        if rows.start >= rows.stop:
+            raise ValueError(
+                "No frequency points of {} between {} and {} Hz".format(
+                    filename, fmin, fmax
+                )
+            )
+        return network[rows]
+
+
+def from_complex(s: np.ndarray, data_format: str) -> np.ndarray:
+    """Convert complex values into pairs of real values, see :func:`to_complex`
+
+    Args:
+        s (np.ndarray): complex array
+        data_format (str): RI, MA or DB (case insensitive)
+
+    Returns:
+        np.ndarray: real array with a last dimension of the two values
+    """
+
+    data_format = data_format.lower()
+    if data_format == "ri":
+        return np.stack((s.real, s.imag), axis=-1)
+    magnitude = np.abs(s)
+    if data_format == "db":
+        # Zero is written as the smallest normal magnitude, not as -inf
+        magnitude = 20.0 * np.log10(np.maximum(magnitude, np.finfo(float).tiny))
+    return np.stack((magnitude, np.angle(s, deg=True)), axis=-1)
+
+
+def write_header(
+    output: TextIO,
+    NumPorts: int,
+    frequency_unit: str,
+    z0: float,
+    data_format: str = "ri",
+):
+    """Write the header of a Touchstone v1 file with S parameters
+
+    Args:
+        output (TextIO): opened output file
+        NumPorts (int): number of ports
+        frequency_unit (str): frequency unit of the data
+        z0 (float): reference impedance
+        data_format (str): RI, MA or DB - optional
+    """
+
+    output.write("! Created with STouchTool {}\n".format(__version__))
+    output.write("# {} S {} R {}\n".format(frequency_unit, data_format.upper(), z0))
+
+
+def _check_format(data_format: str, digits: int):
+    """Check the data format and significant digits of a writer
+
+    Args:
+        data_format (str): RI, MA or DB (case insensitive)
+        digits (int): number of significant digits
+
+    Raises:
+        ValueError: If the format is unknown or the digits are not between 1
+            and 17
+    """
+
+    if data_format.lower() not in DATA_FORMATS:
+        raise ValueError("Unknown data format: {}".format(data_format))
+    if not 1 <= digits <= _EXACT_DIGITS:
+        raise ValueError(
+            "Wrong number of digits: {}, it must be between 1 and {}".format(
+                digits, _EXACT_DIGITS
+            )
+        )
+
+
+def _line_starts(NumPorts: int) -> np.ndarray:
+    """Values of a record that start a new line
+
+    Two port records go in a single line. Otherwise every row of the matrix
+    starts a new line, with at most four complex values per line.
+
+    Args:
+        NumPorts (int): number of ports
+
+    Returns:
+        np.ndarray: boolean mask of the 2 * N * N values of a record
+    """
+
+    pair = np.arange(NumPorts * NumPorts)
+    starts = (pair > 0) & (pair % NumPorts % 4 == 0) & (NumPorts > 2)
+    # Only the real part of a complex value can start a line
+    return np.stack((starts, np.zeros_like(starts)), axis=-1).ravel()
+
+
+def _record_format(NumPorts: int, digits: int = _EXACT_DIGITS) -> str:
+    """printf style format of one frequency point, see :func:`_line_starts`
+
+    Args:
+        NumPorts (int): number of ports
+        digits (int): significant digits of the values - optional
+
+    Returns:
+        str: format for the frequency and the 2 * N * N values of a record
+    """
+
+    number = "%.{}g".format(digits)
+    separators = np.where(_line_starts(NumPorts), "\n ", " ")
+    # The shortest exact text of the frequency, like repr
+    return "%r" + "".join(separator + number for separator in separators) + "\n"
+
+
+def _scale(values: np.ndarray, power: np.ndarray) -> np.ndarray:
+    """Multiply by powers of ten, rounding once if they are exact doubles
+
+    Args:
+        values (np.ndarray): numbers
+        power (np.ndarray): integer powers of ten of every number
+
+    Returns:
+        np.ndarray: values * 10 ** power
+    """
+
+    # Powers of ten up to 1e22 are exact, multiplying or dividing by one of
+    # them is correctly rounded
+    up = np.clip(power, 0, 22)
+    down = np.clip(-power, 0, 22)
+    scaled = values * 10.0**up / 10.0**down
+    rest = power - up + down
+    if rest.any():
+        scaled *= 10.0**rest
+    return scaled
+
+
+def _printf_mantissas(
+    magnitude: np.ndarray, digits: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Mantissas and exponents of positive numbers, rounded by printf
+
+    Args:
+        magnitude (np.ndarray): positive numbers, shape (M,)
+        digits (int): significant digits
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: integer mantissas of the digits, as
+            floats, and exponents
+    """
+
+    texts = ["%.*e" % (digits - 1, value) for value in magnitude.tolist()]
+    mantissa = [float(text[0] + text[2 : digits + 1]) for text in texts]
+    exponent = [int(text.partition("e")[2]) for text in texts]
+    return (np.array(mantissa), np.array(exponent, dtype=np.int64))
+
+
+def _format_numbers(values: np.ndarray, digits: int) -> Tuple[np.ndarray, np.ndarray]:
+    """ASCII codes of numbers in scientific notation, without trailing zeros
+
+    All the numbers take the same number of characters, with a mask of the
+    ones to keep, so an array is formatted with NumPy integer arithmetic
+    instead of one Python call per number. The numbers are like the ones of
+    printf ``%.{digits}e``, without the trailing zeros, the exponent when it
+    is zero and the sign when positive, and rounded the same. The scaling by a
+    power of ten is rounded too, so the few numbers too close to a half unit
+    of the last digit are rounded by printf.
+
+    Args:
+        values (np.ndarray): finite numbers between 1e-290 and 1e290 or zero,
+            shape (M,)
+        digits (int): significant digits, at most 15 so the mantissas are
+            exact in double precision
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (M, digits + 7) uint8 ASCII codes and
+            boolean mask of the characters to keep
+    """
+
+    magnitude = np.abs(values)
+    nonzero = magnitude > 0
+    exponent = np.floor(np.log10(np.where(nonzero, magnitude, 1.0))).astype(np.int64)
+    low = 10 ** (digits - 1)
+    scaled = _scale(magnitude, digits - 1 - exponent)
+    mantissa = np.rint(scaled)
+    # log10 may be one off next to the powers of ten
+    wrong = nonzero & ((mantissa < low) | (mantissa >= 10 * low))
+    if wrong.any():
+        exponent[wrong] += np.where(mantissa[wrong] < low, -1, 1)
+        scaled[wrong] = _scale(magnitude[wrong], digits - 1 - exponent[wrong])
+        mantissa[wrong] = np.rint(scaled[wrong])
+    # A scaled number this close to a half unit may be on the wrong side of
+    # it: _scale rounds once, by half a unit in the last place, up to powers
+    # of 1e22, and a few times past them
+    error = np.where(np.abs(digits - 1 - exponent) > 22, 2.0, 0.5)
+    ambiguous = np.abs(scaled - np.floor(scaled) - 0.5) <= error * np.spacing(scaled)
+    ambiguous &= nonzero
+    if ambiguous.any():
+        mantissa[ambiguous], exponent[ambiguous] = _printf_mantissas(
+            magnitude[ambiguous], digits
+        )
+    # Rounding up to the next power of ten, like 9.99 to 2 digits
+    carry = mantissa >= 10 * low
+    exponent[carry] += 1
+    mantissa[carry] = low
+    mantissa = mantissa.astype(np.int64)
+
+    width = digits + 7
+    chars = np.empty((len(values), width), dtype=np.uint8)
+    keep = np.ones((len(values), width), dtype=bool)
+    chars[:, 0] = ord("-")
+    keep[:, 0] = values < 0
+    # Groups of four digits, from the least significant one
+    groups = []
+    for _ in range(-(-digits // 4)):
+        mantissa, group = np.divmod(mantissa, 10000)
+        groups.append(group)
+    # Four ASCII codes at once, as one 32 bits word per group
+    words = np.empty((len(values), len(groups)), dtype=np.uint32)
+    for index, group in enumerate(reversed(groups)):
+        np.take(_DIGIT_WORDS, group, out=words[:, index])
+    mantissa_chars = words.view(np.uint8)[:, -digits:]
+    chars[:, 1] = mantissa_chars[:, 0]
+    chars[:, 2] = ord(".")
+    chars[:, 3 : digits + 2] = mantissa_chars[:, 1:]
+    # Fraction digits up to the last non zero one
+    trailing = _TRAILING_ZEROS[groups[0]]
+    for index, group in enumerate(groups[1:], 1):
+        trailing = np.where(
+            trailing == 4 * index, 4 * index + _TRAILING_ZEROS[group], trailing
+        )
+    significant = digits - trailing
+    keep[:, 3 : digits + 2] = np.arange(1, digits) < significant[:, None]
+    keep[:, 2] = significant > 1
+
+    exponent[~nonzero] = 0
+    chars[:, digits + 2] = ord("e")
+    chars[:, digits + 3] = np.where(exponent < 0, ord("-"), ord("+"))
+    exponent_chars = _DIGIT_WORDS[np.abs(exponent)][:, None].view(np.uint8)
+    chars[:, digits + 4 :] = exponent_chars[:, 1:]
+    keep[:, digits + 4] = np.abs(exponent) >= 100
+    keep[:, digits + 2 :] &= (exponent != 0)[:, None]
+    return (chars, keep)
+
+
+def _format_records(frequency: np.ndarray, values: np.ndarray, digits: int) -> str:
+    """Text of a block of records
+
+    The frequencies are always exact, the values have the given digits.
+
+    Args:
+        frequency (np.ndarray): frequency points in the unit of the file,
+            shape (R,)
+        values (np.ndarray): values of every record in file order, shape
+            (R, 2 * N * N)
+        digits (int): significant digits of the values
+
+    Returns:
+        str: records, one or more lines each
+    """
+
+    NumRecords, NumValues = values.shape
+    NumPorts = int(round(np.sqrt(NumValues // 2)))
+    magnitude = np.abs(values[values != 0])
+    if (
+        digits > _FAST_DIGITS
+        or not np.all(np.isfinite(values))
+        or not np.all(np.isfinite(frequency))
+        or (magnitude.size and (magnitude.min() < 1e-290 or magnitude.max() > 1e290))
+    ):
+        # One printf call for the whole block, exact up to 17 digits
+        record = _record_format(NumPorts, digits)
+        return (record * NumRecords) % tuple(
+            np.column_stack((frequency, values)).ravel().tolist()
+        )
+
+    # Shortest text reading back as the same frequency, so files combined
+    # later have exactly the same frequency points
+    frequency_chars = (
+        np.array([repr(point) for point in frequency.tolist()], dtype="S32")
+        .view(np.uint8)
+        .reshape(NumRecords, -1)
+    )
+    frequency_keep = frequency_chars != 0
+    value_chars, value_keep = _format_numbers(values.ravel(), digits)
+    # Every value is preceded by a space, or by a new line and a space
+    starts = _line_starts(NumPorts)
+    width = digits + 9
+    fields = np.empty((NumRecords, NumValues, width), dtype=np.uint8)
+    keep = np.empty((NumRecords, NumValues, width), dtype=bool)
+    fields[:, :, 0] = np.where(starts, ord("\n"), ord(" "))
+    keep[:, :, 0] = True
+    fields[:, :, 1] = ord(" ")
+    keep[:, :, 1] = starts
+    fields[:, :, 2:] = value_chars.reshape(NumRecords, NumValues, -1)
+    keep[:, :, 2:] = value_keep.reshape(NumRecords, NumValues, -1)
+
+    chars = np.concatenate(
+        (
+            frequency_chars,
+            fields.reshape(NumRecords, -1),
+            np.full((NumRecords, 1), ord("\n"), dtype=np.uint8),
+        ),
+        axis=1,
+    )
+    keep = np.concatenate(
+        (
+            frequency_keep,
+            keep.reshape(NumRecords, -1),
+            np.ones((NumRecords, 1), dtype=bool),
+        ),
+        axis=1,
+    )
+    return chars[keep].tobytes().decode("ascii")
+
+
+def write_records(
+    output: TextIO,
+    frequency: np.ndarray,
+    s: np.ndarray,
+    frequency_unit: str,
+    data_format: str = "ri",
+    digits: int = DEFAULT_DIGITS,
+):
+    """Write S parameters as Touchstone v1 records
+
+    The values are formatted a block of records at a time. Up to 15 digits,
+    the precision of a double, the numbers are built with NumPy arithmetic,
+    rounded as by printf, and numbers read from a file with up to 15 digits
+    are written back unchanged. 16 and 17 digits are slower, but exact for any
+    double.
+
+    Args:
+        output (TextIO): opened output file, after :func:`write_header`
+        frequency (np.ndarray): frequency points in Hz, shape (F,)
+        s (np.ndarray): complex S parameters, shape (F, N, N)
+        frequency_unit (str): frequency unit of the header
+        data_format (str): RI, MA or DB, as in the header - optional
+        digits (int): significant digits of the values, from 1 to 17, the
+            frequency is written with the digits needed to read it back
+            unchanged in the unit of the file - optional
+
+    Raises:
+        ValueError: If the data format or the number of digits is not valid
+    """
+
+    _check_format(data_format, digits)
+    NumPoints, NumPorts = s.shape[:2]
+    if NumPorts == 2:
+        # Two port files are stored as S11 S21 S12 S22
+        s = s.transpose(0, 2, 1)
+    frequency = frequency / FREQUENCY_MULTIPLIERS[frequency_unit.lower()]
+    BlockSize = max(1, _WRITE_BLOCK // (NumPorts * NumPorts))
+    for first in range(0, NumPoints, BlockSize):
+        block = s[first : first + BlockSize]
+        values = from_complex(block, data_format).reshape(len(block), -1)
+        output.write(
+            _format_records(frequency[first : first + BlockSize], values, digits)
+        )
+
+
+def write_touchstone(
+    filename: str,
+    frequency: np.ndarray,
+    s: np.ndarray,
+    z0: float = 50.0,
+    frequency_unit: str = "Hz",
+    data_format: str = "ri",
+    digits: int = DEFAULT_DIGITS,
+):
+    """Write a Touchstone v1 file
+
+    Args:
+        filename (str): output file name, with the .sNp extension
+        frequency (np.ndarray): frequency points in Hz, shape (F,)
+        s (np.ndarray): complex S parameters, shape (F, N, N)
+        z0 (float): reference impedance - optional
+        frequency_unit (str): frequency unit of the file - optional
+        data_format (str): RI, MA or DB - optional
+        digits (int): significant digits of the values, see
+            :func:`write_records` - optional
+
+    Raises:
+        ValueError: If the data format or the number of digits is not valid
+    """
+
+    _check_format(data_format, digits)
+    with open(filename, "w") as output:
+        write_header(output, s.shape[1], frequency_unit, z0, data_format)
+        write_records(output, frequency, s, frequency_unit, data_format, digits)
+
+
+def write_network(
+    network: "rf.Network",
+    filename: str,
+    data_format: str = "ri",
+    digits: int = DEFAULT_DIGITS,
+):
+    """Write a network as a Touchstone v1 file
+
+    Args:
+        network (rf.Network): network to write
+        filename (str): output file name, with the .sNp extension
+        data_format (str): RI, MA or DB - optional
+        digits (int): significant digits of the values, see
+            :func:`write_records` - optional
+
+    Raises:
+        ValueError: If the data format or the number of digits is not valid,
+            or if the network has not a single real reference impedance
+    """
+
+    _check_format(data_format, digits)
+    z0 = network.z0
+    if np.any(z0 != z0.flat[0]) or z0.flat[0].imag != 0:
+        raise ValueError(
+            "Touchstone v1 files need a single real reference impedance: {}".format(
+                filename
+            )
+        )
+    write_touchstone(
+        filename,
+        network.f,
+        network.s,
+        z0.flat[0].real,
+        FREQUENCY_UNITS[network.frequency.unit.lower()],
+        data_format,
+        digits,
+    )
@@ -0,0 +1,462 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+Passivity and reciprocity of n port S parameters.
+
+A network is passive when no frequency point has a singular value of its S
+matrix above one, and reciprocal when S is symmetric. A :class:`Validation`
+checks both on whole (F, N, N) arrays, and reports the frequency ranges where
+they are violated.
+
+The largest singular values come from a single batched SVD. Its cost is
+avoided for the points whose S matrix is bounded below the limit by the
+product of its largest row and column sums, sqrt(|S|_1 |S|_inf), which is
+never smaller than the largest singular value, so the violations are still
+exact. Reciprocity is the largest |Sij - Sji| of every point. Both are
+computed in blocks of frequency points that fit in cache, and long files are
+read a block at a time, so memory is bounded by the block size.
+
+The ``s_check`` command checks Touchstone files, and ``s_cat --validate``
+checks the n port it writes.
+
+Example::
+
+    validation = Validation(passivity_tolerance=1e-3)
+    validation.update(network.f, network.s)
+    print("\\n".join(validation.report()))
+"""
+
+import argparse
+import logging
+import sys
+from typing import List, NamedTuple
+
+import numpy as np
+
+from stouchtool import __version__
+from stouchtool.touchstone import iter_touchstone
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+# Frequency points of every batched operation, bounding its temporary arrays
+# and keeping them in cache
+_BLOCK = 1024
+# Frequency points read at a time by s_check
+DEFAULT_CHUNK = 1 << 14
+
+
+class Violation(NamedTuple):
+    """Consecutive frequency points violating a property
+
+    Attributes:
+        start (float): first frequency in Hz
+        stop (float): last frequency in Hz
+        points (int): number of frequency points
+        worst (float): largest singular value, or largest asymmetry
+        frequency (float): frequency of the worst value in Hz
+    """
+
+    start: float
+    stop: float
+    points: int
+    worst: float
+    frequency: float
+
+
+def largest_singular_values(s: np.ndarray, limit: float = None) -> np.ndarray:
+    """Largest singular value of the S matrix of every frequency point
+
+    Args:
+        s (np.ndarray): S parameters, shape (F, N, N)
+        limit (float): only the points whose upper bound is above it are
+            computed exactly, the others get their bound, which is not above
+            it, None to compute all of them - optional
+
+    Returns:
+        np.ndarray: largest singular values, or their bound, shape (F,)
+    """
+
+    values = np.empty(len(s))
+    for start in range(0, len(s), _BLOCK):
+        magnitude = np.abs(s[start : start + _BLOCK])
+        values[start : start + _BLOCK] = np.sqrt(
+            magnitude.sum(axis=1).max(axis=1) * magnitude.sum(axis=2).max(axis=1)
+        )
+    if limit is None:
+        exact = np.arange(len(s))
+    else:
+        exact = np.flatnonzero(values > limit)
+    for start in range(0, len(exact), _BLOCK):
+        rows = exact[start : start + _BLOCK]
+        values[rows] = np.linalg.svd(s[rows], compute_uv=False)[:, 0]
+    return values
+
+
+def asymmetry(s: np.ndarray) -> np.ndarray:
+    """Largest difference between the S parameters of both directions
+
+    Args:
+        s (np.ndarray): S parameters, shape (F, N, N)
+
+    Returns:
+        np.ndarray: largest |Sij - Sji| of every frequency point, shape (F,)
+    """
+
+    values = np.empty(len(s))
+    for start in range(0, len(s), _BLOCK):
+        block = s[start : start + _BLOCK]
+        # Both triangles, faster than gathering one of them
+        values[start : start + _BLOCK] = (
+            np.abs(block - block.transpose(0, 2, 1)).reshape(len(block), -1).max(axis=1)
+        )
+    return values
+
+
+def violation_ranges(
+    frequency: np.ndarray, values: np.ndarray, limit: float
+) -> List[Violation]:
+    """Consecutive frequency points whose values are above a limit
+
+    Args:
+        frequency (np.ndarray): frequency points in Hz, shape (F,)
+        values (np.ndarray): values of every point, shape (F,)
+        limit (float): largest value allowed
+
+    Returns:
+        List[Violation]: ranges of points above the limit, in order
+    """
+
+    above = np.concatenate(([False], values > limit, [False]))
+    edges = np.flatnonzero(above[1:] != above[:-1])
+    ranges = []
+    for start, stop in zip(edges[::2], edges[1::2]):
+        worst = start + int(values[start:stop].argmax())
+        ranges.append(
+            Violation(
+                float(frequency[start]),
+                float(frequency[stop - 1]),
+                int(stop - start),
+                float(values[worst]),
+                float(frequency[worst]),
+            )
+        )
+    return ranges
+
+
+def _merge(
+    violations: List[Violation], ranges: List[Violation], first: float, open: bool
+):
+    """Append the ranges of a block, joining a range continuing the last one
+
+    Args:
+        violations (List[Violation]): ranges of the previous blocks, updated
+        ranges (List[Violation]): ranges of the block
+        first (float): first frequency of the block in Hz
+        open (bool): if the last point of the previous block was a violation
+    """
+
+    if open and ranges and ranges[0].start == first:
+        last, joined = violations.pop(), ranges[0]
+        worst = last if last.worst >= joined.worst else joined
+        ranges[0] = Violation(
+            last.start,
+            joined.stop,
+            last.points + joined.points,
+            worst.worst,
+            worst.frequency,
+        )
+    violations.extend(ranges)
+
+
+class Validation:
+    """Passivity and reciprocity of a network, checked in blocks
+
+    Args:
+        passivity_tolerance (float): margin of the largest singular value
+            over one - optional
+        reciprocity_tolerance (float): largest |Sij - Sji| allowed - optional
+
+    Raises:
+        ValueError: If a tolerance is negative
+    """
+
+    def __init__(
+        self, passivity_tolerance: float = 1e-6, reciprocity_tolerance: float = 1e-3
+    ):
+        if not passivity_tolerance >= 0:
+            raise ValueError(
+                "Wrong passivity tolerance: {}".format(passivity_tolerance)
+            )
+        if not reciprocity_tolerance >= 0:
+            raise ValueError(
+                "Wrong reciprocity tolerance: {}".format(reciprocity_tolerance)
+            )
+        self.passivity_tolerance = passivity_tolerance
+        self.reciprocity_tolerance = reciprocity_tolerance
+        self.start()
+
+    def start(self):
+        """Start checking a network, forgetting the previous one"""
+
+        self.points = 0
+        self.passivity: List[Violation] = []
+        self.reciprocity: List[Violation] = []
+        self._open = (False, False)
+
+    def update(self, frequency: np.ndarray, s: np.ndarray):
+        """Check the next block of frequency points
+
+        Args:
+            frequency (np.ndarray): increasing frequency points in Hz, shape (F,)
+            s (np.ndarray): S parameters, shape (F, N, N)
+        """
+
+        if len(frequency) == 0:
+            return
+        passivity_limit = 1 + self.passivity_tolerance
+        gains = largest_singular_values(s, passivity_limit)
+        asymmetries = asymmetry(s)
+        _merge(
+            self.passivity,
+            violation_ranges(frequency, gains, passivity_limit),
+            frequency[0],
+            self._open[0],
+        )
+        _merge(
+            self.reciprocity,
+            violation_ranges(frequency, asymmetries, self.reciprocity_tolerance),
+            frequency[0],
+            self._open[1],
+        )
+        self._open = (
+            bool(gains[-1] > passivity_limit),
+            bool(asymmetries[-1] > self.reciprocity_tolerance),
+        )
+        self.points += len(frequency)
+
+    def passed(self) -> bool:
+        """If no frequency point violates passivity nor reciprocity
+
+        Returns:
+            bool: True if the network is passive and reciprocal
+        """
+
+        return not self.passivity and not self.reciprocity
+
+    def report(self) -> List[str]:
+        """Lines describing the violations
+
+        Returns:
+            List[str]: one line for every property, followed by its ranges
+        """
+
+        lines = []
+        for name, value, violations in (
+            ("Passivity", "singular value", self.passivity),
+            ("Reciprocity", "|Sij - Sji|", self.reciprocity),
+        ):
+            if not violations:
+                lines.append("{}: passed, {} points".format(name, self.points))
+                continue
+            worst = max(violations, key=lambda violation: violation.worst)
+            lines.append(
+                "{}: violated at {} of {} points, largest {} {:.6g} at {:g} Hz".format(
+                    name,
+                    sum(violation.points for violation in violations),
+                    self.points,
+                    value,
+                    worst.worst,
+                    worst.frequency,
+                )
+            )
+            for violation in violations:
+                lines.append(
+                    "    from {:g} to {:g} Hz, {} points, up to {:.6g}".format(
+                        violation.start,
+                        violation.stop,
+                        violation.points,
+                        violation.worst,
+                    )
+                )
+        return lines
+
+
+def check_file(
+    filename: str,
+    validation: Validation,
+    chunk: int = DEFAULT_CHUNK,
+    fmin: float = None,
+    fmax: float = None,
+) -> bool:
+    """Check a Touchstone file, reading it in blocks
+
+    Args:
+        filename (str): Touchstone file name
+        validation (Validation): validation, started again for the file
+        chunk (int): frequency points read at a time - optional
+        fmin (float): lowest frequency in Hz, None for no lower limit -
+            optional
+        fmax (float): highest frequency in Hz, None for no upper limit -
+            optional
+
+    Raises:
+        ValueError: If the file can not be read
+        OSError: If the file can not be opened
+
+    Returns:
+        bool: True if the file is passive and reciprocal
+    """
+
+    if chunk < 1:
+        raise ValueError("Wrong chunk size: {}".format(chunk))
+    validation.start()
+    for block in iter_touchstone(filename, chunk, fmin, fmax):
+        validation.update(block.frequency, block.s)
+    return validation.passed()
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    """Parse command line parameters
+
+    Args:
+        args (List[str]): command line parameters as list of strings
+
+    Returns:
+        :obj:`argparse.Namespace`: command line parameters namespace
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Check the passivity and reciprocity of S params"
+    )
+    parser.add_argument(
+        "--version",
+        action="version",
+        version="RFTools {ver}".format(ver=__version__),
+    )
+    parser.add_argument(
+        dest="inputfiles",
+        help="Input files with touchstone params",
+        type=str,
+        nargs="+",
+        metavar="INPUT_FILE",
+    )
+    parser.add_argument(
+        "--passivity-tolerance",
+        dest="passivity_tolerance",
+        help="Margin of the largest singular value over one, default is 1e-6",
+        type=float,
+        default=1e-6,
+        metavar="TOLERANCE",
+    )
+    parser.add_argument(
+        "--reciprocity-tolerance",
+        dest="reciprocity_tolerance",
+        help="Largest |Sij - Sji| allowed, default is 1e-3",
+        type=float,
+        default=1e-3,
+        metavar="TOLERANCE",
+    )
+    parser.add_argument(
+        "--chunk",
+        dest="chunk",
+        help="Read the input files in blocks of CHUNK frequency points, default "
+        "is {}".format(DEFAULT_CHUNK),
+        type=int,
+        default=DEFAULT_CHUNK,
+        metavar="CHUNK",
+    )
+    parser.add_argument(
+        "--fmin",
+        dest="fmin",
+        help="Lowest frequency in Hz, the points below it are skipped",
+        type=float,
+        metavar="FMIN",
+    )
+    parser.add_argument(
+        "--fmax",
+        dest="fmax",
+        help="Highest frequency in Hz, the input files are not read after it",
+        type=float,
+        metavar="FMAX",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action="store_const",
+        const=logging.INFO,
+    )
+    parser.add_argument(
+        "-vv",
+        "--very-verbose",
+        dest="loglevel",
+        help="set loglevel to DEBUG",
+        action="store_const",
+        const=logging.DEBUG,
+    )
+    return parser.parse_args(args)
+
+
+def setup_logging(loglevel: int):
+    """setup logging
+
+    Args:
+        loglevel (int): minimum loglevel for emitting messages
+    """
+
+    logformat = "[%(asctime)s] %(levelname)s:%(name)s:%(message)s"
+    logging.basicConfig(
+        level=loglevel, stream=sys.stdout, format=logformat, datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+
+def main(arguments: List[str]):
+    """Check files from the command line, the exit status is 1 if any fails
+
+    Args:
+        arguments (List[str]): command line parameters as list of strings
+    """
+
+    args = parse_args(arguments)
+    setup_logging(args.loglevel)
+    try:
+        validation = Validation(args.passivity_tolerance, args.reciprocity_tolerance)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    failed = 0
+    for inputfile in args.inputfiles:
+        try:
+            passed = check_file(inputfile, validation, args.chunk, args.fmin, args.fmax)
+        except (OSError, ValueError) as e:
+            failed += 1
+            print("{}: {}".format(inputfile, e))
+            continue
+        if not passed:
+            failed += 1
+        print("{}: {}".format(inputfile, "passed" if passed else "failed"))
+        for line in validation.report():
+            print("  " + line)
+    if failed:
+        print("{} of {} files failed".format(failed, len(args.inputfiles)))
+        sys.exit(1)
+
+
+def run():
+    """Calls :func:`main` passing the CLI arguments extracted from :obj:`sys.argv`
+
+    This function can be used as entry point to create console scripts with setuptools.
+    """
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
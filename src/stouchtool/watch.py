@@ -0,0 +1,564 @@
+# Copyright (c) 2021 Jesús Lázaro
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""
+Watch a directory and concatenate and plot the new groups of two port files.
+
+The directory is polled, only listing it and checking the size and
+modification time of the files matching the naming pattern, so it works on
+network shares too. The pattern is a regular expression with a ``group``
+named group, the name of the n port, and optionally ``first`` and ``second``
+named groups with the one based ports of the pair of every file. A group is
+processed when it has all its n (n - 1) / 2 files and none of them changed for
+the settle time, so files still being written are not read. A group that can
+not make an n port, with too many files or a pair measured twice, fails at
+once. Files whose
+modification time is older than the settle time are settled at once, e.g.
+after a restart.
+
+Every group is concatenated with :func:`~stouchtool.s_cat.cat_networks`, and
+the n port is plotted from memory, in a bounded pool of worker processes. The
+groups done or failed are kept in a state file with the size and modification
+time of their files, so they are only processed again if they change, also
+after a restart.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from stouchtool import __version__
+from stouchtool.s_cat import cat_networks, map_port_pairs, number_of_files
+from stouchtool.s_plot import OUTPUT_FORMATS, s_plot
+from stouchtool.touchstone import write_network
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+# File names like dut_p1_12.s2p, the ports separated so they are unambiguous
+DEFAULT_PATTERN = r"(?P<group>.+)_[pP](?P<first>\d+)_(?P<second>\d+)\.[sS]2[pP]"
+STATE_NAME = ".stouchtool_watch.json"
+
+
+class GroupResult(NamedTuple):
+    """Outcome of the processing of a group
+
+    Attributes:
+        group (str): name of the group
+        nport (str): n port file name, None if it failed
+        plot (str): plot file name, None if not plotted or failed
+        error (str): error message, None if it succeeded
+    """
+
+    group: str
+    nport: str
+    plot: str
+    error: str
+
+
+def process_group(
+    group: str,
+    inputfiles: List[str],
+    NumPorts: int,
+    output_dir: str,
+    plot_format: str = "pdf",
+    pattern: str = None,
+) -> GroupResult:
+    """Concatenate and plot a group, catching its errors
+
+    Args:
+        group (str): name of the group, used for the output files and title
+        inputfiles (List[str]): two port files, in the order of
+            :func:`~stouchtool.s_cat.port_pairs` unless a pair pattern is given
+        NumPorts (int): number of ports
+        output_dir (str): directory of the output files
+        plot_format (str): format of the plot, None to not plot - optional
+        pattern (str): pair pattern of the file names, see
+            :func:`~stouchtool.s_cat.map_port_pairs` - optional
+
+    Returns:
+        GroupResult: output files or error
+    """
+
+    nport = os.path.join(output_dir, "{}.s{}p".format(group, NumPorts))
+    plot = None
+    try:
+        network = cat_networks(inputfiles, NumPorts, pattern=pattern)
+        write_network(network, nport)
+        if plot_format is not None:
+            plot = os.path.join(output_dir, "{}.{}".format(group, plot_format))
+            s_plot(network, plot, group)
+    except Exception as e:
+        _logger.debug("Group {} failed: {}".format(group, e))
+        return GroupResult(group, None, None, str(e))
+    return GroupResult(group, nport, plot, None)
+
+
+class Watcher:
+    """Groups of two port files of a directory and their processing
+
+    Args:
+        directory (str): watched directory
+        NumPorts (int): number of ports of every group
+        pattern (str): regular expression matching the whole file names -
+            optional
+        output_dir (str): directory of the output files, if none, the watched
+            one - optional
+        settle (float): seconds a file must not change to be read - optional
+        jobs (int): number of worker processes, 1 to process the groups in
+            this process, None or 0 for one per CPU - optional
+        plot_format (str): format of the plots, None to not plot - optional
+        state (str): state file name, if none, ``.stouchtool_watch.json`` in
+            the output directory - optional
+
+    Raises:
+        ValueError: If the pattern or the number of ports are not valid
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        NumPorts: int,
+        pattern: str = DEFAULT_PATTERN,
+        output_dir: str = None,
+        settle: float = 2.0,
+        jobs: int = 1,
+        plot_format: str = "pdf",
+        state: str = None,
+    ):
+        try:
+            self.pattern = re.compile(pattern)
+        except re.error as e:
+            raise ValueError("Wrong pattern {}: {}".format(pattern, e)) from e
+        if "group" not in self.pattern.groupindex:
+            raise ValueError("The pattern has no group named group: {}".format(pattern))
+        # Pair pattern of the whole base names, as matched when scanning
+        self._pair_pattern = (
+            r"\A(?:{})\Z".format(pattern)
+            if {"first", "second"} <= set(self.pattern.groupindex)
+            else None
+        )
+        if NumPorts is None or NumPorts < 2:
+            raise ValueError("Wrong number of ports: {}".format(NumPorts))
+        if plot_format is not None and plot_format not in OUTPUT_FORMATS:
+            raise ValueError("Unknown plot format: {}".format(plot_format))
+        self.directory = directory
+        self.NumPorts = NumPorts
+        self.output_dir = output_dir or directory
+        self.settle = settle
+        self.plot_format = plot_format
+        self.state_file = state or os.path.join(self.output_dir, STATE_NAME)
+        if jobs is None or jobs < 1:
+            jobs = os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        self._running: Dict[str, Tuple[list, Future]] = {}
+        # Path to size, modification time and time they were first seen
+        self._seen: Dict[str, Tuple[int, int, float]] = {}
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        """Groups already processed, from the state file
+
+        Returns:
+            dict: for every group, the signature of its files and the result
+        """
+
+        try:
+            with open(self.state_file, "r") as state:
+                return json.load(state)
+        except (OSError, ValueError) as e:
+            _logger.debug("Watcher: no state in {}: {}".format(self.state_file, e))
+            return {}
+
+    def _save_state(self):
+        """Save the state file, atomically"""
+
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        handle, tmpname = tempfile.mkstemp(prefix=".", dir=directory)
+        try:
+            with os.fdopen(handle, "w") as state:
+                json.dump(self.state, state, indent=1)
+            os.replace(tmpname, self.state_file)
+        except OSError:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+
+    def _order(self, group: str, files: Dict[str, re.Match]) -> Optional[List[str]]:
+        """Files of a complete group in the order of the port pairs
+
+        Args:
+            group (str): name of the group
+            files (Dict[str, re.Match]): path and match of every file
+
+        Raises:
+            ValueError: If the group has too many files, or a pair is repeated,
+                also reversed, or out of the ports
+
+        Returns:
+            Optional[List[str]]: paths, None if the group is not complete
+        """
+
+        NumFiles = number_of_files(self.NumPorts)
+        if len(files) < NumFiles:
+            return None
+        paths = sorted(files)
+        if self._pair_pattern is None:
+            if len(files) > NumFiles:
+                raise ValueError(
+                    "Group {} has {} files, {} expected".format(
+                        group, len(files), NumFiles
+                    )
+                )
+            return paths
+        order, _ = map_port_pairs(paths, self._pair_pattern, self.NumPorts)
+        return [paths[index] for index in order]
+
+    def _fail(self, group: str, signature: list, error: str):
+        """Record a group that can not be processed, as a finished one
+
+        Args:
+            group (str): name of the group
+            signature (list): path, size and modification time of its files
+            error (str): error message
+        """
+
+        _logger.warning("Group {} failed: {}".format(group, error))
+        future = Future()
+        future.set_result(GroupResult(group, None, None, error))
+        self._running[group] = (signature, future)
+
+    def scan(self, now: float = None) -> Tuple[Dict[str, list], int]:
+        """Groups ready to be processed
+
+        The groups that can not make an n port are failed at once, their
+        results are collected by :meth:`poll`.
+
+        Args:
+            now (float): current time, as :func:`time.monotonic` - optional
+
+        Returns:
+            Tuple[Dict[str, list], int]: files and signature of every ready
+                group, and number of complete groups waiting for their files
+                to settle
+        """
+
+        if now is None:
+            now = time.monotonic()
+        groups: Dict[str, Dict[str, re.Match]] = {}
+        seen = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                match = self.pattern.fullmatch(entry.name)
+                if match is None or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                previous = self._seen.get(entry.path)
+                if previous is None or previous[:2] != (stat.st_size, stat.st_mtime_ns):
+                    # Files not modified for a while are already settled
+                    age = max(0.0, time.time() - stat.st_mtime_ns / 1e9)
+                    previous = (stat.st_size, stat.st_mtime_ns, now - age)
+                seen[entry.path] = previous
+                groups.setdefault(match.group("group"), {})[entry.path] = match
+        self._seen = seen
+
+        ready = {}
+        settling = 0
+        for group, files in groups.items():
+            if group in self._running:
+                continue
+            try:
+                inputfiles = self._order(group, files)
+            except ValueError as e:
+                signature = [[path] + list(seen[path][:2]) for path in sorted(files)]
+                if self.state.get(group, {}).get("inputs") != signature:
+                    self._fail(group, signature, str(e))
+                continue
+            if inputfiles is None:
+                continue
+            signature = [[path] + list(seen[path][:2]) for path in inputfiles]
+            if self.state.get(group, {}).get("inputs") == signature:
+                continue
+            if any(now - seen[path][2] < self.settle for path in inputfiles):
+                settling += 1
+                continue
+            ready[group] = signature
+        return (ready, settling)
+
+    def _submit(self, group: str, signature: list) -> Future:
+        """Start the processing of a group
+
+        Args:
+            group (str): name of the group
+            signature (list): path, size and modification time of its files
+
+        Returns:
+            Future: result of :func:`process_group`
+        """
+
+        _logger.info("Processing group {}".format(group))
+        arguments = (
+            group,
+            [item[0] for item in signature],
+            self.NumPorts,
+            self.output_dir,
+            self.plot_format,
+            self._pair_pattern,
+        )
+        if self._executor is not None:
+            return self._executor.submit(process_group, *arguments)
+        future = Future()
+        future.set_result(process_group(*arguments))
+        return future
+
+    def poll(self, now: float = None) -> Tuple[List[GroupResult], bool]:
+        """Scan the directory, start the ready groups and collect the finished
+
+        Args:
+            now (float): current time, as :func:`time.monotonic` - optional
+
+        Returns:
+            Tuple[List[GroupResult], bool]: groups finished since the last
+                poll, and whether groups are still running or settling
+        """
+
+        ready, settling = self.scan(now)
+        for group, signature in ready.items():
+            self._running[group] = (signature, self._submit(group, signature))
+
+        finished = []
+        for group, (signature, future) in list(self._running.items()):
+            if not future.done():
+                continue
+            del self._running[group]
+            result = future.result()
+            self.state[group] = dict(inputs=signature, **result._asdict())
+            finished.append(result)
+        if finished:
+            self._save_state()
+        return (finished, settling > 0 or len(self._running) > 0)
+
+    def close(self):
+        """Wait for the running groups and stop the workers"""
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    """Parse command line parameters
+
+    Args:
+        args (List[str]): command line parameters as list of strings
+
+    Returns:
+        :obj:`argparse.Namespace`: command line parameters namespace
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Concatenate and plot the new two port files of a directory"
+    )
+    parser.add_argument(
+        "--version",
+        action="version",
+        version="RFTools {ver}".format(ver=__version__),
+    )
+    parser.add_argument(
+        dest="directory",
+        help="Directory to watch",
+        type=str,
+        metavar="DIRECTORY",
+    )
+    parser.add_argument(
+        "-p",
+        "--numports",
+        dest="numports",
+        help="Number of ports of every group",
+        type=int,
+        required=True,
+        metavar="NUM_PORTS",
+    )
+    parser.add_argument(
+        "--pattern",
+        dest="pattern",
+        help="Regular expression of the file names, with named groups group and "
+        "optionally first and second for the ports, default is {}".format(
+            DEFAULT_PATTERN.replace("%", "%%")
+        ),
+        type=str,
+        default=DEFAULT_PATTERN,
+        metavar="PATTERN",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        dest="output_dir",
+        help="Directory of the n port files and plots, default is the watched one",
+        type=str,
+        metavar="OUTPUT_DIR",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="format",
+        help="Format of the plots, default is pdf",
+        choices=OUTPUT_FORMATS,
+        default="pdf",
+    )
+    parser.add_argument(
+        "--no-plot",
+        dest="format",
+        help="Only concatenate the groups",
+        action="store_const",
+        const=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        help="Number of parallel jobs processing the groups, 0 for one per CPU",
+        type=int,
+        default=1,
+        metavar="JOBS",
+    )
+    parser.add_argument(
+        "--settle",
+        dest="settle",
+        help="Seconds a file must not change before it is read, default is 2",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+    )
+    parser.add_argument(
+        "--interval",
+        dest="interval",
+        help="Seconds between scans of the directory, default is 1",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+    )
+    parser.add_argument(
+        "--state",
+        dest="state",
+        help="State file of the groups done, default is {} in the output "
+        "directory".format(STATE_NAME),
+        type=str,
+        metavar="STATE_FILE",
+    )
+    parser.add_argument(
+        "--once",
+        dest="once",
+        help="Exit when the complete groups are done instead of watching",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action="store_const",
+        const=logging.INFO,
+    )
+    parser.add_argument(
+        "-vv",
+        "--very-verbose",
+        dest="loglevel",
+        help="set loglevel to DEBUG",
+        action="store_const",
+        const=logging.DEBUG,
+    )
+    return parser.parse_args(args)
+
+
+def setup_logging(loglevel: int):
+    """setup logging
+
+    Args:
+        loglevel (int): minimum loglevel for emitting messages
+    """
+
+    logformat = "[%(asctime)s] %(levelname)s:%(name)s:%(message)s"
+    logging.basicConfig(
+        level=loglevel, stream=sys.stdout, format=logformat, datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+
+def main(arguments: List[str]):
+    """Watch a directory from the command line
+
+    Args:
+        arguments (List[str]): command line parameters as list of strings
+    """
+
+    args = parse_args(arguments)
+    setup_logging(args.loglevel)
+    try:
+        watcher = Watcher(
+            args.directory,
+            args.numports,
+            pattern=args.pattern,
+            output_dir=args.output_dir,
+            settle=args.settle,
+            jobs=args.jobs,
+            plot_format=args.format,
+            state=args.state,
+        )
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    print("Watching {}".format(args.directory))
+    failed = 0
+    try:
+        while True:
+            finished, pending = watcher.poll()
+            for result in finished:
+                if result.error is None:
+                    print(
+                        "The group {} has been stored in {}{}".format(
+                            result.group,
+                            result.nport,
+                            (
+                                ""
+                                if result.plot is None
+                                else " and ploted in " + result.plot
+                            ),
+                        )
+                    )
+                else:
+                    failed += 1
+                    print("The group {} failed: {}".format(result.group, result.error))
+                sys.stdout.flush()
+            if args.once and not pending:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    if args.once and failed:
+        sys.exit(1)
+
+
+def run():
+    """Calls :func:`main` passing the CLI arguments extracted from :obj:`sys.argv`
+
+    This function can be used as entry point to create console scripts with setuptools.
+    """
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
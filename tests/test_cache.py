@@ -0,0 +1,100 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+import skrf as rf
+
+from stouchtool.cache import (
+    CACHE_DIR_ENV,
+    load_cached,
+    read_cached,
+    resolve_cache_dir,
+    store_cached,
+)
+from stouchtool.s_cat import s_cat
+from stouchtool.touchstone import read_touchstone
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+
+def test_read_cached(tmp_path):
+    """Second read must come memory mapped from the cache"""
+    cache_dir = str(tmp_path / "cache")
+    inputfile = "./tests/data/golden.s3p"
+    assert load_cached(inputfile, cache_dir) is None
+    first = read_cached(inputfile, cache_dir)
+    second = read_cached(inputfile, cache_dir)
+    assert isinstance(second.s, np.memmap)
+    np.testing.assert_array_equal(first.s, second.s)
+    np.testing.assert_array_equal(first.frequency, second.frequency)
+    assert first[2:] == second[2:]
+
+
+def test_read_cached_changed(tmp_path):
+    """A changed file must not be read from the cache"""
+    cache_dir = str(tmp_path / "cache")
+    inputfile = str(tmp_path / "changing.s1p")
+    with open(inputfile, "w") as touchstone:
+        touchstone.write("# Hz S RI R 50\n1 0.1 0\n")
+    stat = os.stat(inputfile)
+    read_cached(inputfile, cache_dir)
+    with open(inputfile, "w") as touchstone:
+        touchstone.write("# Hz S RI R 50\n1 0.2 0\n")
+    # Same size and modification time, only the content hash differs
+    os.utime(inputfile, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert load_cached(inputfile, cache_dir) is None
+    assert read_cached(inputfile, cache_dir).s[0, 0, 0] == 0.2
+
+
+def test_store_cached_eviction(tmp_path):
+    """Least recently used entries are removed over the size limit"""
+    cache_dir = str(tmp_path / "cache")
+    inputfiles = []
+    for index in range(3):
+        inputfile = str(tmp_path / "file{}.s3p".format(index))
+        shutil.copy("./tests/data/golden.s3p", inputfile)
+        inputfiles.append(inputfile)
+    data = read_touchstone(inputfiles[0])
+    for inputfile in inputfiles[:2]:
+        store_cached(inputfile, cache_dir, data)
+    size = sum(
+        os.path.getsize(os.path.join(root, name))
+        for (root, _, names) in os.walk(cache_dir)
+        for name in names
+    )
+    # Make one of the entries the least recently used
+    oldest = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+    os.utime(oldest, (0, 0))
+    store_cached(inputfiles[2], cache_dir, data, max_size=size)
+    assert len(os.listdir(cache_dir)) == 2
+    assert not os.path.exists(oldest)
+
+
+def test_resolve_cache_dir(monkeypatch):
+    """Command line options and environment variable"""
+    monkeypatch.setenv(CACHE_DIR_ENV, "/env/cache")
+    assert resolve_cache_dir(None, False) == "/env/cache"
+    assert resolve_cache_dir("/cli/cache", False) == "/cli/cache"
+    assert resolve_cache_dir("/cli/cache", True) is None
+    monkeypatch.delenv(CACHE_DIR_ENV)
+    assert resolve_cache_dir(None, False) is None
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_s_cat_cached(tmp_path, jobs: int):
+    """Cold and warm runs must give the same result"""
+    cache_dir = str(tmp_path / "cache")
+    inputfiles = [
+        "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+        "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+        "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+    ]
+    for _ in range(2):
+        outputfile = s_cat(
+            inputfiles, str(tmp_path / "out.s3p"), None, jobs=jobs, cache_dir=cache_dir
+        )
+        assert rf.Network("./tests/data/golden.s3p") == rf.Network(outputfile)
+    assert len(os.listdir(cache_dir)) == 3
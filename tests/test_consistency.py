@@ -0,0 +1,143 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import skrf as rf
+
+from stouchtool.consistency import ReflectionCheck
+from stouchtool.s_cat import cat_networks, main, port_pairs, s_cat
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+INPUTFILES_S3P = [
+    "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+]
+
+
+def _twoports(NumPorts: int, points: int = 11) -> list:
+    """Two ports of a random n port, the reflections repeated exactly"""
+    rng = np.random.default_rng(3)
+    s = rng.normal(size=(points, NumPorts, NumPorts)) + 0j
+    return [s[:, pair][:, :, pair] for pair in map(list, port_pairs(NumPorts))]
+
+
+def test_reflection_check():
+    """A single deviating reflection is found, in one block or several"""
+    pairs = port_pairs(4)
+    names = ["p{}{}".format(first + 1, second + 1) for (first, second) in pairs]
+    frequency = np.linspace(1e9, 2e9, 11)
+    twoports = _twoports(4)
+    # S22 of the p23 file at 1.3 GHz
+    twoports[3][3, 0, 0] += 0.3j
+
+    check = ReflectionCheck()
+    check.start(names, pairs, 4)
+    check.update(frequency, twoports)
+    ports = check.finish()
+    assert [entry.port for entry in ports] == [1, 2, 3, 4]
+    assert [entry.measurements for entry in ports] == [3, 3, 3, 3]
+    assert ports[1].worst == pytest.approx(0.2)
+    assert ports[1].frequency == 1.3e9
+    assert ports[1].name == "p23"
+    assert ports[1].rms == pytest.approx(np.sqrt((0.2**2 + 2 * 0.1**2) / 33))
+    assert ports[0].worst == pytest.approx(0, abs=1e-15)
+    assert check.failed() == []
+
+    blocks = ReflectionCheck()
+    blocks.start(names, pairs, 4)
+    for rows in (slice(0, 4), slice(4, 4), slice(4, 11)):
+        blocks.update(frequency[rows], [twoport[rows] for twoport in twoports])
+    assert blocks.finish() == ports
+
+    check = ReflectionCheck(0.1)
+    check.start(names, pairs, 4)
+    check.update(frequency, twoports)
+    with pytest.raises(ValueError, match="port 2 deviate more than 0.1"):
+        check.verify()
+    assert [entry.port for entry in check.failed()] == [2]
+    assert check.report()[1].endswith("in p23, above 0.1")
+
+
+def test_reflection_check_two_ports():
+    """Nothing to compare with a single file"""
+    check = ReflectionCheck(1e-9)
+    check.start(["p12"], port_pairs(2), 2)
+    check.update(np.array([1e9]), _twoports(2, 1))
+    check.verify()
+    assert check.report() == []
+
+
+@pytest.mark.parametrize("threshold", [0, -1.0])
+def test_reflection_check_wrong(threshold: float):
+    """The threshold must be positive"""
+    with pytest.raises(ValueError):
+        ReflectionCheck(threshold)
+
+
+@pytest.mark.parametrize("chunk", [None, 16])
+def test_s_cat_check(tmp_path, chunk: int):
+    """Loaded and streamed files give the same check, a failed one is not written"""
+    outputfile = str(tmp_path / "out.s3p")
+    expected = ReflectionCheck()
+    combined = cat_networks(INPUTFILES_S3P, check=expected)
+    assert combined == rf.Network("./tests/data/golden.s3p")
+    assert len(expected.ports) == 3
+    worst = max(entry.worst for entry in expected.ports)
+
+    check = ReflectionCheck(worst * 1.01)
+    s_cat(INPUTFILES_S3P, outputfile, None, chunk=chunk, check=check)
+    assert check.ports == expected.ports
+    os.remove(outputfile)
+
+    check = ReflectionCheck(worst * 0.99)
+    with pytest.raises(ValueError, match="deviate more than"):
+        s_cat(INPUTFILES_S3P, outputfile, None, chunk=chunk, check=check)
+    assert not os.path.exists(outputfile)
+    assert len(check.failed()) == 1
+
+
+def test_main_reflection(tmp_path, capsys):
+    """CLI Tests, report and threshold"""
+    outputfile = str(tmp_path / "out.s3p")
+    main(INPUTFILES_S3P + ["-o", outputfile, "--reflection-spread"])
+    captured = capsys.readouterr().out
+    assert captured.count("Reflection of port") == 3
+    assert "has been stored in" in captured
+    os.remove(outputfile)
+
+    with pytest.raises(SystemExit):
+        main(INPUTFILES_S3P + ["-o", outputfile, "--reflection-threshold", "0.01"])
+    captured = capsys.readouterr().out
+    assert captured.count(", above 0.01") == 3
+    assert "Reflections of port 1, 2, 3 deviate more than 0.01" in captured
+    assert not os.path.exists(outputfile)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_main_reflection_manifest(tmp_path, capsys, jobs: int):
+    """CLI Tests, the spread of every concatenation of a batch"""
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {"inputs": INPUTFILES_S3P, "output": str(tmp_path / "a.s3p")},
+                {"inputs": INPUTFILES_S3P, "output": str(tmp_path / "b.s3p")},
+            ]
+        )
+    )
+    main(["--manifest", str(manifest), "--jobs", str(jobs), "--reflection-spread"])
+    captured = capsys.readouterr().out
+    assert captured.count("Reflection of port") == 6
+    assert "0 of 2 concatenations failed" in captured
+
+    args = ["--manifest", str(manifest), "--jobs", str(jobs)]
+    with pytest.raises(SystemExit):
+        main(args + ["--reflection-threshold", "0.01"])
+    captured = capsys.readouterr().out
+    assert captured.count(", above 0.01") == 6
+    assert captured.count("failed: Reflections of port 1, 2, 3 deviate") == 2
@@ -0,0 +1,171 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+import skrf as rf
+
+from stouchtool.daemon import (
+    SOCKET_ENV,
+    DaemonServer,
+    default_socket,
+    forward,
+    main,
+    run_command,
+    send_request,
+)
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork"), reason="The daemon needs Unix sockets"
+)
+
+INPUTFILES_S3P = [
+    "evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+    "evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+    "evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+]
+
+
+@pytest.fixture(scope="module")
+def daemon(tmp_path_factory):
+    """A daemon with one worker, stopped at the end of the module"""
+    socket_path = str(tmp_path_factory.mktemp("daemon") / "test.sock")
+    server = DaemonServer(socket_path, 1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    assert not os.path.exists(socket_path)
+
+
+def test_default_socket(monkeypatch):
+    """Socket from the environment variable"""
+    monkeypatch.setenv(SOCKET_ENV, "/tmp/other.sock")
+    assert default_socket() == "/tmp/other.sock"
+    monkeypatch.delenv(SOCKET_ENV)
+    assert default_socket().endswith(".sock")
+
+
+def test_forward_in_process(tmp_path, capsys):
+    """Without daemon the command runs in the client"""
+    socket_path = str(tmp_path / "none.sock")
+    outputfile = str(tmp_path / "out.s3p")
+    inputfiles = ["./tests/data/" + name for name in INPUTFILES_S3P]
+    assert forward("s_cat", inputfiles + ["-o", outputfile], socket_path) == 0
+    assert "has been stored in {}".format(outputfile) in capsys.readouterr().out
+    assert forward("s_cat", ["--wrong"], socket_path) == 2
+    with pytest.raises(ValueError):
+        run_command("ls", [])
+
+
+def test_forward_no_answer(tmp_path, capsys):
+    """A daemon closing the connection is an error, nothing runs in process"""
+    socket_path = str(tmp_path / "mute.sock")
+    outputfile = str(tmp_path / "out.s3p")
+    inputfiles = ["./tests/data/" + name for name in INPUTFILES_S3P]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen(1)
+
+        def mute():
+            connection, _ = server.accept()
+            with connection, connection.makefile("rb") as stream:
+                stream.readline()
+
+        thread = threading.Thread(target=mute)
+        thread.start()
+        assert forward("s_cat", inputfiles + ["-o", outputfile], socket_path) == 1
+        thread.join()
+    captured = capsys.readouterr()
+    assert "did not answer" in captured.err
+    assert captured.out == ""
+    assert not os.path.exists(outputfile)
+
+
+def test_daemon(daemon, tmp_path, monkeypatch, capsys):
+    """Same output and exit status as in process, relative to the client"""
+    monkeypatch.chdir("./tests/data")
+    outputfile = str(tmp_path / "out.s3p")
+    assert forward("s_cat", INPUTFILES_S3P + ["-o", outputfile], daemon) == 0
+    assert capsys.readouterr().out == (
+        "The cat from files {} has been stored in {}\n".format(
+            INPUTFILES_S3P, outputfile
+        )
+    )
+    assert rf.Network(outputfile) == rf.Network("golden.s3p")
+
+    assert forward("s_cat", INPUTFILES_S3P[:2], daemon) == 1
+    assert capsys.readouterr().out == "Wrong number of files: 2\n"
+    assert forward("s_plot", [], daemon) == 2
+    assert "error: the following arguments are required" in capsys.readouterr().err
+
+    outputfile = str(tmp_path / "out.png")
+    assert forward("s_plot", ["evalboard.s3p", "-o", outputfile], daemon) == 0
+    assert os.path.exists(outputfile)
+
+
+def test_daemon_environment(daemon, tmp_path, monkeypatch):
+    """The STOUCHTOOL_* variables of the client are used"""
+    cache_dir = str(tmp_path / "cache")
+    monkeypatch.setenv("STOUCHTOOL_CACHE_DIR", cache_dir)
+    inputfile = os.path.abspath("./tests/data/evalboard.s3p")
+    answer = send_request(daemon, "s_plot", [inputfile, "-o", str(tmp_path / "a.pdf")])
+    assert answer["status"] == 0
+    assert os.listdir(cache_dir)
+    monkeypatch.delenv("STOUCHTOOL_CACHE_DIR")
+    send_request(daemon, "s_plot", [inputfile, "-o", str(tmp_path / "b.pdf")])
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_daemon_cli(daemon, tmp_path, capsys):
+    """Status of a running daemon, and a second daemon can not be started"""
+    main(["--socket", daemon, "--status"])
+    assert "is running" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main(["--socket", daemon, "--jobs", "1"])
+    assert "already listening" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main(["--socket", str(tmp_path / "none.sock"), "--stop"])
+    assert "No daemon" in capsys.readouterr().out
+
+
+def test_daemon_stop(tmp_path):
+    """A daemon started from the command line is stopped by a client"""
+    socket_path = str(tmp_path / "cli.sock")
+    # A socket left by a killed daemon
+    open(socket_path, "w").close()
+    daemon = subprocess.Popen(
+        [sys.executable, "-m", "stouchtool.daemon", "-s", socket_path, "-j", "1"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert daemon.stdout.readline().startswith("The daemon is listening")
+        assert send_request(socket_path, "ping")["status"] == 0
+        assert send_request(socket_path, "stop")["status"] == 0
+        assert daemon.wait(timeout=60) == 0
+    finally:
+        daemon.kill()
+    assert not os.path.exists(socket_path)
+
+
+def test_client_imports():
+    """The client only imports the standard library"""
+    code = (
+        "import sys\n"
+        "import stouchtool.daemon\n"
+        "print([name for name in ('numpy', 'skrf', 'matplotlib') "
+        "if name in sys.modules])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.splitlines()[-1] == "[]"
@@ -0,0 +1,220 @@
+import json
+
+import numpy as np
+import pytest
+import skrf as rf
+
+import stouchtool.grid as grid_module
+from stouchtool.grid import FrequencyGrid, interpolate
+from stouchtool.s_cat import cat_networks, main, s_cat
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+INPUTFILES_S3P = [
+    "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+]
+
+
+def _delay(frequency: np.ndarray) -> np.ndarray:
+    """Smooth (F, 2, 2) S parameters of a delay line"""
+    return np.exp(-2j * np.pi * frequency / 1e9)[:, None, None] * np.ones((2, 2))
+
+
+@pytest.mark.parametrize(
+    "interpolation, data_format, tolerance",
+    [
+        ("linear", "ri", 1e-3),
+        ("cubic", "ri", 1e-5),
+        ("linear", "ma", 1e-12),
+        ("cubic", "ma", 1e-12),
+    ],
+)
+def test_interpolate(interpolation: str, data_format: str, tolerance: float):
+    """All the values at once, measured points unchanged"""
+    frequency = np.linspace(1e8, 1e9, 201)
+    grid = np.concatenate((np.linspace(1e8, 1e9, 77), frequency[::10]))
+    grid.sort()
+    resampled = interpolate(
+        frequency, _delay(frequency), grid, interpolation, data_format
+    )
+    assert resampled.shape == (len(grid), 2, 2)
+    np.testing.assert_allclose(resampled, _delay(grid), atol=tolerance)
+    measured = np.isin(grid, frequency)
+    np.testing.assert_array_equal(resampled[measured], _delay(grid[measured]))
+
+
+def test_interpolate_wrong():
+    """No extrapolation nor unknown options"""
+    frequency = np.linspace(1e8, 1e9, 11)
+    with pytest.raises(ValueError):
+        interpolate(frequency, _delay(frequency), np.array([1e9, 2e9]))
+    with pytest.raises(ValueError):
+        interpolate(frequency, _delay(frequency), frequency, "spline")
+    with pytest.raises(ValueError):
+        interpolate(frequency, _delay(frequency), frequency, "linear", "db")
+
+
+def test_common_grid():
+    """Intersection, union and explicit grids"""
+    first = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+    second = np.array([2.0, 2.5, 3.0, 4.0, 6.0])
+    np.testing.assert_array_equal(
+        FrequencyGrid("intersection").common([first, second]), [2.0, 3.0, 4.0]
+    )
+    np.testing.assert_array_equal(
+        FrequencyGrid("union").common([first, second]), [2.0, 2.5, 3.0, 4.0, 5.0]
+    )
+    np.testing.assert_array_equal(
+        FrequencyGrid(start=2.0, stop=4.0, points=5).common([first, second]),
+        [2.0, 2.5, 3.0, 3.5, 4.0],
+    )
+    with pytest.raises(ValueError, match="outside the common band"):
+        FrequencyGrid(start=1.0, stop=4.0, points=5).common([first, second])
+    with pytest.raises(ValueError, match="no common frequency points"):
+        FrequencyGrid().common([first, first + 0.5])
+    with pytest.raises(ValueError, match="no common frequency band"):
+        FrequencyGrid("union").common([first, first + 10])
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"mode": "median"},
+        {"interpolation": "spline"},
+        {"data_format": "db"},
+        {"start": 1e9},
+        {"start": 2e9, "stop": 1e9, "points": 11},
+        {"start": 1e9, "stop": 2e9, "points": 1},
+    ],
+)
+def test_frequency_grid_wrong(options: dict):
+    """Wrong options"""
+    with pytest.raises(ValueError):
+        FrequencyGrid(**options)
+
+
+def _mismatched_inputs():
+    """The evalboard files, one with less points and one with a shorter span"""
+    networks = [rf.Network(inputfile) for inputfile in INPUTFILES_S3P]
+    networks[1] = networks[1][::2]
+    networks[2] = networks[2][5:]
+    return networks
+
+
+def test_cat_networks_grid():
+    """Mismatched inputs are only combined with a grid"""
+    networks = _mismatched_inputs()
+    with pytest.raises(ValueError, match="do not match"):
+        cat_networks(networks)
+
+    grid = FrequencyGrid("intersection")
+    combined = cat_networks(networks, grid=grid)
+    np.testing.assert_array_equal(combined.f, networks[1].f[3:])
+    golden = rf.Network("./tests/data/golden.s3p")
+    np.testing.assert_allclose(combined.s, golden.s[6::2], atol=1e-12)
+    assert [entry.name for entry in grid.resampled] == [
+        networks[0].name,
+        networks[1].name,
+        networks[2].name,
+    ]
+    assert [entry.interpolated for entry in grid.resampled] == [0, 0, 0]
+
+    grid = FrequencyGrid("union", interpolation="cubic", data_format="ma")
+    combined = cat_networks(networks, grid=grid)
+    np.testing.assert_array_equal(combined.f, networks[0].f[5:])
+    assert [entry.points for entry in grid.resampled] == [201, 101]
+    assert grid.resampled[1].interpolated == 98
+    np.testing.assert_allclose(combined.s, golden.s[5:], rtol=0.1, atol=0.05)
+    lines = grid.report()
+    assert lines[0] == (
+        "Common grid: 196 points from 3.475e+07 to 1e+09 Hz, cubic MA interpolation"
+    )
+    assert len(lines) == 3
+
+
+@pytest.mark.parametrize("interpolation", ["linear", "cubic"])
+def test_resample_batched(monkeypatch, interpolation: str):
+    """Inputs on the same points are interpolated together, as one by one"""
+    networks = [rf.Network(inputfile) for inputfile in INPUTFILES_S3P]
+    networks[2] = networks[2][::2]
+    calls = []
+
+    def counted(frequency, values, *args, **kwargs):
+        calls.append(values.shape)
+        return interpolate(frequency, values, *args, **kwargs)
+
+    monkeypatch.setattr(grid_module, "interpolate", counted)
+    grid = FrequencyGrid(
+        start=1e8, stop=9e8, points=77, interpolation=interpolation, data_format="ma"
+    )
+    resampled = grid.resample(["a", "b", "c"], networks)
+    assert [shape[:2] for shape in calls] == [(201, 2), (201, 2), (101, 1), (101, 1)]
+    assert [entry.name for entry in grid.resampled] == ["a", "b", "c"]
+    for network, result in zip(networks, resampled):
+        np.testing.assert_array_equal(
+            result.s,
+            interpolate(network.f, network.s, grid.frequency, interpolation, "ma"),
+        )
+        np.testing.assert_array_equal(result.f, grid.frequency)
+
+
+def test_s_cat_grid_stream():
+    """Resampling needs the whole files"""
+    with pytest.raises(ValueError, match="can not be streamed"):
+        s_cat(
+            INPUTFILES_S3P, "./tests/data/tmp.s3p", None, chunk=10, grid=FrequencyGrid()
+        )
+
+
+def test_main_grid(tmp_path, capsys):
+    """CLI Tests, explicit grid and report"""
+    inputfiles = []
+    for index, network in enumerate(_mismatched_inputs()):
+        inputfiles.append(str(tmp_path / "in{}.s2p".format(index)))
+        network.write_touchstone(inputfiles[-1])
+    outputfile = str(tmp_path / "out.s3p")
+    with pytest.raises(SystemExit):
+        main(inputfiles + ["-o", outputfile])
+    assert "do not match" in capsys.readouterr().out
+
+    main(
+        inputfiles
+        + ["-o", outputfile, "--fstart", "1e8", "--fstop", "9e8", "--npoints", "81"]
+    )
+    captured = capsys.readouterr().out
+    assert "Common grid: 81 points from 1e+08 to 9e+08 Hz" in captured
+    assert captured.count("Resampled") == 3
+    network = rf.Network(outputfile)
+    assert len(network.f) == 81
+    assert network.f[0] == 1e8
+
+    with pytest.raises(SystemExit):
+        main(inputfiles + ["-o", outputfile, "--fstart", "1e8"])
+    assert "An explicit grid needs" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_main_grid_manifest(tmp_path, capsys, jobs: int):
+    """CLI Tests, the resampled inputs of every concatenation of a batch"""
+    inputfiles = []
+    for index, network in enumerate(_mismatched_inputs()):
+        inputfiles.append(str(tmp_path / "in{}.s2p".format(index)))
+        network.write_touchstone(inputfiles[-1])
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {"inputs": inputfiles, "output": str(tmp_path / "a.s3p")},
+                {"inputs": inputfiles, "output": str(tmp_path / "b.s3p")},
+            ]
+        )
+    )
+    main(["--manifest", str(manifest), "--jobs", str(jobs), "--grid", "union"])
+    captured = capsys.readouterr().out
+    assert captured.count("Common grid: 196 points") == 2
+    assert captured.count("Resampled") == 4
+    assert captured.index("Resampled") < captured.index(str(tmp_path / "a.s3p"))
@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pytest
+
+from stouchtool.profiling import NULL_PROFILER, Profiler
+from stouchtool.s_cat import main as s_cat_main
+from stouchtool.s_cat import s_cat
+from stouchtool.s_plot import main as s_plot_main
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+INPUTFILES_S3P = [
+    "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+]
+
+
+def test_profiler_stages():
+    """Stages with the same name are accumulated"""
+    profiler = Profiler(memory=True)
+    for _ in range(2):
+        with profiler.stage("allocate"):
+            np.ones(1 << 20)
+    with profiler.stage("nothing"):
+        pass
+    profiler.close()
+    stages = profiler.to_dict()["stages"]
+    assert [stage["name"] for stage in stages] == ["allocate", "nothing"]
+    assert stages[0]["calls"] == 2
+    assert stages[0]["peak_memory"] >= 8 * (1 << 20)
+    assert stages[1]["peak_memory"] < 8 * (1 << 20)
+    assert stages[1]["process_max_rss"] >= stages[0]["process_max_rss"] > 0
+    assert stages[1]["max_rss_increase"] <= stages[1]["process_max_rss"]
+    assert all(stage["max_rss_increase"] >= 0 for stage in stages)
+
+
+def test_null_profiler():
+    """The disabled profiler measures nothing but runs the stage"""
+    with NULL_PROFILER.stage("anything"):
+        done = True
+    assert done
+
+
+@pytest.mark.parametrize("chunk", [None, 50])
+def test_s_cat_profiler(chunk: int):
+    """s_cat stages"""
+    profiler = Profiler(memory=False)
+    s_cat(INPUTFILES_S3P, "./tests/data/tmp.s3p", None, chunk=chunk, profiler=profiler)
+    stages = profiler.to_dict()["stages"]
+    assert [stage["name"] for stage in stages] == ["parse", "combine", "write"]
+    assert stages[0]["calls"] == (1 if chunk is None else 6)
+
+
+def test_s_cat_main_profile(tmp_path):
+    """CLI Tests, s_cat profile"""
+    profile = tmp_path / "profile.json"
+    s_cat_main(INPUTFILES_S3P + ["--profile", str(profile), "--profile-memory"])
+    result = json.loads(profile.read_text())
+    assert result["command"] == "s_cat"
+    assert [stage["name"] for stage in result["stages"]] == [
+        "parse",
+        "combine",
+        "write",
+    ]
+    assert result["total"]["wall"] > 0
+    assert "peak_memory" in result["stages"][0]
+
+
+def test_s_plot_main_profile(tmp_path):
+    """CLI Tests, s_plot profile"""
+    profile = tmp_path / "profile.json"
+    s_plot_main(
+        [
+            "./tests/data/evalboard.s3p",
+            "-o",
+            "./tests/data/test.pdf",
+            "--profile",
+            str(profile),
+        ]
+    )
+    result = json.loads(profile.read_text())
+    assert result["command"] == "s_plot"
+    assert [stage["name"] for stage in result["stages"]] == [
+        "parse",
+        "plot",
+        "savefig",
+    ]
+    assert "peak_memory" not in result["stages"][0]
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from stouchtool.render_cache import MANIFEST_NAME, RenderCache, options_fingerprint
+from stouchtool.s_plot import main, s_plot, s_plot_batch
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+
+def _copy_inputs(tmp_path, names):
+    inputs = []
+    for name in names:
+        shutil.copy("./tests/data/" + name, str(tmp_path / name))
+        inputs.append(str(tmp_path / name))
+    return inputs
+
+
+def test_render_cache(tmp_path):
+    """Up to date until the output, the options or an input change"""
+    (inputfile,) = _copy_inputs(tmp_path, ["evalboard.s3p"])
+    output = str(tmp_path / "plot.pdf")
+    key = options_fingerprint(layout="overlay")
+    cache = RenderCache()
+    assert cache.ports(output, [inputfile], key) is None
+    with open(output, "w") as outputfile:
+        outputfile.write("plot")
+    cache.record(output, [inputfile], key, [3])
+    cache.save()
+
+    cache = RenderCache()
+    assert cache.ports(output, [inputfile], key) == [3]
+    assert cache.skipped == {output}
+    assert cache.ports(output, [inputfile], options_fingerprint(layout="grid")) is None
+    assert cache.ports(output, [inputfile, inputfile], key) is None
+    assert RenderCache(force=True).ports(output, [inputfile], key) is None
+
+    # Touched but unchanged, the new time is recorded
+    stat = os.stat(inputfile)
+    os.utime(inputfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.ports(output, [inputfile], key) == [3]
+    cache.save()
+    with open(str(tmp_path / MANIFEST_NAME), "r") as manifest:
+        entry = json.load(manifest)["plot.pdf"]
+    assert entry["inputs"][0]["mtime_ns"] == stat.st_mtime_ns + 10**9
+
+    with open(inputfile, "a") as touchstone:
+        touchstone.write("! changed\n")
+    assert cache.ports(output, [inputfile], key) is None
+
+    os.remove(output)
+    cache.record(output, [inputfile], key, [3])
+    assert cache.ports(output, [inputfile], key) is None
+
+
+def test_s_plot_incremental(tmp_path):
+    """A single plot is only rendered again when its title changes"""
+    (inputfile,) = _copy_inputs(tmp_path, ["evalboard.s3p"])
+    output = str(tmp_path / "plot.pdf")
+    cache = RenderCache()
+    assert s_plot(inputfile, output, None, render_cache=cache) == (inputfile, output, 3)
+    mtime = os.stat(output).st_mtime_ns
+    assert s_plot(inputfile, output, None, render_cache=cache) == (inputfile, output, 3)
+    assert os.stat(output).st_mtime_ns == mtime
+    assert cache.skipped == {output}
+    s_plot(inputfile, output, "Other title", render_cache=cache)
+    assert os.stat(output).st_mtime_ns != mtime
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_s_plot_batch_incremental(tmp_path, jobs: int):
+    """Only the changed inputs are rendered again"""
+    inputs = _copy_inputs(
+        tmp_path, ["limiter_pin_0dBm.s2p", "evalboard.s3p", "golden.s4p"]
+    )
+    outputs = [inputfile[:-4] + ".pdf" for inputfile in inputs]
+    cache = RenderCache()
+    first = s_plot_batch(inputs, jobs=jobs, render_cache=cache)
+    cache.save()
+    assert cache.skipped == set()
+    mtimes = [os.stat(output).st_mtime_ns for output in outputs]
+
+    with open(inputs[1], "a") as touchstone:
+        touchstone.write("! changed\n")
+    cache = RenderCache()
+    assert s_plot_batch(inputs, jobs=jobs, render_cache=cache) == first
+    assert cache.skipped == {outputs[0], outputs[2]}
+    assert [
+        os.stat(output).st_mtime_ns == mtime for (output, mtime) in zip(outputs, mtimes)
+    ] == [True, False, True]
+
+    cache = RenderCache()
+    s_plot_batch(inputs, jobs=jobs, render_cache=cache, default_format="png")
+    assert cache.skipped == set()
+
+
+def test_s_plot_batch_incremental_shared_output(tmp_path):
+    """Only the first input of an output file is recorded"""
+    inputs = _copy_inputs(tmp_path, ["golden.s3p", "golden.s4p"])
+    cache = RenderCache()
+    s_plot_batch(inputs, render_cache=cache)
+    cache.save()
+    cache = RenderCache()
+    results = s_plot_batch(inputs, render_cache=cache)
+    assert cache.skipped == {str(tmp_path / "golden.pdf")}
+    assert results[0][2] == 3
+    assert "already plotted from" in results[1][3]
+
+
+def test_s_plot_batch_incremental_multipage(tmp_path):
+    """A multipage output depends on all its inputs"""
+    inputs = _copy_inputs(tmp_path, ["limiter_pin_0dBm.s2p", "evalboard.s3p"])
+    output = str(tmp_path / "all.pdf")
+    cache = RenderCache()
+    first = s_plot_batch(inputs, output, render_cache=cache)
+    assert s_plot_batch(inputs, output, render_cache=cache) == first
+    assert cache.skipped == {output}
+    assert RenderCache().ports(output, inputs[:1], "") is None
+
+
+def test_main_incremental(capsys, tmp_path):
+    """CLI Tests, second run skipped unless forced"""
+    _copy_inputs(tmp_path, ["limiter_pin_0dBm.s2p", "evalboard.s3p"])
+    main([str(tmp_path), "--incremental"])
+    assert capsys.readouterr().out.count("has been ploted in") == 2
+    main([str(tmp_path), "--incremental"])
+    captured = capsys.readouterr().out
+    assert captured.count("is up to date in") == 2
+    assert "0 of 2 plots failed" in captured
+    main([str(tmp_path), "--incremental", "--force"])
+    assert capsys.readouterr().out.count("has been ploted in") == 2
@@ -1,7 +1,32 @@
+import json
+import os
+
+import numpy as np
 import pytest
 import skrf as rf
 
-from stouchtool.s_cat import main, run, s_cat
+from stouchtool.s_cat import (
+    DEFAULT_PAIR_PATTERN,
+    ManifestJob,
+    assemble_nport,
+    cat_networks,
+    main,
+    map_port_pairs,
+    number_of_ports,
+    pair_label,
+    port_pairs,
+    read_manifest,
+    run,
+    s_cat,
+    s_cat_batch,
+)
+from stouchtool.touchstone import band_slice, iter_touchstone
+
+INPUTFILES_S3P = [
+    "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+]
 
 __author__ = "Jesús Lázaro"
 __copyright__ = "Jesús Lázaro"
@@ -96,6 +121,321 @@ def test_s_cat(
     assert GoldenS == ResultS
 
 
+@pytest.mark.parametrize("jobs", [2, 0])
+def test_s_cat_jobs(jobs: int):
+    """Parallel loading must give the same result as the sequential one"""
+    CalculatedOutputFile = s_cat(
+        [
+            "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+        ],
+        "./tests/data/tmp.s3p",
+        None,
+        jobs=jobs,
+    )
+    assert rf.Network("./tests/data/golden.s3p") == rf.Network(CalculatedOutputFile)
+
+
+def test_cat_networks(tmp_path):
+    """In memory concatenation of files and networks, nothing is written"""
+    combined = cat_networks(INPUTFILES_S3P)
+    assert combined == rf.Network("./tests/data/golden.s3p")
+    assert combined.name == "evalboard_in_out"
+
+    networks = [rf.Network(inputfile) for inputfile in INPUTFILES_S3P]
+    names = [network.name for network in networks]
+    assert cat_networks([INPUTFILES_S3P[0]] + networks[1:], 3) == combined
+    assert [network.name for network in networks] == names
+    outputfile = s_cat(networks, str(tmp_path / "out.s3p"), None)
+    assert rf.Network(outputfile) == combined
+
+
+def test_cat_networks_wrong():
+    """Networks need an output file name and can not be streamed"""
+    networks = [rf.Network(inputfile) for inputfile in INPUTFILES_S3P]
+    with pytest.raises(ValueError, match="Wrong number of files"):
+        cat_networks(networks[:2])
+    with pytest.raises(ValueError, match="output file name"):
+        s_cat(networks, None, None)
+    with pytest.raises(ValueError, match="streamed"):
+        s_cat(networks, "./tests/data/tmp.s3p", None, chunk=10)
+    networks[1] = networks[1]["1-2GHz"]
+    networks[1].name = None
+    with pytest.raises(ValueError, match="input 2 do not match"):
+        cat_networks(networks)
+
+
+@pytest.mark.parametrize("chunk", [1, 50, 1000])
+def test_s_cat_chunk(chunk: int):
+    """Streaming must give the same result as loading the whole files"""
+    CalculatedOutputFile = s_cat(
+        [
+            "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+        ],
+        "./tests/data/tmp.s4p",
+        None,
+        chunk=chunk,
+    )
+    assert rf.Network("./tests/data/golden.s4p") == rf.Network(CalculatedOutputFile)
+
+
+@pytest.mark.parametrize("chunk", [None, 10])
+def test_s_cat_frequency_mismatch(tmp_path, chunk: int):
+    """Files with different frequency points can not be combined"""
+    shortfile = tmp_path / "short.s2p"
+    with open("./tests/data/limiter_pin_0dBm.s2p") as inputfile:
+        shortfile.write_text("".join(inputfile.readlines()[:-10]))
+    outputfile = tmp_path / "out.s3p"
+    with pytest.raises(ValueError, match="short.s2p"):
+        s_cat(
+            [
+                "./tests/data/limiter_pin_0dBm.s2p",
+                "./tests/data/limiter_pin_0dBm.s2p",
+                str(shortfile),
+            ],
+            str(outputfile),
+            None,
+            chunk=chunk,
+        )
+    assert not outputfile.exists()
+
+
+@pytest.mark.parametrize("jobs, chunk", [(1, None), (2, None), (1, 10)])
+def test_s_cat_wrong_file(tmp_path, jobs: int, chunk: int):
+    """The file that can not be read must be named in the error, and nothing
+    written"""
+    outputfile = str(tmp_path / "tmp.s3p")
+    with pytest.raises(ValueError, match="kk.s2p"):
+        s_cat(
+            [
+                "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+                "./tests/data/kk.s2p",
+                "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+            ],
+            outputfile,
+            None,
+            jobs=jobs,
+            chunk=chunk,
+        )
+    assert not os.path.exists(outputfile)
+
+
+@pytest.mark.parametrize(
+    "NumFiles, NumPorts", [(1, 2), (3, 3), (6, 4), (2, None), (120, 16), (1128, 48)]
+)
+def test_number_of_ports(NumFiles: int, NumPorts: int):
+    """Closed form port count"""
+    assert number_of_ports(NumFiles) == NumPorts
+
+
+def test_pair_label():
+    """Labels are unambiguous past 9 ports"""
+    assert pair_label((0, 11)) == "p1_12"
+    assert pair_label((10, 1)) == "p11_2"
+
+
+def test_map_port_pairs():
+    """Files in any order, and with their ports in any order"""
+    names = ["dir/dut_p2_3.s2p", "dut_p3_1.S2P", "dut_p1_2.s2p"]
+    assert map_port_pairs(names, DEFAULT_PAIR_PATTERN) == (
+        [2, 1, 0],
+        [(0, 1), (2, 0), (1, 2)],
+    )
+    assert map_port_pairs(names, DEFAULT_PAIR_PATTERN, 3)[0] == [2, 1, 0]
+
+
+@pytest.mark.parametrize(
+    "names, pattern, NumPorts, message",
+    [
+        (["p1_2.s2p"], "p(\\d)", None, "no first and second groups"),
+        (["p1_2.s2p"], "p(?P<first>", None, "Wrong pair pattern"),
+        (["p1_2.s2p", "p12.s2p", "p2_3.s2p"], None, None, "does not match"),
+        (["p1_1.s2p"], None, None, "Wrong port pair"),
+        (["p1_2.s2p", "p2_1.s2p", "p1_3.s2p"], None, None, "both measure p1_2"),
+        (["p1_2.s2p", "p1_3.s2p", "p2_4.s2p"], None, 3, "only 3 ports"),
+        (["p1_2.s2p", "p1_12.s2p"], None, None, "Missing port pairs: p1_3, "),
+    ],
+)
+def test_map_port_pairs_wrong(names: list, pattern: str, NumPorts: int, message):
+    """Every pair once, and only once"""
+    with pytest.raises(ValueError, match=message):
+        map_port_pairs(names, pattern or DEFAULT_PAIR_PATTERN, NumPorts)
+
+
+@pytest.mark.parametrize("chunk", [None, 16])
+def test_s_cat_pair_pattern(tmp_path, chunk: int):
+    """The files are assembled from their names, not their order"""
+    networks = [rf.Network(inputfile) for inputfile in INPUTFILES_S3P]
+    inputfiles = [str(tmp_path / "dut_p{}.s2p".format(pair)) for pair in ("2_3", "1_2")]
+    networks[2].write_touchstone(inputfiles[0])
+    networks[0].write_touchstone(inputfiles[1])
+    # Port 3 first
+    inputfiles.append(str(tmp_path / "dut_p3_1.s2p"))
+    networks[1].flipped().write_touchstone(inputfiles[2])
+    outputfile = s_cat(
+        inputfiles, None, None, chunk=chunk, pattern=DEFAULT_PAIR_PATTERN
+    )
+    assert outputfile == str(tmp_path / "dut_p.s3p")
+    golden = rf.Network("./tests/data/golden.s3p")
+    np.testing.assert_allclose(rf.Network(outputfile).s, golden.s, atol=1e-12)
+    with pytest.raises(ValueError, match="Wrong number of files"):
+        s_cat(inputfiles[:2], None, None)
+
+
+def test_cat_networks_many_ports(tmp_path):
+    """Twelve ports, the files shuffled"""
+    rng = np.random.default_rng(1)
+    frequency = rf.Frequency(1, 2, 5, unit="ghz")
+    s = rng.normal(size=(5, 12, 12)) + 1j * rng.normal(size=(5, 12, 12))
+    inputfiles = []
+    for first, second in port_pairs(12):
+        index = [first, second]
+        network = rf.Network(frequency=frequency, s=s[:, index][:, :, index])
+        inputfiles.append(
+            str(tmp_path / "sw_{}.s2p".format(pair_label((first, second))))
+        )
+        network.write_touchstone(inputfiles[-1])
+    rng.shuffle(inputfiles)
+    combined = cat_networks(inputfiles, pattern=DEFAULT_PAIR_PATTERN)
+    assert combined.nports == 12
+    np.testing.assert_allclose(combined.s, s)
+    with pytest.raises(ValueError, match="Missing port pairs: p11_12"):
+        cat_networks(
+            [name for name in inputfiles if not name.endswith("p11_12.s2p")],
+            pattern=DEFAULT_PAIR_PATTERN,
+        )
+
+
+@pytest.mark.parametrize("NumPorts", [3, 5])
+def test_assemble_nport(NumPorts: int):
+    """Index scatter assembly must match scikit-rf"""
+    pairs = port_pairs(NumPorts)
+    frequency = rf.Frequency(1, 4, 4, unit="ghz")
+    rng = np.random.default_rng(0)
+    networks = [
+        rf.Network(
+            frequency=frequency,
+            s=rng.normal(size=(4, 2, 2)) + 1j * rng.normal(size=(4, 2, 2)),
+            z0=50,
+            name="p{}{}".format(pair[0] + 1, pair[1] + 1),
+        )
+        for pair in pairs
+    ]
+    reference = rf.network.n_twoports_2_nport(networks, nports=NumPorts)
+    twoports = [network.s for network in networks]
+    np.testing.assert_array_equal(
+        assemble_nport(twoports, pairs, NumPorts, "last"), reference.s
+    )
+
+    first = assemble_nport(twoports, pairs, NumPorts, "first")
+    np.testing.assert_array_equal(first[:, 0, 0], networks[0].s[:, 0, 0])
+    np.testing.assert_array_equal(first[:, -1, -1], networks[NumPorts - 2].s[:, 1, 1])
+
+    mean = assemble_nport(twoports, pairs, NumPorts, "mean")
+    np.testing.assert_allclose(
+        mean[:, 0, 0],
+        np.mean([network.s[:, 0, 0] for network in networks[: NumPorts - 1]], 0),
+    )
+    np.testing.assert_array_equal(mean[:, 0, 1:], reference.s[:, 0, 1:])
+
+
+def test_assemble_nport_wrong_policy():
+    """Unknown diagonal policy"""
+    with pytest.raises(ValueError):
+        assemble_nport([np.zeros((1, 2, 2))], port_pairs(2), 2, "median")
+
+
+def test_read_manifest(tmp_path):
+    """JSON and CSV manifests must give the same batch"""
+    jsonfile = tmp_path / "manifest.json"
+    jsonfile.write_text(
+        json.dumps(
+            [
+                {"inputs": INPUTFILES_S3P, "output": "a.s3p", "numports": 3},
+                {"inputs": INPUTFILES_S3P},
+            ]
+        )
+    )
+    csvfile = tmp_path / "manifest.csv"
+    csvfile.write_text(
+        "inputs,output,numports\n{},a.s3p,3\n{},,\n".format(
+            ";".join(INPUTFILES_S3P), ";".join(INPUTFILES_S3P)
+        )
+    )
+    expected = [
+        ManifestJob(INPUTFILES_S3P, "a.s3p", 3),
+        ManifestJob(INPUTFILES_S3P, None, None),
+    ]
+    assert read_manifest(str(jsonfile)) == expected
+    assert read_manifest(str(csvfile)) == expected
+
+
+@pytest.mark.parametrize(
+    "content", ['{"inputs": []}', '[{"output": "a.s3p"}]', '[{"inputs": []}]']
+)
+def test_read_manifest_wrong(tmp_path, content: str):
+    """Wrong manifests"""
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(content)
+    with pytest.raises(ValueError):
+        read_manifest(str(manifest))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_s_cat_batch(tmp_path, jobs: int):
+    """A failed concatenation must not stop the rest of the batch"""
+    batch = [
+        ManifestJob(INPUTFILES_S3P, str(tmp_path / "a.s3p"), None),
+        ManifestJob(INPUTFILES_S3P[:2], str(tmp_path / "b.s3p"), None),
+        ManifestJob(INPUTFILES_S3P, str(tmp_path / "c.s3p"), 3),
+    ]
+    results = s_cat_batch(batch, jobs=jobs)
+    assert [result.job for result in results] == batch
+    assert [result.outputfile for result in results] == [
+        str(tmp_path / "a.s3p"),
+        None,
+        str(tmp_path / "c.s3p"),
+    ]
+    assert "Wrong number of files" in results[1].error
+    assert rf.Network("./tests/data/golden.s3p") == rf.Network(results[2].outputfile)
+    assert [result.grid for result in results] == [None, None, None]
+
+
+def test_main_args_manifest(tmp_path, capsys):
+    """CLI Tests, manifest with a failed concatenation"""
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {"inputs": INPUTFILES_S3P, "output": str(tmp_path / "a.s3p")},
+                {"inputs": INPUTFILES_S3P[:2]},
+            ]
+        )
+    )
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        main(["--manifest", str(manifest), "--jobs", "2"])
+    captured = capsys.readouterr()
+    assert pytest_wrapped_e.value.code == 1
+    assert "has been stored in {}".format(tmp_path / "a.s3p") in captured.out
+    assert "failed: Wrong number of files: 2" in captured.out
+    assert "1 of 2 concatenations failed" in captured.out
+
+
+def test_main_args_manifest_and_inputfiles(capsys):
+    """CLI Tests, a manifest and input files can not be given at once"""
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        main(INPUTFILES_S3P + ["--manifest", "manifest.json"])
+    captured = capsys.readouterr()
+    assert pytest_wrapped_e.value.code == 2
+    assert "usage:" in captured.err
+
+
 def test_main_args_inputfile(capsys):
     """CLI Tests, file input arguments"""
     # capsys is a pytest fixture that allows asserts agains stdout/stderr
@@ -118,6 +458,148 @@ def test_main_args_inputfile(capsys):
     )
 
 
+def test_main_args_pair_pattern(tmp_path, capsys):
+    """CLI Tests, files in any order with the default pair pattern"""
+    inputfiles = []
+    for pair, inputfile in zip(("1_2", "1_3", "2_3"), INPUTFILES_S3P):
+        inputfiles.append(str(tmp_path / "dut_p{}.s2p".format(pair)))
+        rf.Network(inputfile).write_touchstone(inputfiles[-1])
+    outputfile = str(tmp_path / "out.s3p")
+    main(inputfiles[::-1] + ["-o", outputfile, "--pair-pattern"])
+    assert "has been stored in {}".format(outputfile) in capsys.readouterr().out
+    np.testing.assert_allclose(
+        rf.Network(outputfile).s, rf.Network("./tests/data/golden.s3p").s, atol=1e-12
+    )
+    with pytest.raises(SystemExit):
+        main(inputfiles[:2] + ["-o", outputfile, "--pair-pattern"])
+    assert "Missing port pairs: p2_3" in capsys.readouterr().out
+
+    # The flag takes no value, so the input files can follow it
+    os.remove(outputfile)
+    main(["--pair-pattern"] + inputfiles[::-1] + ["-o", outputfile])
+    assert "has been stored in {}".format(outputfile) in capsys.readouterr().out
+    assert rf.Network(outputfile).nports == 3
+
+    regex = r"p(?P<first>\d)_?(?P<second>\d)\.s2p$"
+    main(["--pair-regex", regex] + inputfiles[::-1] + ["-o", outputfile])
+    assert "has been stored in {}".format(outputfile) in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main(["--pair-regex", "p(?P<first>", "-o", outputfile] + inputfiles)
+    assert "Wrong pair pattern" in capsys.readouterr().out
+
+
+def test_main_args_jobs(capsys):
+    """CLI Tests, parallel jobs"""
+    main(
+        [
+            "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+            "--jobs",
+            "3",
+        ]
+    )
+    captured = capsys.readouterr()
+    assert "has been stored in ./tests/data/evalboard_in_out.s3p\n" in captured.out
+
+
+def test_main_args_chunk(capsys):
+    """CLI Tests, streaming"""
+    main(
+        [
+            "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+            "--chunk",
+            "64",
+        ]
+    )
+    captured = capsys.readouterr()
+    assert "has been stored in ./tests/data/evalboard_in_out.s3p\n" in captured.out
+
+
+@pytest.mark.parametrize("chunk", [[], ["--chunk", "64"]])
+def test_main_args_data_format(tmp_path, capsys, chunk: list):
+    """CLI Tests, output format and digits"""
+    outputfile = str(tmp_path / "out.s3p")
+    main(
+        INPUTFILES_S3P
+        + ["-o", outputfile, "--data-format", "db", "--digits", "8"]
+        + chunk
+    )
+    assert "has been stored in {}".format(outputfile) in capsys.readouterr().out
+    with open(outputfile, "r") as touchstone:
+        assert "# Hz S DB R 50.0\n" in touchstone.read()
+    assert rf.Network(outputfile) == rf.Network("./tests/data/golden.s3p")
+    with pytest.raises(SystemExit):
+        main(INPUTFILES_S3P + ["-o", outputfile, "--digits", "18"])
+    assert "Wrong number of digits: 18" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("chunk", [None, 16])
+def test_s_cat_band(tmp_path, chunk: int):
+    """Only the points inside the band are concatenated"""
+    outputfile = s_cat(
+        INPUTFILES_S3P,
+        str(tmp_path / "out.s3p"),
+        None,
+        chunk=chunk,
+        fmin=2e8,
+        fmax=6e8,
+    )
+    golden = rf.Network("./tests/data/golden.s3p")
+    golden = golden[band_slice(golden.f, 2e8, 6e8)]
+    assert rf.Network(outputfile) == golden
+    networks = [rf.Network(inputfile) for inputfile in INPUTFILES_S3P]
+    assert cat_networks(networks, fmin=2e8, fmax=6e8) == golden
+    with pytest.raises(ValueError, match="No frequency points"):
+        s_cat(INPUTFILES_S3P, str(tmp_path / "out.s3p"), None, fmin=2e9)
+    with pytest.raises(ValueError, match="No frequency points"):
+        cat_networks(networks, fmin=2e9)
+
+
+def _version_2(directory, inputfile: str) -> str:
+    """Copy of a two port file in Touchstone 2, only read by scikit-rf"""
+    with open(inputfile, "r") as touchstone:
+        records = [
+            line
+            for line in touchstone.read().splitlines()
+            if line.strip() and not line.lstrip().startswith(("!", "#"))
+        ]
+    outputfile = os.path.join(str(directory), "v2_" + os.path.basename(inputfile))
+    with open(outputfile, "w") as touchstone:
+        touchstone.write(
+            "[Version] 2.0\n# HZ S DB R 50.0\n[Number of Ports] 2\n"
+            "[Two-Port Data Order] 21_12\n[Number of Frequencies] {}\n"
+            "[Network Data]\n{}\n[End]\n".format(len(records), "\n".join(records))
+        )
+    return outputfile
+
+
+@pytest.mark.parametrize("chunk", [7, 16])
+def test_s_cat_band_fallback(tmp_path, chunk: int):
+    """Files read natively and by scikit-rf are cut in the same blocks"""
+    inputfiles = INPUTFILES_S3P[:2] + [_version_2(tmp_path, INPUTFILES_S3P[2])]
+    blocks = [
+        [
+            len(block.frequency)
+            for block in iter_touchstone(inputfile, chunk, 2.1e8, 6e8)
+        ]
+        for inputfile in (INPUTFILES_S3P[2], inputfiles[2])
+    ]
+    assert blocks[0] == blocks[1]
+    outputfile = s_cat(
+        inputfiles,
+        str(tmp_path / "out.s3p"),
+        None,
+        chunk=chunk,
+        fmin=2.1e8,
+        fmax=6e8,
+    )
+    golden = rf.Network("./tests/data/golden.s3p")
+    assert rf.Network(outputfile) == golden[band_slice(golden.f, 2.1e8, 6e8)]
+
+
 def test_main_no_args(capsys):
     """CLI Tests, no input arguments"""
     with pytest.raises(SystemExit) as pytest_wrapped_e:
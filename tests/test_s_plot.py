@@ -1,7 +1,27 @@
+import shutil
+
+import matplotlib.pyplot as plt
+import numpy as np
 import PyPDF2
 import pytest
+import skrf as rf
+from PIL import Image
 
-from stouchtool.s_plot import main, run, s_plot
+from stouchtool.s_cat import s_cat
+from stouchtool.s_plot import (
+    _GridPlotter,
+    _Plotter,
+    expand_inputs,
+    main,
+    minmax_decimate,
+    output_format,
+    plot_figure,
+    run,
+    s_plot,
+    s_plot_batch,
+    select_traces,
+)
+from stouchtool.touchstone import band_slice
 
 __author__ = "Jesús Lázaro"
 __copyright__ = "Jesús Lázaro"
@@ -66,7 +86,7 @@ def test_s_plot_ok(
 
 def test_s_plot_except():
     """Test the API with non existing file to check for error"""
-    with pytest.raises(SystemExit):
+    with pytest.raises(ValueError):
         # non existing file
         assert s_plot("kk.s3p", "./tests/data/test.pdf", None) == (
             "./tests/data/evalboard.s2p",
@@ -75,6 +95,387 @@ def test_s_plot_except():
         )
 
 
+def test_s_plot_in_memory(tmp_path):
+    """Networks and arrays are plotted without reading any file"""
+    network = rf.Network("./tests/data/evalboard.s3p")
+    output = str(tmp_path / "network.pdf")
+    assert s_plot(network, output, None) == (network, output, 3)
+    pdfReader = PyPDF2.PdfFileReader(open(output, "rb"))
+    assert pdfReader.getPage(0).extractText().find("evalboard") > -1
+
+    data = (network.f, network.s)
+    assert s_plot(data, str(tmp_path / "arrays.png"), "Arrays")[2] == 3
+    with pytest.raises(ValueError, match="output file name"):
+        s_plot(data, None, None)
+    with pytest.raises(ValueError, match="Wrong S parameters"):
+        s_plot((network.f[1:], network.s), output, None)
+
+
+def test_plot_figure():
+    """The figure is not saved nor closed"""
+    network = rf.Network("./tests/data/limiter_pin_0dBm.s2p")
+    fig = plot_figure((network.f, network.s), "Limiter", traces="S21")
+    assert plt.fignum_exists(fig.number)
+    assert fig.axes[0].get_title() == "Limiter"
+    assert len(fig.axes[0].collections[0].get_segments()) == 1
+    plt.close(fig)
+    fig = plot_figure("./tests/data/golden.s4p", layout="grid")
+    assert fig.get_suptitle() == "golden"
+    plt.close(fig)
+    count = len(plt.get_fignums())
+    with pytest.raises(ValueError):
+        plot_figure(network, traces="S33")
+    assert len(plt.get_fignums()) == count
+
+
+def test_plot_figure_band():
+    """Only the points inside the band are plotted"""
+    network = rf.Network("./tests/data/limiter_pin_0dBm.s2p")
+    for input in ("./tests/data/limiter_pin_0dBm.s2p", network, (network.f, network.s)):
+        fig = plot_figure(input, traces="S21", max_points=0, fmin=2e8, fmax=4e8)
+        (segment,) = fig.axes[0].collections[0].get_segments()
+        assert segment[0, 0] >= 2e8 and segment[-1, 0] <= 4e8
+        assert len(segment) == len(network.f[band_slice(network.f, 2e8, 4e8)])
+        plt.close(fig)
+    with pytest.raises(ValueError, match="No frequency points"):
+        plot_figure(network, fmin=1e12)
+
+
+@pytest.mark.parametrize(
+    "extension,magic", [("pdf", b"%PDF"), ("png", b"\x89PNG"), ("svg", b"<?xml")]
+)
+def test_s_plot_formats(tmp_path, extension: str, magic: bytes):
+    """Format from the extension of the output file"""
+    output = str(tmp_path / "plot.{}".format(extension.upper()))
+    assert s_plot("./tests/data/evalboard.s3p", output, None)[1] == output
+    with open(output, "rb") as outputfile:
+        assert outputfile.read(len(magic)) == magic
+
+
+def test_s_plot_default_format(tmp_path):
+    """Output file from the input file and the default format"""
+    shutil.copy("./tests/data/evalboard.s3p", str(tmp_path / "evalboard.s3p"))
+    inputfile = str(tmp_path / "evalboard.s3p")
+    assert s_plot(inputfile, None, None, default_format="svg")[1] == str(
+        tmp_path / "evalboard.svg"
+    )
+    assert (tmp_path / "evalboard.svg").exists()
+
+
+def test_s_plot_dpi(tmp_path):
+    """Resolution of images"""
+    sizes = []
+    for dpi in [50, 100]:
+        output = str(tmp_path / "plot{}.png".format(dpi))
+        s_plot("./tests/data/evalboard.s3p", output, None, dpi=dpi)
+        with Image.open(output) as image:
+            sizes.append(image.size)
+    assert 1.9 < sizes[1][0] / sizes[0][0] < 2.1
+
+
+@pytest.mark.parametrize("layout", ["overlay", "grid"])
+def test_s_plot_rasterize(tmp_path, layout: str):
+    """Traces as an image, texts as text"""
+    output = str(tmp_path / "plot.pdf")
+    for rasterize in [False, True]:
+        s_plot(
+            "./tests/data/limiter_pin_0dBm.s2p",
+            output,
+            "Hybrid",
+            rasterize=rasterize,
+            layout=layout,
+        )
+        with open(output, "rb") as outputfile:
+            assert (b"/Subtype /Image" in outputfile.read()) == rasterize
+        with open(output, "rb") as pdfFileObject:
+            text = PyPDF2.PdfFileReader(pdfFileObject).getPage(0).extractText()
+        assert "Hybrid" in text and "S22" in text
+
+
+def test_output_format():
+    """Known extensions only"""
+    assert output_format("a/b.Png") == "png"
+    with pytest.raises(ValueError):
+        output_format("plot.jpg")
+    with pytest.raises(ValueError):
+        s_plot("./tests/data/evalboard.s3p", "plot", None)
+    with pytest.raises(ValueError):
+        s_plot_batch(["./tests/data/evalboard.s3p"], "plots.png")
+
+
+def test_s_plot_closes_figure():
+    """The figure must be freed after plotting"""
+    s_plot("./tests/data/limiter_pin_0dBm.s2p", "./tests/data/test.pdf", None)
+    assert plt.get_fignums() == []
+
+
+def test_minmax_decimate():
+    """Envelope of every trace kept, in order, two points per column"""
+    rng = np.random.default_rng(0)
+    x = np.sort(rng.uniform(0, 1, 10000))
+    x[0], x[-1] = 0, 1
+    y = rng.normal(size=(10000, 3))
+    y[5000:5100, 1] = np.nan
+    indices = minmax_decimate(x, y, 100)
+    assert indices.shape == (200, 3)
+    assert (np.diff(indices, axis=0) >= 0).all()
+    kept = y[indices, np.arange(3)]
+    np.testing.assert_array_equal(np.nanmax(kept, axis=0), np.nanmax(y, axis=0))
+    np.testing.assert_array_equal(np.nanmin(kept, axis=0), np.nanmin(y, axis=0))
+    for column in range(100):
+        inside = np.minimum(np.floor(x * 100), 99) == column
+        points = indices[2 * column : 2 * column + 2, 0]
+        assert inside[points].all()
+        assert set(y[points, 0]) == {y[inside, 0].min(), y[inside, 0].max()}
+
+
+@pytest.mark.parametrize("max_points,expected", [(None, None), (500, 500), (0, 20000)])
+def test_plotter_max_points(max_points: int, expected: int):
+    """Long traces are decimated unless disabled"""
+    frequency = np.linspace(1e6, 1e9, 20000)
+    s = np.exp(1j * frequency / 1e7)[:, None, None] * np.full((1, 2, 2), 0.5)
+    with _Plotter(max_points) as plotter:
+        plotter.draw(frequency, s, "decimated")
+        if expected is None:
+            expected = plotter.max_points
+            assert 0 < expected < 20000
+        segments = plotter.traces.get_segments()
+        assert len(segments) == 4
+        for segment in segments:
+            assert expected // 2 < len(segment) <= expected
+    assert plt.get_fignums() == []
+
+
+def test_plotter_traces():
+    """All the traces in one collection, updated in place"""
+    frequency = np.linspace(1e6, 1e9, 101)
+    s = np.arange(1, 10).reshape(1, 3, 3) * np.ones((101, 1, 1)) / 10
+    s[50, 0, 0] = 0
+    with _Plotter() as plotter:
+        plotter.draw(frequency, s, "first")
+        traces = plotter.traces
+        assert len(plotter.ax.lines) == 0
+        assert list(plotter.ax.collections) == [traces]
+        segments = traces.get_segments()
+        np.testing.assert_array_equal(segments[5][:, 0], frequency)
+        np.testing.assert_allclose(segments[5][:, 1], 20 * np.log10(0.6))
+        # Zeros are gaps, not -inf
+        assert len(segments[0]) == 100
+        assert np.isfinite(segments[0]).all()
+        labels = [text.get_text() for text in plotter.ax.get_legend().get_texts()]
+        assert labels == ["S11", "S12", "S13", "S21", "S22", "S23", "S31", "S32", "S33"]
+        ylim = plotter.ax.get_ylim()
+        assert ylim[0] < 20 * np.log10(0.1) and ylim[1] > 20 * np.log10(0.9)
+
+        plotter.draw(frequency[:11], np.full((11, 2, 2), 0.5), "second")
+        assert plotter.traces is traces
+        assert len(traces.get_segments()) == 4
+        assert plotter.ax.get_title() == "second"
+        assert plotter.ax.get_ylim()[1] < 0
+
+
+def test_plotter_legend_matrix():
+    """Many ports, a legend column per output port"""
+    frequency = np.linspace(1e6, 1e9, 11)
+    with _Plotter() as plotter:
+        plotter.draw(frequency, np.full((11, 6, 6), 0.5), "matrix")
+        legend = plotter.ax.get_legend()
+        box = legend.get_window_extent()
+        assert box.x0 > plotter.ax.get_window_extent().x1
+        # Six columns of six entries
+        assert box.width > 2 * box.height
+        labels = [text.get_text() for text in legend.get_texts()]
+        assert labels[:3] == ["S11", "S12", "S13"]
+        assert len(labels) == 36
+
+
+@pytest.mark.parametrize(
+    "traces,expected",
+    [
+        (None, list(range(9))),
+        ("all", list(range(9))),
+        ("S21,S31", [3, 6]),
+        ("s31, S2_1", [3, 6]),
+        ("reflection", [0, 4, 8]),
+        ("transmission", [1, 2, 3, 5, 6, 7]),
+        ("upper", [0, 1, 2, 4, 5, 8]),
+        ("reflection,S12", [0, 1, 4, 8]),
+    ],
+)
+def test_select_traces(traces: str, expected: list):
+    """Names and groups of S parameters"""
+    assert list(select_traces(traces, 3)) == expected
+
+
+@pytest.mark.parametrize("traces", ["S41", "S0_1", "T21", "S2", "transmission"])
+def test_select_traces_wrong(traces: str):
+    """S parameters not in the network, unknown names, empty selections"""
+    NumPorts = 1 if traces == "transmission" else 3
+    with pytest.raises(ValueError):
+        select_traces(traces, NumPorts)
+
+
+def test_select_traces_many_ports():
+    """Ports over 9 need the separator"""
+    assert list(select_traces("S12_3,S1_11", 12)) == [10, 134]
+
+
+def test_plotter_legend_many_ports():
+    """Unambiguous labels over 9 ports"""
+    frequency = np.linspace(1e6, 1e9, 11)
+    with _Plotter() as plotter:
+        plotter.draw(frequency, np.full((11, 12, 12), 0.5), "many")
+        labels = [text.get_text() for text in plotter.ax.get_legend().get_texts()]
+        assert len(set(labels)) == len(labels) == 144
+        assert labels[22] == "S2_11"
+        assert labels[120] == "S11_1"
+        assert list(select_traces(",".join(labels), 12)) == list(range(144))
+
+
+def test_plotter_selected_traces():
+    """Only the selected traces are drawn"""
+    frequency = np.linspace(1e6, 1e9, 11)
+    s = np.arange(1, 17).reshape(1, 4, 4) * np.ones((11, 1, 1)) / 20
+    with _Plotter() as plotter:
+        plotter.draw(frequency, s, "selected", "S21,S43")
+        segments = plotter.traces.get_segments()
+        assert len(segments) == 2
+        np.testing.assert_allclose(segments[0][:, 1], 20 * np.log10(5 / 20))
+        np.testing.assert_allclose(segments[1][:, 1], 20 * np.log10(15 / 20))
+        labels = [text.get_text() for text in plotter.ax.get_legend().get_texts()]
+        assert labels == ["S21", "S43"]
+
+
+def test_grid_plotter():
+    """A trace per axes, shared, unselected axes hidden"""
+    frequency = np.linspace(1e6, 1e9, 11)
+    s = np.arange(1, 10).reshape(1, 3, 3) * np.ones((11, 1, 1)) / 10
+    with _GridPlotter() as plotter:
+        plotter.draw(frequency, s, "grid", "upper")
+        axes = plotter.axes
+        assert axes.shape == (3, 3)
+        assert [ax.get_visible() for ax in axes.flat] == [
+            True,
+            True,
+            True,
+            False,
+            True,
+            True,
+            False,
+            False,
+            True,
+        ]
+        assert axes[1, 2].get_title() == "S23"
+        np.testing.assert_allclose(axes[1, 2].lines[0].get_ydata(), 20 * np.log10(0.6))
+        assert axes[0, 0].get_ylim() == axes[2, 2].get_ylim()
+        assert axes[0, 0].get_ylim()[1] > 20 * np.log10(0.9)
+        assert plotter.fig.get_suptitle() == "grid"
+        fig = plotter.fig
+
+        plotter.draw(frequency, s, "again")
+        assert plotter.fig is fig
+        assert all(ax.get_visible() for ax in axes.flat)
+
+        plotter.draw(frequency, np.full((11, 2, 2), 0.5), "two ports")
+        assert plotter.axes.shape == (2, 2)
+        assert plt.get_fignums() == [plotter.fig.number]
+    assert plt.get_fignums() == []
+
+
+def test_s_plot_batch_multipage(tmp_path):
+    """One page per input, with its own title and traces"""
+    inputs = [
+        "./tests/data/limiter_pin_0dBm.s2p",
+        "./tests/data/evalboard.s3p",
+        "./tests/data/golden.s4p",
+    ]
+    output = str(tmp_path / "all.pdf")
+    assert s_plot_batch(inputs, output) == [
+        (inputs[0], output, 2, None),
+        (inputs[1], output, 3, None),
+        (inputs[2], output, 4, None),
+    ]
+    assert plt.get_fignums() == []
+    with open(output, "rb") as pdfFileObject:
+        pdfReader = PyPDF2.PdfFileReader(pdfFileObject)
+        assert pdfReader.numPages == 3
+        for page, title, trace in zip(
+            range(3), ["limiter_pin_0dBm", "evalboard", "golden"], ["S22", "S33", "S44"]
+        ):
+            text = pdfReader.getPage(page).extractText()
+            assert title in text
+            assert trace in text
+        assert "S33" not in pdfReader.getPage(0).extractText()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_s_plot_batch_per_input(tmp_path, jobs: int):
+    """One PDF per input next to it, failures do not stop the others"""
+    inputs = []
+    for name in ["limiter_pin_0dBm.s2p", "evalboard.s3p", "golden.s4p"]:
+        shutil.copy("./tests/data/" + name, str(tmp_path / name))
+        inputs.append(str(tmp_path / name))
+    inputs.insert(1, str(tmp_path / "kk.s2p"))
+    results = s_plot_batch(inputs, jobs=jobs)
+    assert [result[0] for result in results] == inputs
+    assert results[1][1:3] == (None, None)
+    assert "kk.s2p" in results[1][3]
+    del inputs[1], results[1]
+    for inputfile, (_, outputfile, ports, error), title in zip(
+        inputs, results, ["limiter_pin_0dBm", "evalboard", "golden"]
+    ):
+        assert error is None
+        assert outputfile == inputfile[:-4] + ".pdf"
+        with open(outputfile, "rb") as pdfFileObject:
+            pdfReader = PyPDF2.PdfFileReader(pdfFileObject)
+            assert pdfReader.numPages == 1
+            assert title in pdfReader.getPage(0).extractText()
+    assert [result[2] for result in results] == [2, 3, 4]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_s_plot_batch_shared_output(tmp_path, jobs: int):
+    """Inputs plotted in the file of an earlier input fail"""
+    inputs = []
+    for name in ["golden.s3p", "golden.s4p", "evalboard.s3p"]:
+        shutil.copy("./tests/data/" + name, str(tmp_path / name))
+        inputs.append(str(tmp_path / name))
+    results = s_plot_batch(inputs, jobs=jobs, default_format="png")
+    assert [result[1:3] for result in results] == [
+        (str(tmp_path / "golden.png"), 3),
+        (None, None),
+        (str(tmp_path / "evalboard.png"), 3),
+    ]
+    assert results[1][3] == "The output file {} is already plotted from {}".format(
+        tmp_path / "golden.png", inputs[0]
+    )
+
+
+def test_expand_inputs():
+    """Glob patterns are expanded in order, plain names kept"""
+    assert expand_inputs(["./tests/data/evalboard_*.s2p", "kk.s2p"]) == [
+        "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+        "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+        "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+        "kk.s2p",
+    ]
+    with pytest.raises(ValueError):
+        expand_inputs(["./tests/data/*.s9p"])
+
+
+def test_expand_inputs_directory(tmp_path):
+    """Touchstone files of a directory, in order"""
+    for name in ["b.s2p", "a.S3P", "notes.txt", "c.pdf"]:
+        (tmp_path / name).write_text("")
+    assert expand_inputs([str(tmp_path)]) == [
+        str(tmp_path / "a.S3P"),
+        str(tmp_path / "b.s2p"),
+    ]
+    (tmp_path / "empty").mkdir()
+    with pytest.raises(ValueError):
+        expand_inputs([str(tmp_path / "empty")])
+
+
 def test_main(capsys):
     """CLI Tests"""
     # capsys is a pytest fixture that allows asserts agains stdout/stderr
@@ -104,3 +505,120 @@ def test_simple_run():
         run()
     assert pytest_wrapped_e.type == SystemExit
     assert pytest_wrapped_e.value.code == 2
+
+
+def _two_nports(directory) -> str:
+    """Two n port files in a directory, and the glob matching both"""
+    shutil.copy("./tests/data/evalboard.s3p", str(directory / "evalboard.s3p"))
+    s_cat(
+        [
+            "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+            "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+        ],
+        str(directory / "evalboard_in_out.s3p"),
+        None,
+    )
+    return str(directory / "evalboard*.s3p")
+
+
+def test_main_many(capsys, tmp_path):
+    """CLI Tests, glob into a multipage PDF"""
+    output = str(tmp_path / "all.pdf")
+    main([_two_nports(tmp_path), "-o", output])
+    captured = capsys.readouterr()
+    assert captured.out == (
+        "The plot from file {1} has 3 ports and has been ploted in {0}\n"
+        "The plot from file {2} has 3 ports and has been ploted in {0}\n"
+        "0 of 2 plots failed\n".format(
+            output, tmp_path / "evalboard.s3p", tmp_path / "evalboard_in_out.s3p"
+        )
+    )
+    with open(output, "rb") as pdfFileObject:
+        assert PyPDF2.PdfFileReader(pdfFileObject).numPages == 2
+
+
+def test_main_failed(capsys, tmp_path):
+    """CLI Tests, parallel plots with a failure summary"""
+    for name in ["limiter_pin_0dBm.s2p", "evalboard.s3p"]:
+        shutil.copy("./tests/data/" + name, str(tmp_path / name))
+    (tmp_path / "wrong.s2p").write_text("# Hz S RI R 50\n1 a b c d e f g h\n")
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        main([str(tmp_path), "--jobs", "2"])
+    assert pytest_wrapped_e.value.code == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith(
+        "The plot from file {} has 3 ports".format(tmp_path / "evalboard.s3p")
+    )
+    assert lines[1].startswith(
+        "The plot from file {} has 2 ports".format(tmp_path / "limiter_pin_0dBm.s2p")
+    )
+    assert lines[2].startswith(
+        "The plot from file {} failed: ".format(tmp_path / "wrong.s2p")
+    )
+    assert lines[3] == "1 of 3 plots failed"
+
+
+def test_main_single_failed(capsys):
+    """CLI Tests, non existing file"""
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        main(["kk.s3p"])
+    assert pytest_wrapped_e.value.code == 1
+    assert capsys.readouterr().out.startswith("The plot from file kk.s3p failed: ")
+
+
+@pytest.mark.parametrize("layout", ["overlay", "grid"])
+def test_main_traces(capsys, tmp_path, layout: str):
+    """CLI Tests, selected traces"""
+    output = str(tmp_path / "selected.pdf")
+    main(
+        [
+            "./tests/data/evalboard.s3p",
+            "-o",
+            output,
+            "--traces",
+            "S21,S31",
+            "--layout",
+            layout,
+        ]
+    )
+    assert "has 3 ports" in capsys.readouterr().out
+    with open(output, "rb") as pdfFileObject:
+        text = PyPDF2.PdfFileReader(pdfFileObject).getPage(0).extractText()
+    assert "S21" in text and "S31" in text
+    assert "S11" not in text and "S32" not in text
+
+
+def test_main_traces_wrong(capsys):
+    """CLI Tests, trace not in the network"""
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        main(
+            [
+                "./tests/data/evalboard.s3p",
+                "-o",
+                "./tests/data/test.pdf",
+                "--traces",
+                "S44",
+            ]
+        )
+    assert pytest_wrapped_e.value.code == 1
+    assert "S44 is not a S parameter of a 3 port network" in capsys.readouterr().out
+
+
+def test_main_format(capsys, tmp_path):
+    """CLI Tests, one PNG per input"""
+    for name in ["limiter_pin_0dBm.s2p", "evalboard.s3p"]:
+        shutil.copy("./tests/data/" + name, str(tmp_path / name))
+    main([str(tmp_path), "--format", "png", "--dpi", "50"])
+    assert "0 of 2 plots failed" in capsys.readouterr().out
+    for name in ["limiter_pin_0dBm.png", "evalboard.png"]:
+        with Image.open(str(tmp_path / name)) as image:
+            assert image.format == "PNG"
+
+
+def test_main_multipage_format(capsys, tmp_path):
+    """CLI Tests, multipage output that is not a PDF"""
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        main([_two_nports(tmp_path), "-o", str(tmp_path / "all.svg")])
+    assert pytest_wrapped_e.value.code == 1
+    assert "must be a PDF file" in capsys.readouterr().err
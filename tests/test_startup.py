@@ -0,0 +1,52 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+# Wall time allowed for ``--help``, in seconds. It used to take about a second
+# just to import scikit-rf, scipy and matplotlib.
+STARTUP_BUDGET = 1.5
+
+HEAVY_MODULES = ("skrf", "scipy", "matplotlib")
+
+
+@pytest.mark.parametrize(
+    "module", ["stouchtool.s_cat", "stouchtool.s_plot", "stouchtool.validation"]
+)
+def test_help_heavy_modules(module: str):
+    """The CLI help must not import the heavy dependencies"""
+    code = (
+        "import sys\n"
+        "from {} import main\n"
+        "try:\n"
+        "    main(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print([name for name in {} if name in sys.modules])\n"
+    ).format(module, HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.splitlines()[-1] == "[]"
+
+
+@pytest.mark.parametrize(
+    "module", ["stouchtool.s_cat", "stouchtool.s_plot", "stouchtool.validation"]
+)
+def test_help_startup_time(module: str):
+    """The CLI help must be shown within the startup budget"""
+    elapsed = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", module, "--help"],
+            capture_output=True,
+            check=True,
+        )
+        elapsed.append(time.perf_counter() - start)
+    assert min(elapsed) < STARTUP_BUDGET
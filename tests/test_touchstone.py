@@ -0,0 +1,309 @@
+import io
+
+import numpy as np
+import pytest
+import skrf as rf
+
+import stouchtool.touchstone as touchstone_module
+from stouchtool.touchstone import (
+    TouchstoneFormatError,
+    band_slice,
+    iter_touchstone,
+    load_network,
+    parse_options,
+    read_touchstone,
+    write_header,
+    write_network,
+    write_records,
+    write_touchstone,
+)
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+
+@pytest.mark.parametrize(
+    "inputfile, ports",
+    [
+        ("./tests/data/limiter_pin_0dBm.s2p", 2),
+        ("./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p", 2),
+        ("./tests/data/evalboard.s3p", 3),
+        ("./tests/data/golden.s4p", 4),
+    ],
+)
+def test_read_touchstone(inputfile: str, ports: int):
+    """Native reader must match scikit-rf"""
+    data = read_touchstone(inputfile)
+    reference = rf.Network(inputfile)
+    assert data.number_of_ports == ports
+    assert data.s.shape == reference.s.shape
+    np.testing.assert_allclose(data.frequency, reference.f)
+    np.testing.assert_allclose(data.s, reference.s, atol=1e-12)
+    assert load_network(inputfile) == reference
+
+
+@pytest.mark.parametrize(
+    "data_format, values",
+    [
+        ("RI", "0.5 0.5"),
+        ("MA", "0.7071067811865476 45"),
+        ("DB", "-3.010299956639812 45"),
+    ],
+)
+def test_read_touchstone_formats(tmp_path, data_format: str, values: str):
+    """All data formats, comments and multi-line records"""
+    inputfile = tmp_path / "one.s1p"
+    inputfile.write_text(
+        "! comment\n# MHz S {} R 75\n1 {} ! inline\n2\n{}\n".format(
+            data_format, values, values
+        )
+    )
+    data = read_touchstone(str(inputfile))
+    np.testing.assert_allclose(data.frequency, [1e6, 2e6])
+    np.testing.assert_allclose(data.s[:, 0, 0], [0.5 + 0.5j, 0.5 + 0.5j])
+    assert data.z0 == 75
+    assert data.frequency_unit == "MHz"
+
+
+def test_parse_options_defaults():
+    """Touchstone defaults when the option line is empty"""
+    assert parse_options("") == ("ghz", "s", "ma", 50.0)
+
+
+@pytest.mark.parametrize(
+    "filename, content",
+    [
+        ("wrong.txt", "# Hz S RI R 50\n1 0 0\n"),
+        ("wrong.s1p", "# Hz Z RI R 50\n1 0 0\n"),
+        ("wrong.s1p", "# Hz S RI R 50\n1 0 0 2\n"),
+        ("wrong.s1p", "# Hz S RI R 50\n1 0 x\n"),
+        ("wrong.s1p", "# Hz S RI R 50\n2 0 0\n1 0 0\n"),
+        ("wrong.s1p", "[Version] 2.0\n# Hz S RI R 50\n1 0 0\n"),
+        ("wrong.s1p", "# Hz S RI Q 50\n1 0 0\n"),
+    ],
+)
+def test_read_touchstone_unsupported(tmp_path, filename: str, content: str):
+    """Files the native reader does not handle"""
+    inputfile = tmp_path / filename
+    inputfile.write_text(content)
+    with pytest.raises(TouchstoneFormatError):
+        read_touchstone(str(inputfile))
+
+
+def test_load_network_fallback(tmp_path):
+    """Files the native reader does not handle are read by scikit-rf"""
+    inputfile = tmp_path / "impedance.s1p"
+    inputfile.write_text("# Hz Z RI R 50\n1 1 0\n2 1 0\n")
+    network = load_network(str(inputfile))
+    np.testing.assert_allclose(network.s[:, 0, 0], [0, 0], atol=1e-12)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 201, 1000])
+@pytest.mark.parametrize(
+    "inputfile",
+    ["./tests/data/limiter_pin_0dBm.s2p", "./tests/data/golden.s4p"],
+)
+def test_iter_touchstone(inputfile: str, chunk_size: int):
+    """Blocks of the streaming reader must add up to the whole file"""
+    data = read_touchstone(inputfile)
+    blocks = list(iter_touchstone(inputfile, chunk_size))
+    assert all(len(block.frequency) <= chunk_size for block in blocks)
+    np.testing.assert_array_equal(
+        np.concatenate([block.frequency for block in blocks]), data.frequency
+    )
+    np.testing.assert_array_equal(np.concatenate([block.s for block in blocks]), data.s)
+
+
+def test_iter_touchstone_fallback(tmp_path):
+    """Files the native reader does not handle are streamed from scikit-rf"""
+    inputfile = tmp_path / "impedance.s1p"
+    inputfile.write_text("# Hz Z RI R 50\n1 1 0\n2 1 0\n3 1 0\n")
+    blocks = list(iter_touchstone(str(inputfile), 2))
+    assert [len(block.frequency) for block in blocks] == [2, 1]
+
+
+@pytest.mark.parametrize(
+    "content",
+    ["# Hz S RI R 50\n1 0 0\n2 0\n", "# Hz S RI R 50\n1 0 0\n2 0 0\n2 0 0\n"],
+)
+def test_iter_touchstone_wrong(tmp_path, content: str):
+    """Broken data found while streaming"""
+    inputfile = tmp_path / "wrong.s1p"
+    inputfile.write_text(content)
+    with pytest.raises(TouchstoneFormatError):
+        list(iter_touchstone(str(inputfile), 1))
+
+
+@pytest.mark.parametrize(
+    "inputfile",
+    [
+        "./tests/data/limiter_pin_0dBm.s2p",
+        "./tests/data/golden.s3p",
+        "./tests/data/golden.s4p",
+    ],
+)
+def test_write_records(tmp_path, inputfile: str):
+    """Written records must read back the same"""
+    data = read_touchstone(inputfile)
+    outputfile = tmp_path / ("out" + inputfile[-4:])
+    with open(outputfile, "w") as output:
+        write_header(output, data.number_of_ports, "MHz", data.z0)
+        write_records(output, data.frequency[:5], data.s[:5], "MHz")
+        write_records(output, data.frequency[5:], data.s[5:], "MHz")
+    assert load_network(str(outputfile)) == rf.Network(inputfile)
+
+
+@pytest.mark.parametrize("data_format", ["ri", "ma", "db"])
+@pytest.mark.parametrize("digits", [6, 15, 17])
+@pytest.mark.parametrize(
+    "inputfile",
+    [
+        "./tests/data/limiter_pin_0dBm.s2p",
+        "./tests/data/golden.s3p",
+        "./tests/data/golden.s4p",
+    ],
+)
+def test_write_touchstone(tmp_path, inputfile: str, data_format: str, digits: int):
+    """Every format reads back within the precision of the digits"""
+    data = read_touchstone(inputfile)
+    outputfile = str(tmp_path / ("out" + inputfile[-4:]))
+    write_touchstone(
+        outputfile,
+        data.frequency,
+        data.s,
+        data.z0,
+        data.frequency_unit,
+        data_format,
+        digits,
+    )
+    written = read_touchstone(outputfile)
+    assert written.data_format == data_format.upper()
+    np.testing.assert_array_equal(written.frequency, data.frequency)
+    if data_format == "ri" and digits == 17:
+        np.testing.assert_array_equal(written.s, data.s)
+    np.testing.assert_allclose(written.s, data.s, rtol=10.0 ** (2 - digits))
+    assert load_network(outputfile) == rf.Network(inputfile)
+
+
+@pytest.mark.parametrize("digits", [1, 6, 12, 15])
+def test_write_records_rounding(digits: int):
+    """Values of any double are rounded as by printf"""
+    generator = np.random.default_rng(digits)
+    values = generator.normal(size=(5000, 2, 2, 2))
+    values *= 10.0 ** generator.integers(-12, 12, size=values.shape)
+    s = values[..., 0] + 1j * values[..., 1]
+    output = io.StringIO()
+    write_records(output, np.arange(1.0, 5001.0), s, "Hz", digits=digits)
+    written = np.array(output.getvalue().split(), dtype=float).reshape(5000, 9)
+    # Two port records are S11 S21 S12 S22
+    expected = s.transpose(0, 2, 1).reshape(5000, 4)
+    expected = np.stack((expected.real, expected.imag), axis=-1).ravel()
+    np.testing.assert_array_equal(
+        written[:, 1:].ravel(),
+        [float("%.*g" % (digits, value)) for value in expected.tolist()],
+    )
+
+
+def test_write_touchstone_lines(tmp_path):
+    """Rows of more than 4 ports are wrapped, every row starts a line"""
+    generator = np.random.default_rng(0)
+    frequency = np.linspace(1e6, 1e9, 11)
+    s = generator.normal(size=(11, 6, 6)) + 1j * generator.normal(size=(11, 6, 6))
+    outputfile = str(tmp_path / "out.s6p")
+    write_touchstone(outputfile, frequency, s, digits=8)
+    with open(outputfile, "r") as touchstone:
+        lines = touchstone.read().splitlines()[2:]
+    assert len(lines) == 11 * 6 * 2
+    for index, line in enumerate(lines):
+        # 4 pairs then 2 pairs per row, the first line after the frequency
+        pairs = 4 if index % 2 == 0 else 2
+        assert len(line.split()) == 2 * pairs + (index % 12 == 0)
+        assert line.startswith(" ") != (index % 12 == 0)
+    written = read_touchstone(outputfile)
+    np.testing.assert_array_equal(written.frequency, frequency)
+    np.testing.assert_allclose(written.s, s, rtol=1e-7)
+
+
+def test_write_touchstone_two_ports(tmp_path):
+    """Two port records are S11 S21 S12 S22 in a single line"""
+    s = np.array([[[1, 2], [3, 4]]], dtype=complex)
+    outputfile = str(tmp_path / "out.s2p")
+    write_touchstone(outputfile, np.array([1e9]), s, frequency_unit="GHz")
+    with open(outputfile, "r") as touchstone:
+        assert touchstone.read().splitlines()[1:] == [
+            "# GHz S RI R 50.0",
+            "1.0 1 0 3 0 2 0 4 0",
+        ]
+
+
+@pytest.mark.parametrize("data_format, digits", [("ri", 0), ("ri", 18), ("xy", 6)])
+def test_write_touchstone_wrong(tmp_path, data_format: str, digits: int):
+    """Unknown format or digits"""
+    with pytest.raises(ValueError):
+        write_touchstone(
+            str(tmp_path / "out.s1p"),
+            np.array([1.0]),
+            np.ones((1, 1, 1), dtype=complex),
+            data_format=data_format,
+            digits=digits,
+        )
+
+
+def test_write_network_impedance(tmp_path):
+    """Touchstone v1 files have a single real impedance"""
+    network = rf.Network("./tests/data/golden.s3p")
+    outputfile = str(tmp_path / "out.s3p")
+    write_network(network, outputfile, "ma", 12)
+    assert rf.Network(outputfile) == network
+    network.z0 = [50, 75, 100]
+    with pytest.raises(ValueError):
+        write_network(network, outputfile)
+
+
+def test_band_slice():
+    """Both limits are included"""
+    frequency = np.array([1.0, 2.0, 3.0, 4.0])
+    assert band_slice(frequency) == slice(0, 4)
+    assert band_slice(frequency, 2.0, 3.0) == slice(1, 3)
+    assert band_slice(frequency, 1.5) == slice(1, 4)
+    assert band_slice(frequency, fmax=0.5) == slice(0, 0)
+    with pytest.raises(ValueError):
+        band_slice(frequency, 3.0, 2.0)
+
+
+@pytest.mark.parametrize(
+    "inputfile",
+    [
+        "./tests/data/limiter_pin_0dBm.s2p",
+        "./tests/data/golden.s4p",
+    ],
+)
+@pytest.mark.parametrize("fmin, fmax", [(None, 5e8), (2e8, None), (2.1e8, 7.9e8)])
+def test_read_touchstone_band(inputfile: str, fmin: float, fmax: float):
+    """Only the points inside the band, in blocks or at once"""
+    data = read_touchstone(inputfile)
+    rows = band_slice(data.frequency, fmin, fmax)
+    band = read_touchstone(inputfile, fmin, fmax)
+    np.testing.assert_array_equal(band.frequency, data.frequency[rows])
+    np.testing.assert_array_equal(band.s, data.s[rows])
+    blocks = list(iter_touchstone(inputfile, 7, fmin, fmax))
+    assert all(len(block.frequency) <= 7 for block in blocks)
+    np.testing.assert_array_equal(
+        np.concatenate([block.s for block in blocks]), data.s[rows]
+    )
+    assert load_network(inputfile, fmin=fmin, fmax=fmax) == rf.Network(inputfile)[rows]
+
+
+def test_read_touchstone_band_stops(tmp_path, monkeypatch):
+    """The file is not read after the band"""
+    monkeypatch.setattr(touchstone_module, "_READ_HINT", 1000)
+    monkeypatch.setattr(touchstone_module, "_BAND_BLOCK", 64)
+    inputfile = tmp_path / "broken.s2p"
+    with open("./tests/data/limiter_pin_0dBm.s2p", "r") as touchstone:
+        inputfile.write_text(touchstone.read() + "broken\n")
+    with pytest.raises(TouchstoneFormatError):
+        read_touchstone(str(inputfile))
+    assert read_touchstone(str(inputfile), fmax=1e8).frequency[-1] <= 1e8
+    with pytest.raises(ValueError, match="No frequency points"):
+        read_touchstone(str(inputfile), fmax=1.0)
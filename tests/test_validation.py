@@ -0,0 +1,206 @@
+import json
+
+import numpy as np
+import pytest
+import skrf as rf
+
+from stouchtool.s_cat import ManifestJob
+from stouchtool.s_cat import main as s_cat_main
+from stouchtool.s_cat import s_cat, s_cat_batch
+from stouchtool.validation import (
+    Validation,
+    Violation,
+    asymmetry,
+    check_file,
+    largest_singular_values,
+    main,
+    violation_ranges,
+)
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+INPUTFILES_S3P = [
+    "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+    "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+]
+
+
+def _passive(tmp_path) -> str:
+    """A passive and reciprocal 3 port file"""
+    rng = np.random.default_rng(5)
+    s = rng.normal(size=(50, 3, 3)) + 1j * rng.normal(size=(50, 3, 3))
+    s = s + s.transpose(0, 2, 1)
+    s /= 1.1 * np.linalg.svd(s, compute_uv=False)[:, :1, None]
+    network = rf.Network(frequency=rf.Frequency(1, 2, 50, unit="ghz"), s=s)
+    inputfile = str(tmp_path / "passive.s3p")
+    network.write_touchstone(inputfile)
+    return inputfile
+
+
+@pytest.mark.parametrize(
+    "inputfile", ["./tests/data/golden.s4p", "./tests/data/limiter_pin_0dBm.s2p"]
+)
+def test_largest_singular_values(inputfile: str):
+    """Exact above the limit, a bound not above it below"""
+    s = rf.Network(inputfile).s
+    expected = np.linalg.svd(s, compute_uv=False)[:, 0]
+    np.testing.assert_allclose(largest_singular_values(s), expected, rtol=1e-12)
+    values = largest_singular_values(s, 1.0)
+    above = values > 1.0
+    np.testing.assert_allclose(values[above], expected[above], rtol=1e-12)
+    assert np.all(expected[~above] <= values[~above] * (1 + 1e-12))
+    np.testing.assert_array_equal(above, expected > 1.0)
+
+
+def test_asymmetry():
+    """Largest |Sij - Sji| of every point"""
+    s = rf.Network("./tests/data/golden.s4p").s
+    expected = [
+        max(abs(point[i, j] - point[j, i]) for i in range(4) for j in range(4))
+        for point in s
+    ]
+    np.testing.assert_allclose(asymmetry(s), expected)
+    assert np.all(asymmetry(s[:, :1, :1]) == 0)
+
+
+def test_violation_ranges():
+    """Consecutive points above the limit"""
+    frequency = np.arange(1.0, 8.0)
+    values = np.array([2.0, 3.0, 0.0, 0.0, 4.0, 0.0, 5.0])
+    assert violation_ranges(frequency, values, 1.0) == [
+        Violation(1.0, 2.0, 2, 3.0, 2.0),
+        Violation(5.0, 5.0, 1, 4.0, 5.0),
+        Violation(7.0, 7.0, 1, 5.0, 7.0),
+    ]
+    assert violation_ranges(frequency, values, 5.0) == []
+
+
+def test_validation():
+    """Same ranges at once or in blocks"""
+    network = rf.Network("./tests/data/limiter_pin_0dBm.s2p")
+    validation = Validation()
+    validation.update(network.f, network.s)
+    assert not validation.passed()
+    assert [violation.points for violation in validation.passivity] == [4, 1, 1]
+    assert validation.passivity[0].worst == pytest.approx(1.0256813268384533)
+    assert [violation.points for violation in validation.reciprocity] == [62, 138]
+    lines = validation.report()
+    assert lines[0].startswith("Passivity: violated at 6 of 201 points")
+    assert len(lines) == 7
+
+    blocks = Validation()
+    for start in range(0, len(network.f), 7):
+        rows = slice(start, start + 7)
+        blocks.update(network.f[rows], network.s[rows])
+    assert blocks.passivity == validation.passivity
+    assert blocks.reciprocity == validation.reciprocity
+
+    validation = Validation(0.03, 0.1)
+    validation.update(network.f, network.s)
+    assert validation.passed()
+    assert validation.report() == [
+        "Passivity: passed, 201 points",
+        "Reciprocity: passed, 201 points",
+    ]
+
+
+@pytest.mark.parametrize("tolerances", [(-1.0, 0.0), (0.0, -1.0)])
+def test_validation_wrong(tolerances: tuple):
+    """Tolerances can not be negative"""
+    with pytest.raises(ValueError):
+        Validation(*tolerances)
+
+
+def test_check_file(tmp_path):
+    """Files read in blocks"""
+    validation = Validation()
+    assert check_file(_passive(tmp_path), validation, 7)
+    assert validation.points == 50
+    assert not check_file("./tests/data/golden.s3p", validation, 16, fmax=5e8)
+    assert validation.passivity[0].stop <= 5e8
+    with pytest.raises(ValueError):
+        check_file("./tests/data/golden.s3p", validation, 0)
+
+
+def test_main(tmp_path, capsys):
+    """CLI Tests, one report per file and exit status"""
+    passive = _passive(tmp_path)
+    main([passive])
+    assert capsys.readouterr().out.startswith("{}: passed\n".format(passive))
+
+    with pytest.raises(SystemExit):
+        main([passive, "./tests/data/golden.s3p", str(tmp_path / "none.s2p")])
+    captured = capsys.readouterr().out
+    assert "./tests/data/golden.s3p: failed\n" in captured
+    assert "  Passivity: violated at 118 of 201 points" in captured
+    assert "none.s2p: " in captured
+    assert "2 of 3 files failed" in captured
+
+    with pytest.raises(SystemExit):
+        main([passive, "--passivity-tolerance", "-1"])
+    assert "Wrong passivity tolerance" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("chunk", [None, 16])
+def test_s_cat_validation(tmp_path, chunk: int):
+    """The n port of s_cat is validated, loaded or streamed"""
+    validation = Validation()
+    s_cat(
+        INPUTFILES_S3P,
+        str(tmp_path / "out.s3p"),
+        None,
+        chunk=chunk,
+        validation=validation,
+    )
+    expected = Validation()
+    check_file("./tests/data/golden.s3p", expected)
+    assert validation.passivity == expected.passivity
+    assert validation.reciprocity == expected.reciprocity
+
+
+def test_s_cat_main_validate(tmp_path, capsys):
+    """CLI Tests, s_cat --validate"""
+    outputfile = str(tmp_path / "out.s3p")
+    s_cat_main(INPUTFILES_S3P + ["-o", outputfile, "--validate"])
+    captured = capsys.readouterr().out
+    assert "Passivity: violated at 118 of 201 points" in captured
+    assert "has been stored in {}".format(outputfile) in captured
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_s_cat_batch_validation(tmp_path, jobs: int):
+    """Every n port of a batch is validated on its own"""
+    batch = [
+        ManifestJob(INPUTFILES_S3P, str(tmp_path / "a.s3p"), None),
+        ManifestJob(INPUTFILES_S3P, str(tmp_path / "b.s3p"), None),
+    ]
+    validation = Validation()
+    results = s_cat_batch(batch, jobs=jobs, fmax=5e8, validation=validation)
+    assert validation.points == 0
+    expected = Validation()
+    check_file("./tests/data/golden.s3p", expected, fmax=5e8)
+    for result in results:
+        assert result.validation is not validation
+        assert result.validation.points == expected.points
+        assert result.validation.passivity == expected.passivity
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_s_cat_main_validate_manifest(tmp_path, capsys, jobs: int):
+    """CLI Tests, s_cat --validate of every concatenation of a manifest"""
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {"inputs": INPUTFILES_S3P, "output": str(tmp_path / "a.s3p")},
+                {"inputs": INPUTFILES_S3P, "output": str(tmp_path / "b.s3p")},
+            ]
+        )
+    )
+    s_cat_main(["--manifest", str(manifest), "--jobs", str(jobs), "--validate"])
+    captured = capsys.readouterr().out
+    assert captured.count("Passivity: violated at 118 of 201 points") == 2
+    assert "0 of 2 concatenations failed" in captured
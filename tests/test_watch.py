@@ -0,0 +1,178 @@
+import json
+import os
+import re
+import shutil
+
+import pytest
+import skrf as rf
+
+from stouchtool.watch import (
+    DEFAULT_PATTERN,
+    STATE_NAME,
+    Watcher,
+    main,
+    process_group,
+)
+
+__author__ = "Jesús Lázaro"
+__copyright__ = "Jesús Lázaro"
+__license__ = "MIT"
+
+# Two port files of the golden three port, by port pair
+PAIRS_S3P = {
+    "1_2": "./tests/data/evalboard_in_outp_outn_50ohm_5V_pinm20dBm.s2p",
+    "1_3": "./tests/data/evalboard_in_outn_outp_50ohm_5V_pinm20dBm.s2p",
+    "2_3": "./tests/data/evalboard_outp_outn_in_50ohm_5V_pinm20dBm.s2p",
+}
+
+
+def _capture(directory, group: str, pairs=PAIRS_S3P):
+    for pair, inputfile in pairs.items():
+        shutil.copy(
+            inputfile, os.path.join(directory, "{}_p{}.s2p".format(group, pair))
+        )
+
+
+def test_process_group(tmp_path):
+    """Concatenation and plot of a group, errors are caught"""
+    inputfiles = [str(tmp_path / "x.s2p")] + list(PAIRS_S3P.values())[1:]
+    result = process_group("dut", list(PAIRS_S3P.values()), 3, str(tmp_path))
+    assert result == (
+        "dut",
+        str(tmp_path / "dut.s3p"),
+        str(tmp_path / "dut.pdf"),
+        None,
+    )
+    assert rf.Network(result.nport) == rf.Network("./tests/data/golden.s3p")
+    result = process_group("bad", inputfiles, 3, str(tmp_path), None)
+    assert result.nport is None and "Error reading" in result.error
+
+
+def test_watcher(tmp_path):
+    """Complete groups are processed once their files settle"""
+    _capture(str(tmp_path), "dut1")
+    pairs = dict(PAIRS_S3P)
+    del pairs["2_3"]
+    _capture(str(tmp_path), "dut2", pairs)
+    watcher = Watcher(str(tmp_path), 3, settle=5.0)
+    # Just written, not settled yet
+    assert watcher.poll(now=1000.0) == ([], True)
+    finished, pending = watcher.poll(now=1006.0)
+    assert [result.group for result in finished] == ["dut1"]
+    assert not pending
+    assert os.path.exists(str(tmp_path / "dut1.pdf"))
+    assert watcher.poll(now=1007.0) == ([], False)
+
+    # The missing file completes the group
+    _capture(str(tmp_path), "dut2", {"2_3": PAIRS_S3P["2_3"]})
+    assert watcher.poll(now=1008.0) == ([], True)
+    finished, _ = watcher.poll(now=1014.0)
+    assert [result.group for result in finished] == ["dut2"]
+    with open(str(tmp_path / STATE_NAME), "r") as state:
+        assert sorted(json.load(state)) == ["dut1", "dut2"]
+
+
+def test_watcher_restart(tmp_path):
+    """Groups done are not processed again after a restart, unless changed"""
+    _capture(str(tmp_path), "dut")
+    old = os.stat(PAIRS_S3P["1_2"]).st_mtime_ns
+    for name in os.listdir(str(tmp_path)):
+        os.utime(str(tmp_path / name), ns=(old, old))
+    watcher = Watcher(str(tmp_path), 3, plot_format=None)
+    # Old files are already settled
+    assert [result.group for result in watcher.poll()[0]] == ["dut"]
+    assert not os.path.exists(str(tmp_path / "dut.pdf"))
+
+    watcher = Watcher(str(tmp_path), 3, plot_format=None)
+    assert watcher.poll() == ([], False)
+    os.utime(str(tmp_path / "dut_p1_3.s2p"), ns=(old, old + 10**9))
+    watcher = Watcher(str(tmp_path), 3, plot_format=None)
+    assert [result.group for result in watcher.poll()[0]] == ["dut"]
+
+
+def test_watcher_pairs(tmp_path):
+    """Reversed pairs are combined, a pair measured twice fails the group"""
+    _capture(str(tmp_path), "dut", {"1_3": PAIRS_S3P["1_3"], "2_3": PAIRS_S3P["2_3"]})
+    network = rf.Network(PAIRS_S3P["1_2"])
+    network.s = network.s[:, ::-1, ::-1]
+    network.write_touchstone(str(tmp_path / "dut_p2_1.s2p"))
+    watcher = Watcher(str(tmp_path), 3, settle=0, plot_format=None)
+    (result,), _ = watcher.poll()
+    assert rf.Network(result.nport) == rf.Network("./tests/data/golden.s3p")
+
+    _capture(str(tmp_path), "dut", {"1_2": PAIRS_S3P["1_2"]})
+    (result,), pending = watcher.poll()
+    assert result.nport is None
+    assert "both measure p1_2" in result.error
+    assert not pending
+    assert watcher.poll() == ([], False)
+    with open(str(tmp_path / STATE_NAME), "r") as state:
+        assert len(json.load(state)["dut"]["inputs"]) == 4
+
+
+def test_watcher_pattern(tmp_path):
+    """Without port groups, the files of a group are sorted by name"""
+    for index, inputfile in enumerate(PAIRS_S3P.values()):
+        shutil.copy(inputfile, str(tmp_path / "lot-{}.S2P".format(index)))
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    watcher = Watcher(
+        str(tmp_path),
+        3,
+        pattern=r"(?P<group>\w+)-\d\.S2P",
+        output_dir=str(output_dir),
+        settle=0,
+        plot_format="png",
+    )
+    (result,), _ = watcher.poll()
+    assert result.plot == str(output_dir / "lot.png")
+    assert rf.Network(result.nport) == rf.Network("./tests/data/golden.s3p")
+    assert os.path.exists(str(output_dir / STATE_NAME))
+
+    shutil.copy(PAIRS_S3P["1_2"], str(tmp_path / "lot-3.S2P"))
+    (result,), _ = watcher.poll()
+    assert result.error == "Group lot has 4 files, 3 expected"
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("dut_p1_2.s2p", ("dut", "1", "2")),
+        ("lot_3_P11_12.S2P", ("lot_3", "11", "12")),
+        ("dut_p112.s2p", None),
+        ("dut_p1_2.s3p", None),
+    ],
+)
+def test_default_pattern(name: str, expected: tuple):
+    """The ports of the default pattern are always separated"""
+    match = re.fullmatch(DEFAULT_PATTERN, name)
+    assert (match and match.group("group", "first", "second")) == expected
+
+
+@pytest.mark.parametrize(
+    "pattern, numports",
+    [("(?P<group>", 3), (r"\w+\.s2p", 3), (r"(?P<group>\w+)", 1)],
+)
+def test_watcher_wrong(tmp_path, pattern: str, numports: int):
+    """Wrong pattern or number of ports"""
+    with pytest.raises(ValueError):
+        Watcher(str(tmp_path), numports, pattern=pattern)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_main_once(tmp_path, capsys, jobs: int):
+    """CLI Tests, a failed group sets the exit status"""
+    _capture(str(tmp_path), "dut")
+    _capture(str(tmp_path), "bad")
+    with open(str(tmp_path / "bad_p1_2.s2p"), "w") as bad:
+        bad.write("1 a b c d e f g h\n")
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), "-p", "3", "--once", "--settle", "0", "-j", str(jobs)])
+    captured = capsys.readouterr().out
+    assert (
+        "The group dut has been stored in {}".format(tmp_path / "dut.s3p") in captured
+    )
+    assert "The group bad failed: Error reading" in captured
+
+    main([str(tmp_path), "-p", "3", "--once", "--settle", "0"])
+    assert "The group" not in capsys.readouterr().out